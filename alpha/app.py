@@ -5,11 +5,15 @@ import cfg4py
 import fire
 import omicron
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from omicron.core.triggers import FrameTrigger
+from omicron.core.types import FrameType
 from pyemit import emit
 from sanic import Sanic, response
 
 from alpha.config import get_config_dir
+from alpha.core import kernels
 from alpha.core.monitors import mm
+from alpha.core.secindex import secindex
 from alpha.plots import start_plot_scan
 import alpha.web as handlers
 
@@ -35,7 +39,16 @@ class Application(object):
         mm.init(self.scheduler)
         start_plot_scan(self.scheduler)
 
+        # 在启动阶段完成信号内核的编译（或者加载磁盘缓存），而不是在第一次扫描时
+        kernels.warmup()
+
+        # 证券搜索索引：启动时建立，此后每个交易日开盘前重建
+        await secindex.rebuild()
+        self.scheduler.add_job(secindex.rebuild, FrameTrigger(FrameType.DAY, "-6h"))
+
         app.add_route(handlers.plot_command_handler, '/plot/<cmd>', methods=['POST'])
+        app.add_route(handlers.get_plot_job, '/plot/job/<job_id>', methods=['GET'])
+        app.add_route(handlers.list_plot_jobs, '/plot/jobs', methods=['GET'])
         app.add_route(handlers.add_monitor, '/monitor/add', methods=['POST'])
         app.add_route(handlers.remove_monitor, '/monitor/remove', methods=['POST'])
         app.add_route(handlers.list_monitors, '/monitor/list', methods=['GET'])
@@ -43,6 +56,7 @@ class Application(object):
         app.add_route(handlers.get_stock_pool, '/stock_pool', methods=['GET'])
         app.add_route(handlers.fuzzy_match, '/common/fuzzy-match',
                       methods=['GET'])
+        app.add_route(handlers.get_metrics, '/metrics', methods=['GET'])
 
     async def jobs(self, request, cmd):
         if cmd == 'list':
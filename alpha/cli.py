@@ -72,17 +72,36 @@ def restart():
 async def scan(plot_name: str, **params):
     init()
     params['plot'] = plot_name
-    params['cmd'] = 'scan'
-    url = f"{cfg.alpha.urls.service}/plot"
+    params['background'] = True
+    url = f"{cfg.alpha.urls.service}/plot/scan"
     async with aiohttp.ClientSession() as client:
         try:
             async with client.post(url, json=params) as resp:
-                if resp.status != 200:
+                if resp.status not in (200, 202):
                     print(colored('failed to execute scan', 'red'))
-                else:
-                    results = await resp.json()
-                    for rec in results:
-                        print(rec)
+                    return
+                job_id = (await resp.json())["job_id"]
+
+            # 扫描在服务端后台执行，这里轮询进度直到结束
+            url = f"{cfg.alpha.urls.service}/plot/job/{job_id}"
+            while True:
+                async with client.get(url) as resp:
+                    job = await resp.json()
+
+                if job["status"] in ("done", "failed"):
+                    break
+
+                print(f"\rscanning: {job['done']}/{job['total']}, {job['hits']} hits",
+                      end="")
+                await asyncio.sleep(1)
+
+            print()
+            if job["status"] == "failed":
+                print(colored(f"failed to execute scan: {job['error']}", 'red'))
+                return
+
+            for rec in job["result"] or []:
+                print(rec)
         except Exception as e:
             print(e)
 
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+"""
+import datetime
+import fcntl
+import logging
+import os
+
+import arrow
+import cfg4py
+import numpy as np
+from omicron.core.timeframe import tf
+from omicron.core.types import Frame, FrameType
+from omicron.models.security import Security
+
+logger = logging.getLogger(__name__)
+cfg = cfg4py.get_instance()
+
+# 与omicron的bars_dtypes一致，只是frame以整数(YYYYMMDD或者YYYYMMDDHHmm)存储，以便于memmap
+storage_dtype = np.dtype([
+    ('frame', 'i8'),
+    ('open', 'f4'),
+    ('high', 'f4'),
+    ('low', 'f4'),
+    ('close', 'f4'),
+    ('volume', 'f8'),
+    ('amount', 'f8'),
+    ('factor', 'f4')
+])
+
+
+class BarCache:
+    """
+    本地的行情缓存。
+
+    已收盘的bar不会再变化，因此按(code, frame_type)将其以结构化数组的形式保存在本地文件中，
+    读取时通过memmap直接映射文件，按frame二分查找出所需的区间，只有该区间会被转换为bars。
+    每次只从omicron加载缓存尾部之后的新bar并追加到文件末尾。
+
+    缓存中保存的是未复权的数据，读取时再按区间内最后一个bar的复权因子做前复权，与
+    `Security.load_bars`的结果一致。
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root
+
+    def _path(self, code: str, frame_type: FrameType) -> str:
+        root = self.root or os.path.expanduser(cfg.alpha.bar_cache.path)
+        return os.path.join(root, frame_type.value, f"{code}.bin")
+
+    @staticmethod
+    def _to_int(frame: Frame, frame_type: FrameType) -> int:
+        if frame_type in tf.day_level_frames:
+            return tf.date2int(frame)
+        else:
+            return tf.time2int(frame)
+
+    @staticmethod
+    def _to_frame(iframe: int, frame_type: FrameType) -> Frame:
+        if frame_type in tf.day_level_frames:
+            return tf.int2date(iframe)
+        else:
+            return tf.int2time(iframe)
+
+    def read(self, code: str, frame_type: FrameType) -> np.ndarray:
+        """
+        返回code在frame_type上全部已缓存的bar（只读的memmap）。如果没有缓存，返回空数组
+        """
+        path = self._path(code, frame_type)
+        if not os.path.exists(path) or os.path.getsize(path) < storage_dtype.itemsize:
+            return np.empty((0,), dtype=storage_dtype)
+
+        n = os.path.getsize(path) // storage_dtype.itemsize
+        return np.memmap(path, dtype=storage_dtype, mode='r', shape=(n,))
+
+    def write(self, code: str, frame_type: FrameType, bars: np.ndarray,
+              overwrite=False):
+        """
+        将未复权的bars写入缓存。如果不是overwrite，则只追加比缓存尾部更新的bar。
+        """
+        path = self._path(code, frame_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        recs = self.to_storage(bars, frame_type)
+        if overwrite:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            recs.tofile(tmp)
+            os.replace(tmp, path)
+            return
+
+        with open(path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                cached = self.read(code, frame_type)
+                if len(cached):
+                    recs = recs[recs['frame'] > cached[-1]['frame']]
+                f.write(recs.tobytes())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _is_complete(self, sec: Security, cached: np.ndarray,
+                     frame_type: FrameType) -> bool:
+        """
+        缓存的头部是否已经是该证券上市后的第一个bar，即更早的数据并不存在
+        """
+        head = self._to_frame(int(cached[0]['frame']), frame_type)
+        if frame_type not in tf.day_level_frames:
+            head = head.date()
+
+        return tf.day_shift(sec.ipo_date, 1) >= head
+
+    @staticmethod
+    def _last_closed(end: Frame, frame_type: FrameType) -> Frame:
+        """
+        截止到end，最后一个已收盘的frame。
+
+        end晚于当前时间时（比如回测取到今天之后），按当前时间计算，否则正在进行中的bar会被当作
+        已收盘。日线及以上周期的bar在其最后一个交易日收盘（15:00）之后才完成，在此之前
+        `tf.floor`返回的是尚未收盘的当前frame，应取其前一个frame。end为日期时，视为当天结束。
+        """
+        if isinstance(end, datetime.datetime):
+            moment = arrow.get(end).to(cfg.tz).naive if end.tzinfo else end
+        else:
+            moment = datetime.datetime.combine(end, datetime.time(23, 59, 59))
+
+        now = arrow.now(cfg.tz)
+        if moment > now.naive:
+            end, moment = now.datetime, now.naive
+
+        floor = tf.floor(end, frame_type)
+        if frame_type not in tf.day_level_frames:
+            return floor
+
+        if moment < datetime.datetime.combine(floor, datetime.time(15)):
+            return tf.shift(floor, -1, frame_type)
+
+        return floor
+
+    def to_storage(self, bars: np.ndarray, frame_type: FrameType) -> np.ndarray:
+        recs = np.empty((len(bars),), dtype=storage_dtype)
+        recs['frame'] = [self._to_int(frame, frame_type) for frame in bars['frame']]
+        for name in storage_dtype.names[1:]:
+            recs[name] = bars[name]
+
+        return recs
+
+    def to_bars(self, recs: np.ndarray, frame_type: FrameType, fq=True) -> np.ndarray:
+        """
+        将缓存中的记录转换为与`Security.load_bars`相同格式的bars
+        """
+        dtype = [('frame', 'O')] + [(name, storage_dtype[name])
+                                    for name in storage_dtype.names[1:]]
+        bars = np.empty((len(recs),), dtype=dtype)
+        bars['frame'] = [self._to_frame(iframe, frame_type) for iframe in
+                         recs['frame']]
+        for name in storage_dtype.names[1:]:
+            bars[name] = recs[name]
+
+        if fq and len(bars):
+            adjust = bars['factor'] / bars[-1]['factor']
+            for name in ('open', 'high', 'low', 'close'):
+                bars[name] = bars[name] * adjust
+
+        return bars
+
+    async def load_bars(self, code: str, start: Frame, end: Frame,
+                        frame_type: FrameType, fq=True) -> np.ndarray:
+        """
+        与`Security.load_bars(start, end, frame_type)`等价，但已收盘的bar优先从本地缓存读取。
+        """
+        closed = self._last_closed(end, frame_type)
+        istart = self._to_int(tf.floor(start, frame_type), frame_type)
+        iend = self._to_int(closed, frame_type)
+
+        cached = self.read(code, frame_type)
+        sec = Security(code)
+        if len(cached) == 0 or (cached[0]['frame'] > istart and
+                                not self._is_complete(sec, cached, frame_type)):
+            bars = await sec.load_bars(start, closed, frame_type, fq=False)
+            self.write(code, frame_type, bars, overwrite=True)
+            cached = self.read(code, frame_type)
+        elif cached[-1]['frame'] < iend:
+            tail = self._to_frame(int(cached[-1]['frame']), frame_type)
+            bars = await sec.load_bars(tf.shift(tail, 1, frame_type), closed, frame_type,
+                                       fq=False)
+            self.write(code, frame_type, bars)
+            cached = self.read(code, frame_type)
+
+        i = np.searchsorted(cached['frame'], istart, side='left')
+        j = np.searchsorted(cached['frame'], iend, side='right')
+        recs = cached[i:j]
+
+        # 未收盘的bar不进入缓存
+        if arrow.get(end) > arrow.get(closed):
+            bars = await sec.load_bars(closed, end, frame_type, fq=False)
+            unclosed = self.to_storage(bars[-1:], frame_type)
+            if len(unclosed) and (len(recs) == 0 or
+                                  unclosed[0]['frame'] > recs[-1]['frame']):
+                recs = np.append(recs, unclosed)
+
+        return self.to_bars(recs, frame_type, fq)
+
+
+bar_cache = BarCache()
+
+
+async def load_bars(code: str, start: Frame, end: Frame, frame_type: FrameType,
+                    fq=True) -> np.ndarray:
+    """
+    如果启用了本地缓存，则通过缓存加载，否则直接调用`Security.load_bars`
+    """
+    if cfg.alpha.bar_cache.enabled:
+        return await bar_cache.load_bars(code, start, end, frame_type, fq)
+
+    return await Security(code).load_bars(start, end, frame_type, fq=fq)
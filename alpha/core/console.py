@@ -25,7 +25,6 @@ import pandas as pd
 from IPython.display import Audio, display, clear_output
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from omicron.core.timeframe import tf
-from omicron.core.types import FrameType
 from omicron.dal import cache
 from omicron.models.security import Security
 from pandas import DataFrame
@@ -147,30 +146,20 @@ async def on_enter_pool(msg: dict):
 
 async def list_momentum_pool(day_offset: int = 1, sort_by='y'):
     start = tf.day_shift(arrow.now().date(), -day_offset)
-    key = f"plots.momentum.pool"
-    recs = await cache.sys.hgetall(key)
-    data = []
-    for k, v in recs.items():
-        frame, code = k.split(":")
-        if arrow.get(frame) < arrow.get(start):
-            continue
-
-        sec = Security(code)
-        v = json.loads(v)
+    mom = create_plot('momentum')
 
-        frame_type = FrameType(v.get("frame_type"))
-        fired = tf.int2time(frame) if frame_type in tf.minute_level_frames else \
-            tf.int2date(frame)
+    data = []
+    for row in await _read_pool_index(mom, start):
         data.append({
-            "name":  sec.display_name,
-            "code":  code,
-            "fired": fired,
-            "frame": frame_type.value,
-            "y":     round(v.get("y"), 2),
-            "vx":    round(v.get("vx"), 1),
-            "a":     round(v.get("a"), 4),
-            "b":     round(v.get("b"), 4),
-            "err":   round(v.get("err"), 4)
+            "name":  row["name"],
+            "code":  row["code"],
+            "fired": row["frame"],
+            "frame": row.get("frame_type"),
+            "y":     round(row.get("y"), 2),
+            "vx":    round(row.get("vx"), 1),
+            "a":     round(row.get("a"), 4),
+            "b":     round(row.get("b"), 4),
+            "err":   round(row.get("err"), 4)
         })
 
     if len(data) == 0:
@@ -271,6 +260,52 @@ async def remove_monitor(job_name=None, code=None, plot=None, frame=None, flag=N
         pprint.pprint(resp)
 
 
+async def _read_pool_index(plot, start: datetime.date) -> list:
+    data = []
+    for frame_type in tf.day_level_frames + tf.minute_level_frames:
+        if frame_type in tf.minute_level_frames:
+            istart, convert = tf.date2int(start) * 10000, tf.int2time
+        else:
+            istart, convert = tf.date2int(start), tf.int2date
+
+        for frame, code, v in await plot.query_pool(frame_type, istart):
+            sec = Security(code)
+            row = {
+                "name":  sec.display_name,
+                "code":  code,
+                "frame": convert(frame)
+            }
+            row.update(v)
+            data.append(row)
+
+    return data
+
+
+async def _read_pool_hash(key: str, start: datetime.date) -> list:
+    recs = await cache.sys.hgetall(key)
+    data = []
+    for k, v in recs.items():
+        _frame, code = k.split(":")
+        if len(_frame) == 8:
+            frame = tf.int2date(int(_frame))
+        else:
+            frame = tf.int2time(int(_frame))
+
+        if arrow.get(frame) < arrow.get(start):
+            continue
+
+        sec = Security(code)
+        row = {
+            "name":  sec.display_name,
+            "code":  code,
+            "frame": frame
+        }
+        row.update(json.loads(v))
+        data.append(row)
+
+    return data
+
+
 async def list_stock_pool(plot=None, time_offset: int = 3):
     now = arrow.now().date()
     start = tf.day_shift(now, -time_offset)
@@ -281,26 +316,12 @@ async def list_stock_pool(plot=None, time_offset: int = 3):
 
     results = []
     for key in keys:
-        recs = await cache.sys.hgetall(key)
-        data = []
-        for k, v in recs.items():
-            _frame, code = k.split(":")
-            if len(_frame) == 8:
-                frame = tf.int2date(int(_frame))
-            else:
-                frame = tf.int2time(int(_frame))
-
-            if arrow.get(frame) < arrow.get(start):
-                continue
-
-            sec = Security(code)
-            row = {
-                "name":  sec.display_name,
-                "code":  code,
-                "frame": frame
-            }
-            row.update(json.loads(v))
-            data.append(row)
+        _plot = create_plot(key.split(".")[1])
+        if _plot is None:
+            # 未注册的plot没有时间索引可用，直接读取其股票池hash
+            data = await _read_pool_hash(key, start)
+        else:
+            data = await _read_pool_index(_plot, start)
 
         print(f"----------{key.lower()}----------")
         df = DataFrame(data=data)
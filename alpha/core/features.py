@@ -6,20 +6,34 @@ Author: Aaron-Yang [code@jieyu.ai]
 Contributors: 
 
 """
+import datetime
 import logging
-from typing import List
+from typing import List, Tuple
 
 import arrow
 import matplotlib.pyplot as plt
 import numpy as np
 from omicron.core.timeframe import tf
 from omicron.core.types import FrameType, Frame
+from omicron.models.securities import Securities
 from omicron.models.security import Security
 
 from alpha.core import signal
 
 logger = logging.getLogger(__name__)
 
+# 创业板注册制改革后，创业板涨跌幅限制由10%改为20%
+CHINEXT_REFORM_DAY = datetime.date(2020, 8, 24)
+
+# 创业板的代码前缀。注册制改革后新上市的股票代码为301xxx
+CHINEXT_PREFIXES = ('300', '301')
+
+# 涨跌幅分布的区间
+PRICE_CHANGE_BINS = [-0.2, -0.1, -0.07, -0.03, 0, 0.03, 0.07, 0.1, 0.2]
+
+# 最近一次计算的涨跌幅限制表：(day, codes, limits)
+_limit_table = (None, [], np.array([]))
+
 
 def count_buy_limit_event(sec: Security, bars: np.array):
     if sec.code.startswith('688'):
@@ -36,6 +50,138 @@ def count_buy_limit_event(sec: Security, bars: np.array):
         return 0, None
 
 
+def limit_table(day: datetime.date) -> Tuple[List[str], np.array]:
+    """
+    返回全部股票（含ST及科创板）及其对应的涨跌幅限制。688板块及改革后的创业板（300、301）为20%，
+    ST为5%，其它为10%。
+
+    股票列表一天之内不会变化，因此每个交易日只计算一次。
+    """
+    global _limit_table
+
+    if _limit_table[0] == day:
+        return _limit_table[1], _limit_table[2]
+
+    secs = Securities()
+    codes = secs.choose(['stock'], exclude_st=False, exclude_688=False)
+    non_st = set(secs.choose(['stock'], exclude_st=True, exclude_688=False))
+
+    limits = np.full(len(codes), 0.1)
+    for i, code in enumerate(codes):
+        if code.startswith('688') or (code[:3] in CHINEXT_PREFIXES and
+                                      day >= CHINEXT_REFORM_DAY):
+            limits[i] = 0.2
+        elif code not in non_st:
+            limits[i] = 0.05
+
+    _limit_table = (day, codes, limits)
+    return codes, limits
+
+
+def price_change_distribution(c1: np.array, c0: np.array, limits: np.array):
+    """
+    计算涨停、跌停家数以及涨跌幅分布。
+
+    c1, c0和limits为按同一股票顺序排列的昨收、现价及涨跌幅限制，其中c1或c0为nan的股票不计入。
+    Returns:
+        zt, dt, cuts
+    """
+    valid = np.isfinite(c1) & np.isfinite(c0) & (c1 > 0)
+    c1, c0, limits = c1[valid], c0[valid], limits[valid]
+
+    zt = np.count_nonzero((c0 + 0.01) / c1 - 1 > limits)
+    dt = np.count_nonzero((c0 - 0.01) / c1 - 1 < -limits)
+    cuts = np.histogram(c0 / c1 - 1, bins=PRICE_CHANGE_BINS)
+
+    return zt, dt, cuts
+
+
+def event_index(codes: List[str], frames: np.array,
+                events: List[Tuple[str, int]]) -> np.array:
+    """
+    将(code, frame)形式的信号事件转换为其在行情矩阵中的(行, 列)位置。
+
+    Args:
+        codes: 行情矩阵各行对应的证券
+        frames: 行情矩阵各列对应的frame（整数形式，升序）
+        events: 信号事件，frame为整数形式
+
+    Returns:
+        (len(events), 2)的整数数组。frame不在frames中时，列为-1
+    """
+    rows = {code: i for i, code in enumerate(codes)}
+    index = np.empty((len(events), 2), dtype=int)
+    if len(events) == 0:
+        return index
+
+    index[:, 0] = [rows[code] for code, _ in events]
+
+    iframes = np.array([frame for _, frame in events])
+    cols = np.searchsorted(frames, iframes)
+    found = cols < len(frames)
+    found[found] = frames[cols[found]] == iframes[found]
+    index[:, 1] = np.where(found, cols, -1)
+
+    return index
+
+
+def forward_returns(close: np.array, events: np.array, horizon: int,
+                    high: np.array = None, low: np.array = None):
+    """
+    批量计算信号事件发出后horizon个周期的收益率、最大涨幅及最大回撤。
+
+    close, high, low为(证券数, frame数)的行情矩阵，停牌或者缺失的bar为nan。events为
+    `event_index`返回的(行, 列)位置。最大涨幅、最大回撤分别以信号发出后(不含当期)horizon个
+    周期内的最高价、最低价计算，未提供high/low时使用收盘价。
+
+    信号发出时停牌、或者信号发出后不足horizon个周期的事件，其结果均为nan。
+
+    Returns:
+        ret, max_gain, max_drawdown，均为长度为len(events)的数组
+    """
+    high = close if high is None else high
+    low = close if low is None else low
+
+    rows, cols = events[:, 0], events[:, 1]
+    n = close.shape[1]
+    valid = (cols >= 0) & (cols + horizon < n)
+    rows, cols = rows[valid], cols[valid]
+
+    ret = np.full(len(events), np.nan)
+    max_gain = np.full(len(events), np.nan)
+    max_drawdown = np.full(len(events), np.nan)
+
+    c0 = close[rows, cols]
+    ret[valid] = close[rows, cols + horizon] / c0 - 1
+
+    # 每个事件之后的horizon个位置，(k, horizon)
+    window = cols[:, None] + np.arange(1, horizon + 1)
+    # 窗口内停牌的bar为nan，fmax/fmin会忽略它们
+    max_gain[valid] = np.fmax.reduce(high[rows[:, None], window], axis=1) / c0 - 1
+    max_drawdown[valid] = np.fmin.reduce(low[rows[:, None], window], axis=1) / c0 - 1
+
+    return ret, max_gain, max_drawdown
+
+
+async def market_price_change(end: Frame):
+    """
+    全市场的涨停、跌停家数及涨跌幅分布
+    """
+    codes, limits = limit_table(arrow.get(end).date())
+    index = {code: i for i, code in enumerate(codes)}
+
+    c1 = np.full(len(codes), np.nan)
+    c0 = np.full(len(codes), np.nan)
+    async for code, bars in Security.load_bars_batch(codes, end, 2, FrameType.DAY):
+        if len(bars) < 2:
+            continue
+
+        i = index[code]
+        c1[i], c0[i] = bars[-2:]['close']
+
+    return price_change_distribution(c1, c0, limits)
+
+
 async def summary(code: str, end: Frame, frame: FrameType = FrameType.DAY,
                   win: int = 7):
     sec = Security(code)
@@ -43,10 +189,8 @@ async def summary(code: str, end: Frame, frame: FrameType = FrameType.DAY,
     bars = await sec.load_bars(start, end, frame)
     end_dt = bars['date'].iat[-1]
 
-    ma5 = np.array(signal.moving_average(bars['close'], 5))
-    ma10 = np.array(signal.moving_average(bars['close'], 10))
-    ma20 = np.array(signal.moving_average(bars['close'], 20))
-    ma60 = np.array(signal.moving_average(bars['close'], 60))
+    mas = signal.moving_averages(bars['close'], [5, 10, 20, 60])
+    ma5, ma10, ma20, ma60 = mas[5], mas[10], mas[20], mas[60]
 
     _ma5, _ma10, _ma20 = ma5[-win:], ma10[-win:], ma20[-win:]
 
@@ -61,8 +205,7 @@ async def summary(code: str, end: Frame, frame: FrameType = FrameType.DAY,
     plt.plot(vx, vy * 0.995, "^", color=color)  # 5日低点
 
     plt.plot(ma5[-xlen:], color=color, linewidth=lw)  # 均线
-    p5 = np.poly1d(coef5)
-    y5 = [p5(i) for i in range(win + 1)]
+    y5 = signal.polyval(coef5, np.arange(win + 1))
 
     c0 = bars['close'].iat[-1]
     pred_c = y5[-1] * 5 - bars['close'][-4:].sum()
@@ -73,16 +216,14 @@ async def summary(code: str, end: Frame, frame: FrameType = FrameType.DAY,
     # 10日均线及回归线
     color = '#00ff80'
     err10, coef10, vertex10 = signal.polyfit(_ma10)
-    p10 = np.poly1d(coef10)
-    y10 = [p10(i) for i in range(win + 1)]
+    y10 = signal.polyval(coef10, np.arange(win + 1))
     plt.plot(ma10[-xlen:], color=color, linewidth=lw)
     plt.plot(ax_x, y10, 'o', color=color, mew=0.25, ms=2.5)
 
     # 20日均线及回归线
     color = '#00ffff'
     err20, coef20, vertex20 = signal.polyfit(_ma20)
-    p20 = np.poly1d(coef20)
-    y20 = [p20(i) for i in range(win + 1)]
+    y20 = signal.polyval(coef20, np.arange(win + 1))
     plt.plot(ma20[-xlen:], color=color, linewidth=lw)
     plt.plot(ax_x, y20, 'o', color=color, mew=0.25, ms=2.5)
 
@@ -138,8 +279,7 @@ async def plot_ma(code: str, groups=None, end: Frame = None,
     start = tf.shift(end, -(groups[-1] + 19), frame_type)
     bars = await sec.load_bars(start, end, frame_type)
 
-    for win in groups:
-        ma = signal.moving_average(bars['close'], win)
+    for win, ma in signal.moving_averages(bars['close'], groups).items():
         plt.plot(ma[-20:])
 
 
@@ -196,14 +336,13 @@ def ma_lines_trend(bars:np.array, ma_wins:List[int]):
 
     """
     features = {}
+    mas = signal.moving_averages(bars['close'], ma_wins)
     for win in ma_wins:
-        ma = signal.moving_average(bars['close'], win)
+        ma = mas[win]
         fit_win = 7 if win == 5 else 10
         err, (a, b, c), (vx, _) = signal.polyfit(ma[-fit_win:] / ma[-fit_win])
-        p = np.poly1d((a,b,c))
-
         # 预测一周后均线涨幅
-        war = p(fit_win + 5 - 1)/p(fit_win-1) - 1
+        war = signal.poly_advance((a, b, c), fit_win - 1, fit_win + 5 - 1)
 
         features[f"ma{win}"] = [ma, (err, a, b, vx, fit_win, war)]
 
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+"""
+import functools
+import logging
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=16)
+def _gram_inv(fit_win: int):
+    """
+    x坐标为(0, 1, ..., fit_win - 1)时，二次拟合法方程中(X^T X)的逆矩阵。
+    """
+    vander = np.vander(np.arange(fit_win), 3).astype(np.float64)
+    inv = np.linalg.inv(vander.T @ vander)
+    inv.flags.writeable = False
+    return inv
+
+
+class IndicatorState:
+    """
+    单个证券在某一周期上的均线及均线二次拟合的增量计算状态。
+
+    状态中保存最近win个收盘价的滚动和，以及最近fit_win个均线值的拟合累加量(sum(x^2 * y),
+    sum(x * y), sum(y), sum(y^2))。每来一个新的bar，只需要O(1)的计算即可更新均线及拟合结果，
+    而不必重新加载win + fit_win个bar并从头计算。
+
+    同一个frame可以多次更新（比如盘中未收盘的bar），此时替换最后一个收盘价，而不是追加。
+    """
+
+    # 每隔若干次更新，从原始数据重新计算一次累加量，以消除浮点误差的积累
+    resync_every = 240
+
+    def __init__(self, win: int, fit_win: int = 7):
+        self.win = win
+        self.fit_win = fit_win
+
+        self.frame = None
+        self.closes = deque(maxlen=win)
+        self.mas = deque(maxlen=fit_win)
+
+        self._sum = 0.0
+        self._sums = np.zeros(3)  # sum(x^2 * y), sum(x * y), sum(y)
+        self._sq = 0.0  # sum(y^2)
+        self._updates = 0
+
+    @property
+    def ready(self) -> bool:
+        return len(self.mas) == self.fit_win
+
+    @property
+    def close(self) -> float:
+        return self.closes[-1]
+
+    @property
+    def ma(self) -> float:
+        return self.mas[-1]
+
+    def reset(self, bars: np.array):
+        """
+        用bars重新初始化状态
+        """
+        self.frame = None
+        self.closes.clear()
+        self.mas.clear()
+        self._sum = 0.0
+        self._sums[:] = 0
+        self._sq = 0.0
+        self._updates = 0
+
+        for bar in bars:
+            self.update(bar['frame'], bar['close'])
+
+    def update(self, frame, close: float):
+        if self.frame is not None and frame == self.frame:
+            self._replace(close)
+        else:
+            self._push(close)
+            self.frame = frame
+
+        self._updates += 1
+        if self._updates % self.resync_every == 0:
+            self._resync()
+
+    def fit(self):
+        """
+        返回与`signal.polyfit(mas / mas[0])`一致的error, coef, vertex
+        """
+        if not self.ready:
+            raise ValueError(f"need {self.fit_win} ma values, got {len(self.mas)}")
+
+        coef = _gram_inv(self.fit_win) @ self._sums
+        rss = max(self._sq - coef @ self._sums, 0)
+        error = np.sqrt(rss / self._sq)
+
+        a, b, c = coef / self.mas[0]
+        axis_x = -b / (2 * a)
+        axis_y = (4 * a * c - b * b) / (4 * a)
+
+        return error, (a, b, c), (axis_x, axis_y)
+
+    def _push(self, close: float):
+        if len(self.closes) == self.win:
+            self._sum -= self.closes[0]
+
+        self.closes.append(close)
+        self._sum += close
+
+        if len(self.closes) == self.win:
+            self._push_ma(self._sum / self.win)
+
+    def _replace(self, close: float):
+        self._sum += close - self.closes[-1]
+        self.closes[-1] = close
+
+        if len(self.closes) == self.win:
+            self._replace_ma(self._sum / self.win)
+
+    def _push_ma(self, y: float):
+        if len(self.mas) == self.fit_win:
+            # 移出x=0处的值，再将剩余各项的x坐标减1
+            y0 = self.mas[0]
+            self._sums[2] -= y0
+            self._sq -= y0 * y0
+
+            t2, t1, t0 = self._sums
+            self._sums[0] = t2 - 2 * t1 + t0
+            self._sums[1] = t1 - t0
+            x = self.fit_win - 1
+        else:
+            x = len(self.mas)
+
+        self.mas.append(y)
+        self._sums += (x * x * y, x * y, y)
+        self._sq += y * y
+
+    def _replace_ma(self, y: float):
+        x = len(self.mas) - 1
+        y0 = self.mas[-1]
+        self.mas[-1] = y
+
+        d = y - y0
+        self._sums += (x * x * d, x * d, d)
+        self._sq += y * y - y0 * y0
+
+    def _resync(self):
+        self._sum = float(np.sum(self.closes))
+
+        y = np.array(self.mas, dtype=np.float64)
+        x = np.arange(len(y))
+        self._sums[:] = (np.sum(x * x * y), np.sum(x * y), np.sum(y))
+        self._sq = float(np.sum(y * y))
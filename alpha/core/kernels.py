@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+`alpha.core.signal`中内层循环的计算内核。
+
+如果安装了numba，内核由numba编译（nopython模式），否则使用等价的numpy实现。选择在导入时
+完成，此时配置尚未加载，因此通过环境变量控制：
+
+    ALPHA_NUMBA=0        不使用numba
+    ALPHA_NUMBA_CACHE=0  不将编译结果缓存到磁盘。缓存默认开启，位于本模块的__pycache__下，
+                         可通过numba自身的NUMBA_CACHE_DIR指定其它目录
+
+启用磁盘缓存后，只有第一次运行需要编译；服务启动时调用`warmup`，将编译（或者加载缓存）的开销
+放在启动阶段，而不是当天的第一次扫描中。
+"""
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    if os.environ.get("ALPHA_NUMBA", "1") == "0":
+        raise ImportError("numba disabled by ALPHA_NUMBA")
+
+    import numba
+
+    USE_NUMBA = True
+except ImportError:
+    USE_NUMBA = False
+
+CACHE = os.environ.get("ALPHA_NUMBA_CACHE", "1") != "0"
+
+
+def _jit(func):
+    return numba.njit(cache=CACHE)(func)
+
+
+# ---------------------------- numba ----------------------------
+def _rmse_loop(y, y_hat):
+    total = 0.
+    for i in range(len(y)):
+        total += (y[i] - y_hat[i]) ** 2
+
+    return np.sqrt(total / len(y))
+
+
+def _poly_error_loop(ts, coef):
+    # Horner法求拟合值，同时累加残差平方和及原序列平方和
+    ssr = 0.
+    sst = 0.
+    for i in range(len(ts)):
+        y_hat = 0.
+        for c in coef:
+            y_hat = y_hat * i + c
+        ssr += (ts[i] - y_hat) ** 2
+        sst += ts[i] ** 2
+
+    return np.sqrt(ssr / sst)
+
+
+def _exp_error_loop(ts, a, b):
+    ssr = 0.
+    sst = 0.
+    for i in range(len(ts)):
+        ssr += (ts[i] - np.exp(a * i + b)) ** 2
+        sst += ts[i] ** 2
+
+    return np.sqrt(ssr / sst)
+
+
+def _find_runs_loop(x):
+    n = len(x)
+    starts = np.empty(n, dtype=np.int64)
+    m = 0
+    for i in range(n):
+        if i == 0 or x[i] != x[i - 1]:
+            starts[m] = i
+            m += 1
+
+    starts = starts[:m]
+    lengths = np.empty(m, dtype=np.int64)
+    for j in range(m - 1):
+        lengths[j] = starts[j + 1] - starts[j]
+    if m > 0:
+        lengths[m - 1] = n - starts[m - 1]
+
+    return x[starts], starts, lengths
+
+
+def _merge_extrema_loop(indices, values, lower):
+    merged = np.empty(len(indices), dtype=np.int64)
+    m = 0
+    last = 0.
+    for k in range(len(indices)):
+        if m > 0 and indices[k] - merged[m - 1] <= 2:
+            if (lower and values[k] < last) or (not lower and values[k] > last):
+                merged[m - 1] = indices[k]
+                last = values[k]
+        else:
+            merged[m] = indices[k]
+            last = values[k]
+            m += 1
+
+    return merged[:m]
+
+
+# ---------------------------- numpy ----------------------------
+def _rmse_numpy(y, y_hat):
+    return np.sqrt(np.mean(np.square(y - y_hat)))
+
+
+def _poly_error_numpy(ts, coef):
+    ts_hat = np.polyval(coef, np.arange(len(ts)))
+    return np.sqrt(np.sum(np.square(ts - ts_hat)) / np.sum(np.square(ts)))
+
+
+def _exp_error_numpy(ts, a, b):
+    ts_hat = np.exp(a * np.arange(len(ts)) + b)
+    return np.sqrt(np.sum(np.square(ts - ts_hat)) / np.sum(np.square(ts)))
+
+
+def _find_runs_numpy(x):
+    n = x.shape[0]
+
+    # find run starts
+    loc_run_start = np.empty(n, dtype=bool)
+    loc_run_start[0] = True
+    np.not_equal(x[:-1], x[1:], out=loc_run_start[1:])
+    run_starts = np.nonzero(loc_run_start)[0]
+
+    # find run values
+    run_values = x[loc_run_start]
+
+    # find run lengths
+    run_lengths = np.diff(np.append(run_starts, n))
+
+    return run_values, run_starts, run_lengths
+
+
+def _merge_extrema_numpy(indices, values, lower):
+    merged = []
+    last = None
+    for index, value in zip(indices, values):
+        if len(merged) and index - merged[-1] <= 2:
+            if (value < last) if lower else (value > last):
+                merged[-1] = index
+                last = value
+        else:
+            merged.append(index)
+            last = value
+
+    return np.array(merged, dtype=np.int64)
+
+
+if USE_NUMBA:
+    _rmse = _jit(_rmse_loop)
+    _poly_error = _jit(_poly_error_loop)
+    _exp_error = _jit(_exp_error_loop)
+    _find_runs = _jit(_find_runs_loop)
+    _merge_extrema = _jit(_merge_extrema_loop)
+else:
+    _rmse = _rmse_numpy
+    _poly_error = _poly_error_numpy
+    _exp_error = _exp_error_numpy
+    _find_runs = _find_runs_numpy
+    _merge_extrema = _merge_extrema_numpy
+
+
+def _as_float(arr) -> np.array:
+    return np.ascontiguousarray(arr, dtype=np.float64)
+
+
+def rmse(y, y_hat) -> float:
+    return float(_rmse(_as_float(y), _as_float(y_hat)))
+
+
+def poly_error(ts, coef) -> float:
+    """
+    多项式coef（高次项在前）对ts的拟合误差，即均方根残差除以ts的均方根
+    """
+    return float(_poly_error(_as_float(ts), _as_float(coef)))
+
+
+def exp_error(ts, a: float, b: float) -> float:
+    """
+    指数曲线exp(a * x + b)对ts的拟合误差，定义同`poly_error`
+    """
+    return float(_exp_error(_as_float(ts), float(a), float(b)))
+
+
+def find_runs(x):
+    """
+    返回x中连续相同的值，及每段的起始位置和长度
+    """
+    x = np.ascontiguousarray(x)
+    # numba不支持object数组
+    if x.dtype == object:
+        return _find_runs_numpy(x)
+
+    return _find_runs(x)
+
+
+def merge_extrema(indices, values, lower: bool) -> np.array:
+    """
+    相邻（间隔不超过2）的极值点合并为一个，保留其中更低（lower为真）或者更高的点
+    """
+    return _merge_extrema(np.ascontiguousarray(indices, dtype=np.int64),
+                          _as_float(values), bool(lower))
+
+
+def warmup():
+    """
+    以小规模的输入调用各内核，触发numba编译或者加载磁盘缓存
+    """
+    ts = np.arange(1., 11.)
+    rmse(ts, ts)
+    poly_error(ts, (0., 1., 1.))
+    exp_error(ts, 0.1, 0.)
+    find_runs(np.array([1, 1, 2]))
+    find_runs(np.array([True, False]))
+    merge_extrema(np.array([1, 2, 5]), ts[:3], True)
+
+    logger.info("signal kernels ready, numba: %s, cache: %s", USE_NUMBA, CACHE)
@@ -10,15 +10,13 @@ import json
 import logging
 
 import arrow
+from alpha.core import features
 from alpha.core.enums import Events
 from omicron.core.timeframe import tf
 from omicron.core.triggers import FrameTrigger
 from omicron.core.types import FrameType
 from omicron.dal import cache
-from omicron.models.securities import Securities
 import cfg4py
-import numpy as np
-from omicron.models.security import Security
 from pyemit import emit
 
 cfg = cfg4py.get_instance()
@@ -37,23 +35,9 @@ class MarketGlance:
         emit.register(Events.sig_trade, self.on_plot_report)
 
     async def distribution(self):
-        # 涨停、跌停
-        zt, dt = 0, 0
-        codes = Securities().choose(['stock'])
+        # 涨停、跌停及涨跌幅分布
         end = arrow.now(cfg.tz).floor('minute').datetime
-        pct = []
-        async for code, bars in Security.load_bars_batch(codes, end, 2, FrameType.DAY):
-            c1, c0 = bars[-2:]['close']
-            if (c0 + 0.01) / c1 - 1 > 0.1:
-                zt += 1
-            if (c0 - 0.01) / c1 - 1 < -0.1:
-                dt += 1
-
-            pct.append(c0 / c1 - 1)
-
-        # 分布
-        cuts = np.histogram(pct, bins=[-0.2, -0.1, -0.07, -0.03, 0, 0.03,
-                                       0.07, 0.1, 0.2])
+        zt, dt, cuts = await features.market_price_change(end)
 
         self.price_change_history.append((zt, dt, cuts))
         if len(self.price_change_history) == 8:
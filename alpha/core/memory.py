@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Tuple
+
+from omicron.dal import cache
+
+logger = logging.getLogger(__name__)
+
+
+class SignalMemory:
+    """
+    plot对每个(code, frame_type)的记忆，比如上一次发出的信号方向。
+
+    记忆按LRU方式保存至多max_size项，超过ttl秒未更新的项被视为过期。发生变化的项先标记为
+    dirty，由`flush`一次性写入redis（hash: `plots.{name}.memory`），进程重启后通过`restore`
+    恢复，从而避免重启后再次发出已经发出过的信号。
+    """
+
+    def __init__(self, name: str, max_size: int = 20000, ttl: int = 5 * 24 * 3600):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # (code, frame_type) -> (last update time, {key: value})
+        self._items = OrderedDict()
+        self._dirty = set()
+        self._evicted = set()
+
+    @property
+    def redis_key(self):
+        return f"plots.{self.name}.memory"
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, item: Tuple[str, str], key: str) -> Any:
+        entry = self._items.get(item)
+        if entry is None:
+            return None
+
+        ts, data = entry
+        if time.time() - ts > self.ttl:
+            self._discard(item)
+            return None
+
+        self._items.move_to_end(item)
+        return data.get(key)
+
+    def set(self, item: Tuple[str, str], key: str, value: Any):
+        ts, data = self._items.get(item, (None, {}))
+        if ts is not None and data.get(key) == value and \
+                time.time() - ts <= self.ttl / 2:
+            # 值未变化，且离过期还早，不必写库
+            self._items.move_to_end(item)
+            return
+
+        data[key] = value
+        self._items[item] = (time.time(), data)
+        self._items.move_to_end(item)
+        self._dirty.add(item)
+        self._evicted.discard(item)
+
+        while len(self._items) > self.max_size:
+            self._discard(next(iter(self._items)))
+
+    def _discard(self, item: Tuple[str, str]):
+        del self._items[item]
+        self._dirty.discard(item)
+        self._evicted.add(item)
+
+    async def flush(self):
+        """
+        将变化的项及已淘汰的项一次性同步到redis。写入失败时，这些变化保留到下一次flush重试
+        """
+        if len(self._dirty) == 0 and len(self._evicted) == 0:
+            return
+
+        # 等待写入期间发生的变化记入新的集合，由下一次flush处理
+        dirty, self._dirty = self._dirty, set()
+        evicted, self._evicted = self._evicted, set()
+
+        tr = cache.sys.multi_exec()
+        if len(dirty):
+            tr.hmset_dict(self.redis_key, {
+                ":".join(item): json.dumps(self._items[item]) for item in dirty
+            })
+        if len(evicted):
+            tr.hdel(self.redis_key, *[":".join(item) for item in evicted])
+
+        try:
+            await tr.execute()
+        except Exception:
+            # 期间又被淘汰或者重新写入的项，以其最新状态为准
+            self._dirty |= {item for item in dirty if item in self._items}
+            self._evicted |= {item for item in evicted if item not in self._items}
+            raise
+
+    async def restore(self):
+        """
+        从redis中恢复未过期的项
+        """
+        recs = await cache.sys.hgetall(self.redis_key)
+
+        now = time.time()
+        expired = []
+        entries = []
+        for field, value in recs.items():
+            code, frame_type = field.rsplit(":", 1)
+            ts, data = json.loads(value)
+            if now - ts > self.ttl:
+                expired.append(field)
+            else:
+                entries.append((ts, (code, frame_type), data))
+
+        # 按更新时间排序，保持LRU顺序。超出max_size的最旧的项在下次flush时删除
+        entries = sorted(entries, key=lambda entry: entry[0])
+        for ts, item, data in entries[-self.max_size:]:
+            self._items[item] = (ts, data)
+        for _, item, _ in entries[:-self.max_size]:
+            self._evicted.add(item)
+
+        if len(expired):
+            await cache.sys.hdel(self.redis_key, *expired)
+
+        logger.info("%s memory restored: %s items, %s expired", self.name,
+                    len(self._items), len(expired))
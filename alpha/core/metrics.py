@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+扫描及监控热路径上的计时器与计数器，以Prometheus文本格式通过`/metrics`导出。
+
+计时器按summary导出（`{name}_count`, `{name}_sum`），其最大值导出为gauge `{name}_max`；计数器
+导出为`{name}`。每个指标可以带若干label，比如：
+
+    with timer("alpha_stage_seconds", plot="momentum", stage="fit"):
+        ...
+
+    inc("alpha_screen_items_total", len(codes), plot="momentum", stage="scanned")
+
+所有记录都只在进程内存中累加，开销为一次字典查找。
+"""
+import asyncio
+import functools
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Tuple
+
+# (name, labels) -> value
+_counters = defaultdict(float)
+
+# (name, labels) -> [count, sum, max]
+_timers = defaultdict(lambda: [0, 0.0, 0.0])
+
+_help = {}
+
+
+def _labels(labels: dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def describe(name: str, text: str):
+    """
+    为指标设置`# HELP`说明
+    """
+    _help[name] = text
+
+
+def inc(name: str, value: float = 1, **labels):
+    _counters[(name, _labels(labels))] += value
+
+
+def observe(name: str, seconds: float, **labels):
+    rec = _timers[(name, _labels(labels))]
+    rec[0] += 1
+    rec[1] += seconds
+    rec[2] = max(rec[2], seconds)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+
+def timed(name: str, **labels):
+    """
+    为函数（包括协程）计时的装饰器。未指定label时，以函数名作为`func` label
+    """
+    def decorator(func: Callable):
+        _labels = labels or {"func": func.__name__}
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with timer(name, **_labels):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with timer(name, **_labels):
+                    return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def reset():
+    _counters.clear()
+    _timers.clear()
+
+
+def _format_labels(labels: Tuple) -> str:
+    if len(labels) == 0:
+        return ""
+
+    return "{" + ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels) + "}"
+
+
+def render() -> str:
+    """
+    以Prometheus文本格式输出全部指标
+    """
+    lines = []
+
+    def header(name, _type):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {_type}")
+
+    last = None
+    for (name, labels), value in sorted(_counters.items()):
+        if name != last:
+            header(name, "counter")
+            last = name
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    timers = defaultdict(list)
+    for (name, labels), rec in sorted(_timers.items()):
+        timers[name].append((labels, rec))
+
+    for name, recs in timers.items():
+        header(name, "summary")
+        for labels, (count, total, _) in recs:
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+
+        # summary不允许附加其它后缀，最大值单独作为gauge导出
+        lines.append(f"# TYPE {name}_max gauge")
+        for labels, (_, _, _max) in recs:
+            lines.append(f"{name}_max{_format_labels(labels)} {_max}")
+
+    return "\n".join(lines) + "\n"
+
+
+describe("alpha_stage_seconds", "time spent in each stage of plot scans")
+describe("alpha_screen_items_total", "securities passing each filter of plot scans")
+describe("alpha_signal_seconds", "time spent in batched signal functions")
+describe("alpha_monitor_seconds", "time spent in monitor jobs")
+describe("alpha_monitor_errors_total", "failed monitor executions")
+describe("alpha_monitor_evaluations_total", "monitors evaluated")
+describe("alpha_redis_writes_total", "records written to redis by plots")
+describe("alpha_emit_seconds", "latency of emitting plot events")
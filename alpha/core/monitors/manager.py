@@ -10,15 +10,18 @@ import datetime
 import json
 import logging
 import re
+import time
+from collections import defaultdict
+from typing import Set
 
 import cfg4py
-from apscheduler.job import Job
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from omicron.core.triggers import TradeTimeIntervalTrigger, FrameTrigger
 from omicron.core.types import FrameType
 from omicron.dal import cache
 from pyemit import emit
 
+from alpha.core import metrics
 from alpha.core.enums import Events
 from alpha.plots import create_plot
 
@@ -35,9 +38,20 @@ class MonitorManager:
     一个进程仅有一个monitor；monitor在执行监控时，将根据需要创建plot对象来完成状态评估。
     """
     monitor_key = "monitors"
+    indexed_fields = ("plot", "code", "frame_type", "flag", "win")
 
     def __init__(self):
         self.watch_list = {}
+        # 共享同一(plot, executor, trigger, frame_type)的监控合并为一个group job，
+        # group_key -> 该组包含的job_name
+        self.groups = {}
+        # group_key -> plot。group在存续期间始终使用同一个plot对象，其上缓存的指标状态
+        # 因而可以在各次运行之间复用
+        self.plots = {}
+        # job_name -> 所属group job的id
+        self.job_groups = {}
+        # (field, value) -> job_name，用于按plot, code, frame_type等条件查找监控
+        self.index = defaultdict(set)
         self.sched = None
 
     def init(self, scheduler=None):
@@ -51,70 +65,170 @@ class MonitorManager:
     async def self_test(self):
         await emit.emit(Events.self_test)
 
-    def _add_watch(self, plot, job_name: str, job_info: dict):
-        """
-
-        Args:
-            plot: instance of baseplot
-            job_info: contains plot(the name), trigger(dict), title_keys, executor,
-            params which is needed by executor
+    @staticmethod
+    def group_key(job_info: dict) -> str:
+        params = job_info.get("executor_params") or {}
+        return ":".join(("group", job_info.get("plot"), job_info.get("executor"),
+                         json.dumps(job_info.get("trigger"), sort_keys=True),
+                         str(params.get("frame_type"))))
 
-        Returns:
-
-        """
-        trigger = job_info.get('trigger')
+    def _make_trigger(self, trigger: dict):
         trigger_name = trigger.get("name")
         if trigger_name == "interval":
             interval = trigger.get('interval')
             unit = trigger.get('unit')
-            _trigger = TradeTimeIntervalTrigger(f"{interval}{unit}")
+            return TradeTimeIntervalTrigger(f"{interval}{unit}")
         elif trigger_name == 'frame':
             frame_type = trigger.get("frame_type")
             jitter = trigger.get("jitter")
             jitter_unit = trigger.get("jitter_unit")
-            _trigger = FrameTrigger(frame_type, f"{jitter}{jitter_unit}")
+            return FrameTrigger(frame_type, f"{jitter}{jitter_unit}")
         else:
             raise ValueError(f"trigger type {trigger} not supported")
 
-        executor = getattr(plot, job_info.get("executor"))
-        self.sched.add_job(executor, trigger=_trigger, name=job_name,
-                           kwargs=job_info.get("executor_params"),
-                           misfire_grace_time=10)
+    def _add_watch(self, plot, job_name: str, job_info: dict):
+        """
+        将监控加入其所属的group。如果group还不存在，则为其创建一个job，该job被触发时，对
+        group中全部监控调用一次`plot.evaluate_batch`，而不是每个监控各自一个job。
+
+        Args:
+            plot: instance of baseplot
+            job_info: contains plot(the name), trigger(dict), title_keys, executor,
+            params which is needed by executor
+
+        Returns:
+
+        """
+        if not hasattr(plot, job_info.get("executor")):
+            raise ValueError(f"{plot.name} has no executor {job_info.get('executor')}")
+
+        key = self.group_key(job_info)
+        members = self.groups.get(key)
+        if members is None:
+            members = set()
+            self.groups[key] = members
+            self.plots[key] = plot
+            self.sched.add_job(self._run_group,
+                               trigger=self._make_trigger(job_info.get('trigger')),
+                               id=key, name=key, args=(key,), misfire_grace_time=10)
+
+        members.add(job_name)
+        self.job_groups[job_name] = key
+
+    def _remove_watch(self, job_name: str):
+        """
+        将监控移出其所属的group。group为空时，删除group job
+        """
+        key = self.job_groups.pop(job_name, None)
+        members = self.groups.get(key)
+        if members is None:
+            return
+
+        members.discard(job_name)
+        if len(members) == 0:
+            del self.groups[key]
+            del self.plots[key]
+            self.sched.remove_job(key)
+
+    def _index_items(self, job_info: dict):
+        params = job_info.get("executor_params") or {}
+        for field in self.indexed_fields:
+            value = job_info.get("plot") if field == "plot" else params.get(field)
+            if value is not None:
+                yield field, str(value)
+
+    def _watch(self, job_name: str, job_info: dict):
+        self.watch_list[job_name] = job_info
+        for item in self._index_items(job_info):
+            self.index[item].add(job_name)
+
+    def _unwatch(self, job_name: str):
+        job_info = self.watch_list.pop(job_name)
+        for item in self._index_items(job_info):
+            names = self.index.get(item)
+            names.discard(job_name)
+            if len(names) == 0:
+                del self.index[item]
+
+    def lookup(self, **filters) -> Set[str]:
+        """
+        返回同时满足全部条件的监控名。条件为indexed_fields中的字段，值为None或者空串的条件
+        被忽略；没有任何条件时，返回全部监控。
+        """
+        filters = {field: value.value if isinstance(value, FrameType) else str(value)
+                   for field, value in filters.items() if value not in (None, '')}
+        if len(filters) == 0:
+            return set(self.watch_list.keys())
+
+        matched = sorted((self.index.get(item, set()) for item in filters.items()),
+                         key=len)
+        return set.intersection(*matched)
+
+    def _resume_watch(self, plot, job_name: str):
+        # 在等待期间监控可能已被删除
+        job_info = self.watch_list.get(job_name)
+        if job_info is not None:
+            self._add_watch(plot, job_name, job_info)
+
+    async def _run_group(self, key: str):
+        members = self.groups.get(key)
+        if not members:
+            return
+
+        job_infos = [self.watch_list[name] for name in members]
+        plot = self.plots[key]
+        executor = job_infos[0].get("executor")
+        params_list = [job_info.get("executor_params") for job_info in job_infos]
+
+        t0 = time.time()
+        labels = {"plot": plot.name, "executor": executor}
+        with metrics.timer("alpha_monitor_seconds", **labels):
+            if executor == 'evaluate':
+                await plot.evaluate_batch(params_list)
+            else:
+                func = getattr(plot, executor)
+                for params in params_list:
+                    try:
+                        await func(**params)
+                    except Exception as e:
+                        metrics.inc("alpha_monitor_errors_total", **labels)
+                        logger.exception(e)
+
+            # 本轮评估中产生的记录及变化的记忆一次性写入redis
+            await plot.flush()
+        metrics.inc("alpha_monitor_evaluations_total", len(params_list), **labels)
+
+        logger.debug("%s: %s monitors evaluated in %.2f secs", key, len(params_list),
+                     time.time() - t0)
 
     def find_job(self, plot, code, flag, frame_type: FrameType, *args):
-        for job in self.sched.get_jobs():
-            items = job.name.split(":")
-            try:
-                items.index(plot)
-                items.index(code)
-                items.index(flag)
-                items.index(frame_type.value)
-                for arg in args:
-                    items.index(arg)
-
-                return job
-
-            except ValueError:
-                continue
-
-    def reschedule_job(self, start_time: datetime.datetime, job: Job):
         """
-        I don't know why, but it doesn't work if call job's reschedule with different
-        start_date. So I have to re-create the job
+        查找匹配的监控，返回其job_name。args为job_name中的其它组成部分，比如win
+        """
+        names = self.lookup(plot=plot, code=code, flag=flag,
+                            frame_type=FrameType(frame_type))
+        for job_name in sorted(names):
+            items = job_name.split(":")
+            if all(str(arg) in items for arg in args):
+                return job_name
+
+    def reschedule_job(self, start_time: datetime.datetime, job_name: str):
+        """
+        暂停监控，直到start_time再重新加入其所属的group
         Args:
             start_time:
-            job_id:
+            job_name:
 
         Returns:
 
         """
-        job_info = self.watch_list.get(job.name)
+        job_info = self.watch_list.get(job_name)
         plot_name = job_info.get("plot")
         plot = create_plot(plot_name)
 
-        self.sched.remove_job(job.id)
-        self.sched.add_job(self._add_watch, 'date', next_run_time=start_time,
-                           args=(plot, job.name, job_info),
+        self._remove_watch(job_name)
+        self.sched.add_job(self._resume_watch, 'date', next_run_time=start_time,
+                           args=(plot, job_name),
                            misfire_grace_time=30)
 
     def make_job_name(self, hash_keys, plot, trigger, **kwargs):
@@ -144,13 +258,10 @@ class MonitorManager:
         job_name = self.make_job_name(title_keys, plot_name, **kwargs)
 
         # remove old ones first
-        for job in self.sched.get_jobs():
-            if job.name == job_name:
-                self.sched.remove_job(job.id)
-                await cache.sys.hdel(self.monitor_key, job_name)
-                del self.watch_list[job.name]
+        if job_name in self.watch_list:
+            await self._remove(job_name)
 
-        self.watch_list[job_name] = job_info
+        self._watch(job_name, job_info)
         self._add_watch(plot, job_name, job_info)
         await cache.sys.hset(self.monitor_key, job_name, json.dumps(job_info))
 
@@ -180,12 +291,18 @@ class MonitorManager:
         logger.info("(re)loading monitor...")
 
         jobs = await cache.sys.hgetall(self.monitor_key)
+        plots = {}
         for job_name, job_info in jobs.items():
             job_info = json.loads(job_info.encode('utf-8'))
             plot_name = job_info.get("plot")
             plot = create_plot(plot_name)
+            if plot_name not in plots:
+                # 恢复plot的记忆，避免重启后重复发出已经发出过的信号
+                await plot.memory.restore()
+                plots[plot_name] = plot
+
+            self._watch(job_name, job_info)
             self._add_watch(plot, job_name, job_info)
-            self.watch_list[job_name] = job_info
         logger.info("done with %s monitor loaded", len(self.watch_list))
 
         return self.watch_list
@@ -196,45 +313,45 @@ class MonitorManager:
                      remove_all=False):
         removed = []
         if remove_all:
-            self.sched.remove_all_jobs()
+            for key in self.groups.keys():
+                self.sched.remove_job(key)
+            self.groups = {}
+            self.plots = {}
+            self.job_groups = {}
             await cache.sys.delete(self.monitor_key)
-            removed = self.watch_list.keys()
+            removed = list(self.watch_list.keys())
             self.watch_list = {}
+            self.index = defaultdict(set)
             return removed
         else:
             if job_name:
-                for job in self.sched.get_jobs():
-                    if job.name == job_name:
-                        removed.append(await self._remove(job.id, job.name))
+                if job_name in self.watch_list:
+                    removed.append(await self._remove(job_name))
                 return removed
-            else:
-                pattern = rf"({plot})|({code})|({frame_type})|({flag})"
-                for job in self.sched.get_jobs():
-                    if re.search(pattern, job.name):
-                        removed.append(await self._remove(job.id, job.name))
+            elif any((plot, code, frame_type, flag)):
+                for name in self.lookup(plot=plot, code=code, frame_type=frame_type,
+                                        flag=flag):
+                    removed.append(await self._remove(name))
 
             return removed
 
-    async def _remove(self, job_id, job_name):
-        self.sched.remove_job(job_id)
+    async def _remove(self, job_name):
+        self._remove_watch(job_name)
         await cache.sys.hdel(self.monitor_key, job_name)
-        del self.watch_list[job_name]
+        self._unwatch(job_name)
         return job_name
 
     async def list_monitors(self, code: str = '', frame_type: str = '', plot: str = '',
                             flag: str = ''):
-        filters = filter(None, (code, frame_type, plot, flag))
-        pattern = "|".join(f"({key})" for key in filters)
-
         results = []
-        for job_name in self.watch_list.keys():
-            if re.search(pattern, job_name):
-                job_info = self.watch_list[job_name]
-                plot = job_info.get("plot")
-                trigger = job_info.get("trigger")
-                params = job_info.get("executor_params")
-
-                results.append([job_name, plot, params, trigger])
+        for job_name in sorted(self.lookup(code=code, frame_type=frame_type, plot=plot,
+                                           flag=flag)):
+            job_info = self.watch_list[job_name]
+            plot = job_info.get("plot")
+            trigger = job_info.get("trigger")
+            params = job_info.get("executor_params")
+
+            results.append([job_name, plot, params, trigger])
 
         return results
 
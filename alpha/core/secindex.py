@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+证券代码/名称的内存搜索索引，供自动补全使用。
+
+`Securities().fuzzy_match`每次查询都要遍历全部证券并重新序列化结果。这里在启动时（及每个
+交易日开盘前）一次性建立索引：
+
+    - 代码前缀表：代码的每个数字前缀 -> 证券列表
+    - 拼音首字母前缀表：拼音缩写（即`name`字段）的每个前缀 -> 证券列表
+    - 名称n-gram倒排表：显示名称的1~3字符子串 -> 证券集合
+
+各列表在建立时即已排好序，每支证券的JSON片段也预先生成，查询时只需查表、切片及拼接字符串。
+"""
+import json
+import logging
+import re
+from collections import defaultdict
+from typing import List
+
+from omicron.models.securities import Securities
+
+logger = logging.getLogger(__name__)
+
+# 名称倒排表中n-gram的最大长度
+MAX_GRAM = 3
+
+
+class SecurityIndex:
+    def __init__(self):
+        self._codes = defaultdict(list)
+        self._initials = defaultdict(list)
+        self._grams = defaultdict(set)
+
+        # 每支证券的显示名称及JSON片段，下标与上面各表中的证券序号一致
+        self._names = []
+        self._fragments = []
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def build(self, secs):
+        """
+        根据证券列表建立索引。secs的每一行为(code, display_name, name, ipo, end, type)
+        """
+        codes = defaultdict(list)
+        initials = defaultdict(list)
+        grams = defaultdict(set)
+        names = []
+        fragments = []
+
+        for i, sec in enumerate(sorted(secs, key=lambda sec: sec[0])):
+            code, display_name, name = sec[0], sec[1], sec[2].upper()
+            names.append(display_name)
+            fragments.append(json.dumps(sec[0]) + ":" +
+                             json.dumps(list(sec), default=str, ensure_ascii=False))
+
+            digits = code.split(".")[0]
+            for n in range(1, len(digits) + 1):
+                codes[digits[:n]].append(i)
+
+            for n in range(1, len(name) + 1):
+                initials[name[:n]].append((len(name), i))
+
+            for n in range(1, MAX_GRAM + 1):
+                for start in range(len(display_name) - n + 1):
+                    grams[display_name[start:start + n]].add(i)
+
+        # 拼音缩写越短，与查询越接近
+        initials = {k: [i for _, i in sorted(v)] for k, v in initials.items()}
+
+        self._codes, self._initials, self._grams = codes, initials, grams
+        self._names, self._fragments = names, fragments
+        logger.info("security index built: %s securities", len(fragments))
+
+    async def rebuild(self):
+        """
+        重新加载证券列表并重建索引
+        """
+        secs = Securities()
+        await secs.load()
+        self.build(self._records(secs))
+
+    @staticmethod
+    def _records(secs: Securities):
+        """
+        返回secs中全部证券的记录，每行为(code, display_name, name, ipo, end, type)。
+
+        Securities未提供遍历全部记录的公开接口（其切片访问有bug），这是本模块唯一读取其内部
+        数组的地方。omicron提供公开接口后，只需修改这里。
+        """
+        return secs._secs
+
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        """
+        返回与query匹配的证券序号，按匹配程度排序，至多limit个
+        """
+        query = (query or "").strip().upper()
+        if len(query) == 0:
+            return []
+
+        # 纯数字查代码，纯字母查拼音缩写；查不到时（比如名称中含有数字或者字母），以及其它
+        # 查询，都按名称查找
+        if re.fullmatch(r"\d+", query):
+            matched = self._codes.get(query, [])[:limit]
+        elif re.fullmatch(r"[A-Z]+", query):
+            matched = self._initials.get(query, [])[:limit]
+        else:
+            matched = None
+
+        if matched:
+            return matched
+
+        n = min(len(query), MAX_GRAM)
+        candidates = None
+        for start in range(len(query) - n + 1):
+            postings = self._grams.get(query[start:start + n])
+            if not postings:
+                return []
+            candidates = postings if candidates is None else candidates & postings
+
+        if len(query) > MAX_GRAM:
+            candidates = [i for i in candidates if query in self._names[i]]
+
+        # 名称以query开头的优先，其次名称越短越好
+        return sorted(candidates, key=lambda i: (not self._names[i].startswith(query),
+                                                 len(self._names[i]), i))[:limit]
+
+    def match(self, query: str, limit: int = 20) -> str:
+        """
+        返回`{code: [code, display_name, name, ipo, end, type], ...}`形式的JSON串，与
+        `Securities().fuzzy_match`的结果格式一致
+        """
+        return "{" + ",".join(self._fragments[i] for i in self.search(query, limit)) + "}"
+
+
+secindex = SecurityIndex()
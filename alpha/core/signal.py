@@ -6,13 +6,16 @@ Author: Aaron-Yang [code@jieyu.ai]
 Contributors: 
 
 """
+import functools
 import logging
 from typing import Union, Optional
 
 import numpy as np
 
 # import matplotlib.pyplot as plt
+from alpha.core import kernels
 from alpha.core.enums import CurveType
+from alpha.core.metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +30,7 @@ def rmse(y, y_hat):
     Returns:
 
     """
-    return np.sqrt(np.mean(np.square(y - y_hat)))
+    return kernels.rmse(y, y_hat)
 
 
 def polyfit(ts, deg=2,decimals:Optional[tuple]=None):
@@ -48,9 +51,7 @@ def polyfit(ts, deg=2,decimals:Optional[tuple]=None):
         z = np.polyfit(x, ts, deg=deg)
 
         # polyfit给出的残差是各项残差的平方和，这里返回相对于单项的误差比。对股票行情而言，最大可接受的std_err也许是小于1%
-        p = np.poly1d(z)
-        ts_hat = np.array([p(xi) for xi in x])
-        error = rmse(ts, ts_hat) / np.sqrt(np.mean(np.square(ts)))
+        error = kernels.poly_error(ts, z)
 
         if deg == 2:
             a, b, c = z[0], z[1], z[2]
@@ -74,6 +75,89 @@ def polyfit(ts, deg=2,decimals:Optional[tuple]=None):
         return error, (np.nan, np.nan, np.nan), (np.nan, np.nan)
 
 
+@functools.lru_cache(maxsize=32)
+def _polyfit_projection(win: int, deg: int):
+    """
+    对固定的x坐标(0, 1, ..., win - 1)，预先计算范德蒙矩阵及其最小二乘投影矩阵（伪逆）。
+
+    由于x坐标只取决于窗口长度，同一win和deg的拟合可以共用这两个矩阵。
+    """
+    x = np.arange(win)
+    vander = np.vander(x, deg + 1).astype(np.float64)
+    proj = np.linalg.pinv(vander)
+
+    vander.flags.writeable = False
+    proj.flags.writeable = False
+    return vander, proj
+
+
+@timed("alpha_signal_seconds")
+def polyfit_batch(matrix, deg=2):
+    """
+    对(n_series, win)矩阵中的每一行进行多项式拟合，与`polyfit`的结果在浮点误差内一致。
+
+    所有序列共用同一个x坐标，因此拟合退化为一次矩阵乘法：coef = matrix @ pinv(X).T，
+    不再需要对每个序列调用一次`np.polyfit`。
+
+    返回的结果为 error, coef, vertex。其中error形状为(n_series, ), coef形状为
+    (n_series, deg + 1)，vertex形状为(n_series, 2)，每行为(axis_x, axis_y)。当deg为1时，
+    只返回error和coef。
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+
+    vander, proj = _polyfit_projection(matrix.shape[1], deg)
+
+    coef = matrix @ proj.T
+    ts_hat = coef @ vander.T
+    error = np.sqrt(np.mean(np.square(matrix - ts_hat), axis=1)) / np.sqrt(
+            np.mean(np.square(matrix), axis=1))
+
+    if deg == 2:
+        a, b, c = coef[:, 0], coef[:, 1], coef[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            axis_x = -b / (2 * a)
+            axis_y = (4 * a * c - b * b) / (4 * a)
+
+        return error, coef, np.stack((axis_x, axis_y), axis=1)
+    else:
+        return error, coef
+
+
+def polyval(coef, x):
+    """
+    以Horner法求多项式在x处的值。coef为(deg + 1, )的系数（高次项在前），或者
+    (n_series, deg + 1)的系数矩阵；x为标量或者一维数组。
+
+    返回值的形状为coef.shape[:-1] + x.shape，即对每一组系数，求出所有x处的值。对批量拟合的
+    结果，这样可以一次求出全部证券的预测值或者拟合曲线，而无需为每支证券构造np.poly1d。
+    """
+    coef = np.asarray(coef, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+
+    # 将系数轴移到最前，每组系数增加与x的维度对应的轴，以便广播
+    terms = np.moveaxis(coef, -1, 0).reshape(
+            (coef.shape[-1],) + coef.shape[:-1] + (1,) * x.ndim)
+
+    result = np.zeros(coef.shape[:-1] + x.shape)
+    for term in terms:
+        result = result * x + term
+
+    return result
+
+
+def poly_advance(coef, start, end):
+    """
+    拟合曲线从start到end的涨幅，即p(end) / p(start) - 1。coef的含义同`polyval`，对单组系数
+    返回float，对系数矩阵返回(n_series, )的数组
+    """
+    values = polyval(coef, (start, end))
+    advance = values[..., 1] / values[..., 0] - 1
+
+    return float(advance) if advance.ndim == 0 else advance
+
+
 def slope(ts):
     """
     本函数对长期均线的短区间内拟合更有效，长均线在一个短的区间里呈现单
@@ -100,10 +184,7 @@ def exp_fit(ts):
         a, b = z[0], z[1]
 
         # 此处需要自行计算std_error，polyfit返回的errors不能使用
-        p = np.poly1d((a, b))
-
-        ts_hat = np.array([np.exp(a * x) * np.exp(b) for x in range(len(ts))])
-        error = rmse(ts, ts_hat) / np.sqrt(np.mean(np.square(ts)))
+        error = kernels.exp_error(ts, a, b)
 
         return error, (a, b)
     except Exception as e:
@@ -117,6 +198,37 @@ def moving_average(ts, win):
     return np.convolve(ts, np.ones(win), 'valid') / win
 
 
+def moving_averages(ts, wins):
+    """
+    通过一次前缀和计算，同时求出多个窗口的移动平均。
+
+    ts可以是一维序列，也可以是(n_codes, n_bars)的二维矩阵，此时沿最后一维对每一行计算均线。
+
+    返回以win为键的字典。每个值与`moving_average(ts, win)`的结果一致，长度为
+    n_bars - win + 1，且都是同一块内存上的视图，各条均线按序列尾部对齐，即
+    mas[5][-1]与mas[250][-1]对应同一个bar。
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    n = ts.shape[-1]
+
+    csum = np.zeros(ts.shape[:-1] + (n + 1,), dtype=np.float64)
+    np.cumsum(ts, axis=-1, out=csum[..., 1:])
+
+    buffer = np.full((len(wins),) + ts.shape, np.nan, dtype=np.float64)
+    mas = {}
+    for i, win in enumerate(wins):
+        if win > n:
+            mas[win] = buffer[i, ..., n:]
+            continue
+
+        ma = buffer[i, ..., win - 1:]
+        np.subtract(csum[..., win:], csum[..., :-win], out=ma)
+        ma /= win
+        mas[win] = ma
+
+    return mas
+
+
 def pma(bars):
     return bars['money'] / bars['volume']
 
@@ -128,15 +240,11 @@ def predict_moving_average(ts, win: int, n: int = 1):
     # 1. 曲线拟合法
     curve_len = 5
     ma = moving_average(ts, win)[-curve_len:]
-    deg, coef, error = polyfit(ma)
-    prediction = []
-
-    if np.sqrt(error / curve_len) / np.mean(ma) < 0.01:
-        p = np.poly1d(coef)
-        for i in range(curve_len, curve_len + n):
-            prediction.append(p(i))
+    # polyfit返回的误差已经是相对于均线本身的均方根误差
+    error, coef, _ = polyfit(ma)
 
-        return prediction
+    if error < 0.01:
+        return list(polyval(coef, np.arange(curve_len, curve_len + n)))
 
     # 2. 如果曲线拟合不成功，则使用假定股价不变法
     _ts = np.append(ts, [ts[-1]] * n)
@@ -164,6 +272,77 @@ def momemtem(ts, deg=1):
         return dts
 
 
+def sliding_polyfit(matrix, win: int):
+    """
+    对(n_series, n)矩阵中的每个序列，求出所有长度为win的滑动窗口的二次拟合结果。
+
+    窗口的x坐标固定为(0, ..., win - 1)，因此系数是窗口值的固定线性组合（`_polyfit_projection`
+    中的伪逆），可以对全部窗口同时计算；残差平方和由窗口平方和减去拟合值平方和得到，无需逐窗口
+    求出拟合值。总开销为O(n * win)次向量运算，不会创建(n, win)的窗口矩阵。
+
+    返回 error, a, b，形状均为(n_series, n - win + 1)，第s列对应窗口[s, s + win)。error与
+    `polyfit`的定义一致。
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+
+    vander, proj = _polyfit_projection(win, 2)
+    gram = vander.T @ vander
+
+    m = matrix.shape[1] - win + 1
+    coef = np.zeros((3, matrix.shape[0], m))
+    sumsq = np.zeros((matrix.shape[0], m))
+    for j in range(win):
+        column = matrix[:, j:j + m]
+        coef += proj[:, j, None, None] * column
+        sumsq += np.square(column)
+
+    fitted = np.einsum('i...,ij,j...->...', coef, gram, coef)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = np.sqrt(np.clip(sumsq - fitted, 0, None) / sumsq)
+
+    return error, coef[0], coef[1]
+
+
+def polyfit_inflextion_batch(matrix, win=10, err=0.001):
+    """
+    `polyfit_inflextion`的批量版本。matrix为(n_series, n)的矩阵，所有序列的全部窗口通过一次
+    `sliding_polyfit`完成拟合。
+
+    Returns:
+        list of (peaks, valleys)，与matrix的各行一一对应
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+
+    n = matrix.shape[1]
+    if n < 2 * win + 1:
+        return [([], []) for _ in range(len(matrix))]
+
+    # 窗口[s, s + win)，s取[0, n - 2 * win)，即窗口之后至少还有win个周期
+    errors, a, b = sliding_polyfit(matrix[:, :n - win - 1], win)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vx = -b / (2 * a)
+
+    # 顶点须位于窗口末端，即极值刚刚出现
+    mask = ~(errors > err) & (vx >= win - 2) & (vx <= win - 1)
+
+    results = []
+    for row in range(len(matrix)):
+        starts = np.flatnonzero(mask[row])
+        indices = starts + 1 + vx[row, starts].astype(int)
+        lows = a[row, starts] > 0
+
+        ts = matrix[row]
+        peaks = kernels.merge_extrema(indices[~lows], ts[indices[~lows]], lower=False)
+        valleys = kernels.merge_extrema(indices[lows], ts[indices[lows]], lower=True)
+        results.append(([int(i) for i in peaks], [int(i) for i in valleys]))
+
+    return results
+
+
 def polyfit_inflextion(ts, win=10, err=0.001):
     """
     通过曲线拟合法来寻找时间序列的极值点（局部极大值、极小值）。
@@ -174,49 +353,7 @@ def polyfit_inflextion(ts, win=10, err=0.001):
     Returns:
         极值点在时间序列中的索引值
     """
-    valleys = []
-    peaks = []
-    mn, mx = None, None
-    for i in range(win, len(ts) - win):
-        _err, coef, vert = polyfit(ts[i - win:i])
-        if _err > err:
-            continue
-        a, b, c = coef
-        x, y = vert
-        if not (8 <= x <= win - 1):
-            continue
-
-        index = i - win + 1 + int(x)
-        if a > 0:  # 找到最低点
-            value = ts[index]
-            if mn is None:
-                mn = value
-                valleys.append(index)
-                continue
-
-            if index - valleys[-1] <= 2:
-                if value < mn:  # 相邻位置连续给出信号，合并之
-                    valleys.pop(-1)
-                    valleys.append(index)
-                    mn = value
-            else:
-                valleys.append(index)
-        else:  # 找到最高点
-            value = ts[index]
-            if mx is None:
-                mx = value
-                peaks.append(index)
-                continue
-
-            if index - peaks[-1] <= 2:
-                if value > mx:  # 相邻位置连续给出信号，合并之
-                    peaks.pop(-1)
-                    peaks.append(index)
-                    mx = value
-                else:
-                    peaks.append(index)
-
-    return peaks, valleys
+    return polyfit_inflextion_batch(ts, win, err)[0]
 
 
 def cross(f, g):
@@ -264,6 +401,66 @@ def vcross(f, g):
     return False, (None, None)
 
 
+def _sign_changes(f, g):
+    """
+    返回f - g的符号变化矩阵，第j列为真表示第j和第j + 1个元素之间f与g相交
+    """
+    f = np.asarray(f, dtype=np.float64)
+    g = np.asarray(g, dtype=np.float64)
+    if f.ndim == 1:
+        f, g = f.reshape(1, -1), g.reshape(1, -1)
+
+    return f, g, np.diff(np.sign(f - g), axis=1) != 0
+
+
+def cross_batch(f, g):
+    """
+    `cross`的批量版本。f和g为(n_series, n)的矩阵，对每一行分别判断f是否与g相交。
+
+    Returns:
+        (flags, indices)，形状均为(n_series, )。flags为1、-1或0，含义与`cross`相同；indices
+        为最后一个交点的位置，不存在交点时为0
+    """
+    f, g, changed = _sign_changes(f, g)
+    rows = np.arange(len(f))
+
+    # 最后一个交点：在翻转后的矩阵中找第一个
+    has_cross = np.any(changed, axis=1)
+    indices = changed.shape[1] - 1 - np.argmax(changed[:, ::-1], axis=1)
+    indices[~has_cross] = 0
+
+    fi, gi = f[rows, indices], g[rows, indices]
+    prev = (indices - 1) % f.shape[1]
+    flags = np.where(fi < gi, 1, np.where(fi > gi,
+                                          -1,
+                                          np.sign(g[rows, prev] - f[rows, prev])))
+    flags[~has_cross] = 0
+
+    return flags.astype(int), indices
+
+
+def vcross_batch(f, g):
+    """
+    `vcross`的批量版本。f和g为(n_series, n)的矩阵，对每一行分别判断是否存在v型相交。
+
+    Returns:
+        (flags, indices)，flags形状为(n_series, )，indices形状为(n_series, 2)，为两个交点的
+        位置，flags为False的行取值为-1
+    """
+    f, g, changed = _sign_changes(f, g)
+    rows = np.arange(len(f))
+
+    # 恰好两个交点时，第一个为从左起第一个交点，第二个为最后一个交点
+    twice = np.count_nonzero(changed, axis=1) == 2
+    idx0 = np.argmax(changed, axis=1)
+    idx1 = changed.shape[1] - 1 - np.argmax(changed[:, ::-1], axis=1)
+
+    flags = twice & (f[rows, idx0] > g[rows, idx0]) & (f[rows, idx1] < g[rows, idx1])
+    indices = np.where(flags[:, None], np.stack((idx0, idx1), axis=1), -1)
+
+    return flags, indices
+
+
 def is_curve_up(momentum: float, vx: Union[float, int], win: int):
     """
     在一个起始点为1.0（即已标准化）的时间序列中，如果经过signal.polyfit以后，
@@ -317,16 +514,4 @@ def find_runs(x):
         return np.array([]), np.array([]), np.array([])
 
     else:
-        # find run starts
-        loc_run_start = np.empty(n, dtype=bool)
-        loc_run_start[0] = True
-        np.not_equal(x[:-1], x[1:], out=loc_run_start[1:])
-        run_starts = np.nonzero(loc_run_start)[0]
-
-        # find run values
-        run_values = x[loc_run_start]
-
-        # find run lengths
-        run_lengths = np.diff(np.append(run_starts, n))
-
-        return run_values, run_starts, run_lengths
+        return kernels.find_runs(x)
@@ -6,6 +6,7 @@ Author: Aaron-Yang [code@jieyu.ai]
 Contributors: 
 
 """
+import importlib
 import logging
 
 from omicron.core.triggers import FrameTrigger
@@ -14,29 +15,99 @@ from omicron.core.types import FrameType
 logger = logging.getLogger(__name__)
 
 
+# 内置的plot，name -> "module:Class"。模块在首次使用时才导入
+_builtin_plots = {
+    "momentum":   "alpha.plots.momentum:Momentum",
+    "maline":     "alpha.plots.maline:MaLine",
+    "fixprice":   "alpha.plots.fixprice:FixPrice",
+    "extendline": "alpha.plots.extendline:ExtendLine",
+}
+
+# 第三方策略可以在其setup.py中声明此group下的entry point来注册plot，比如：
+#   entry_points={"alpha.plots": ["mine = mypackage.plots:MinePlot"]}
+ENTRY_POINT_GROUP = "alpha.plots"
+
+_registry = {}
+_instances = {}
+
+
+def _load_registry():
+    _registry.update(_builtin_plots)
+
+    try:
+        import pkg_resources
+    except ImportError:  # pragma: no cover
+        return
+
+    for ep in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP):
+        name = ep.name.lower()
+        if name in _registry:
+            logger.warning("plot %s is already registered, %s ignored", name, ep)
+            continue
+
+        _registry[name] = ep
+
+
+def register_plot(name: str, target):
+    """
+    注册一个plot。target可以是plot类，或者"module:Class"形式的字符串
+    """
+    if len(_registry) == 0:
+        _load_registry()
+
+    _registry[name.lower()] = target
+    _instances.pop(name.lower(), None)
+
+
+def _resolve(target):
+    if isinstance(target, str):
+        module, cls = target.split(":")
+        return getattr(importlib.import_module(module), cls)
+
+    if hasattr(target, "load"):  # entry point
+        return target.load()
+
+    return target
+
+
 def create_plot(plot_name: str):
-    if plot_name.lower() == 'momentum':
-        from alpha.plots.momentum import Momentum
-        return Momentum()
-    if plot_name.lower() == 'maline':
-        from alpha.plots.maline import MaLine
-        return MaLine()
-    if plot_name.lower() == 'fixprice':
-        from alpha.plots.fixprice import FixPrice
-        return FixPrice()
-    if plot_name.lower() == 'extendline':
-        from alpha.plots.extendline import ExtendLine
-        return ExtendLine()
+    """
+    返回名为plot_name的plot实例。每个plot在进程内只有一个实例，因此其memory等状态在多次
+    评估之间得以保留。plot_name未注册时返回None
+    """
+    name = plot_name.lower()
+    plot = _instances.get(name)
+    if plot is not None:
+        return plot
+
+    if len(_registry) == 0:
+        _load_registry()
+
+    target = _registry.get(name)
+    if target is None:
+        logger.warning("plot %s is not registered", plot_name)
+        return None
+
+    plot = _resolve(target)()
+    _instances[name] = plot
+    return plot
 
 
 def start_plot_scan(scheduler):
-    mom = create_plot('momentum')
+    from alpha.plots.sharding import sharded_scan
+
     # 每个交易日14：30，选出日线级别符合动量策略的股票
     trigger = FrameTrigger(FrameType.DAY, "-30m")
-    scheduler.add_job(mom.scan, trigger, frame_type=FrameType.DAY)
+    scheduler.add_job(sharded_scan, trigger, args=('momentum', FrameType.DAY))
 
     trigger = FrameTrigger(FrameType.MIN30)
-    scheduler.add_job(mom.scan, trigger, frame_type=FrameType.MIN30)
+    scheduler.add_job(sharded_scan, trigger, args=('momentum', FrameType.MIN30))
+
+    # 启动时为股票池补建时间索引，此后每个交易日开盘前清理过期的记录
+    mom = create_plot('momentum')
+    scheduler.add_job(mom.rebuild_pool_index, 'date', misfire_grace_time=30)
+    trigger = FrameTrigger(FrameType.DAY, "-6h")
+    scheduler.add_job(mom.expire_pool, trigger)
 
 
-__all__ = ['create_plot']
+__all__ = ['create_plot', 'register_plot']
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+"""
+import asyncio
+import logging
+from typing import Callable, List, Sequence
+
+import numpy as np
+from omicron.core.timeframe import tf
+from omicron.core.types import Frame, FrameType
+from omicron.models.securities import Securities
+from pandas import DataFrame
+
+from alpha.core import features
+from alpha.plots.scanner import scan_market
+
+logger = logging.getLogger(__name__)
+
+
+class Backtest:
+    """
+    在历史行情上回放plot的判断函数。
+
+    每支证券在整个回测区间内的行情只加载一次，然后在其上滑动长度为win的窗口，对[start, end]
+    间的每一个frame调用predicate(code, bars)，其中bars为截止到该frame的最近win个bar（视图，
+    不拷贝）。predicate可以是普通函数或者协程函数，返回None或者False表示未发出信号；返回True
+    或者dict表示发出信号，dict中的内容将作为结果的列。
+
+    结果中同时包含信号发出后第h个frame的收益率(forward return)，以及h个frame内的最大涨幅和
+    最大回撤，列名分别为`ret_{h}`, `gain_{h}`和`drawdown_{h}`。全部信号在回放结束后通过
+    `features.forward_returns`一次性计算。
+    """
+
+    def __init__(self, start: Frame, end: Frame, frame_type: FrameType, win: int,
+                 horizons: Sequence[int] = (1, 5, 10)):
+        self.start = start
+        self.end = end
+        self.frame_type = frame_type
+        self.win = win
+        self.horizons = list(horizons)
+
+    def _to_int(self, frame: Frame) -> int:
+        if self.frame_type in tf.day_level_frames:
+            return tf.date2int(frame)
+        else:
+            return tf.time2int(frame)
+
+    def _to_frame(self, iframe: int) -> Frame:
+        if self.frame_type in tf.day_level_frames:
+            return tf.int2date(iframe)
+        else:
+            return tf.int2time(iframe)
+
+    async def run(self, predicate: Callable, codes: List[str] = None) -> DataFrame:
+        codes = codes or Securities().choose(['stock'])
+        frames = np.array(tf.get_frames(self.start, self.end, self.frame_type))
+        if len(frames) == 0:
+            return DataFrame()
+
+        # 前面多加载win - 1个bar作为第一个窗口，后面多加载max(horizons)个bar用来计算收益
+        load_start = tf.shift(self._to_frame(int(frames[0])), -self.win + 1,
+                              self.frame_type)
+        load_end = tf.shift(self._to_frame(int(frames[-1])), max(self.horizons),
+                            self.frame_type)
+
+        async def replay(code, bars):
+            iframes = np.array([self._to_int(frame) for frame in bars['frame']])
+
+            # 停牌的frame在bars中不存在，跳过
+            pos = np.searchsorted(iframes, frames)
+            valid = pos < len(iframes)
+            pos = pos[valid]
+            pos = pos[(iframes[pos] == frames[valid]) & (pos >= self.win - 1)]
+
+            rows = []
+            for i in pos:
+                result = predicate(code, bars[i - self.win + 1:i + 1])
+                if asyncio.iscoroutine(result):
+                    result = await result
+
+                if result is None or result is False:
+                    continue
+
+                row = {"frame": int(iframes[i]), "code": code}
+                if isinstance(result, dict):
+                    row.update(result)
+                rows.append(row)
+
+            if len(rows) == 0:
+                return None
+
+            return code, iframes, bars[['close', 'high', 'low']], rows
+
+        results = await scan_market(replay, codes, load_start, load_end,
+                                    self.frame_type)
+
+        rows = [row for *_, rows in results for row in rows]
+        df = DataFrame(rows)
+        if len(df) == 0:
+            logger.info("backtest done: %s frames, no signals", len(frames))
+            return df
+
+        # 将发出过信号的证券的行情对齐到同一frame序列上，一次性计算全部信号的收益
+        axis = np.array(tf.get_frames(load_start, load_end, self.frame_type))
+        matrix = {name: np.full((len(results), len(axis)), np.nan) for name in
+                  ('close', 'high', 'low')}
+        for k, (_, iframes, bars, _) in enumerate(results):
+            cols = np.searchsorted(axis, iframes)
+            for name in matrix:
+                matrix[name][k, cols] = bars[name]
+
+        events = features.event_index([code for code, *_ in results], axis,
+                                      list(zip(df["code"], df["frame"])))
+        for h in self.horizons:
+            ret, gain, drawdown = features.forward_returns(matrix['close'], events, h,
+                                                           matrix['high'],
+                                                           matrix['low'])
+            df[f"ret_{h}"] = ret
+            df[f"gain_{h}"] = gain
+            df[f"drawdown_{h}"] = drawdown
+
+        df.sort_values(["frame", "code"], inplace=True, ignore_index=True)
+
+        logger.info("backtest done: %s frames, %s signals", len(frames), len(df))
+        return df
@@ -6,12 +6,16 @@ Author: Aaron-Yang [code@jieyu.ai]
 Contributors: 
 
 """
+import asyncio
+import itertools
 import json
 import logging
-from typing import Any
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
 
 import arrow
 import cfg4py
+import numpy as np
 from alpha.core.monitors import mm
 from omicron.core.timeframe import tf
 from omicron.core.types import Frame, FrameType
@@ -19,18 +23,33 @@ from omicron.dal import cache
 from omicron.models.security import Security
 from pyemit import emit
 
+from alpha.core import barcache, metrics
 from alpha.core.enums import Events
+from alpha.core.indicators import IndicatorState
+from alpha.core.memory import SignalMemory
 
 cfg = cfg4py.get_instance()
 logger = logging.getLogger(__name__)
 
 
 class BasePlot:
+    # 待写入redis的记录最多缓存flush_interval毫秒，或者累积到flush_size条即写入
+    flush_interval = 200
+    flush_size = 500
+
     def __init__(self, display_name: str):
         self.name = self.__class__.__name__.lower()
         self.display_name = display_name
         self.baselines = {}
-        self.memory = {}
+        self.memory = SignalMemory(self.name)
+        self.indicators = {}
+
+        # redis key -> {field: value}
+        self._pending = defaultdict(dict)
+        # 有序集合的key -> {member: score}
+        self._pending_index = defaultdict(dict)
+        self._pending_count = 0
+        self._flush_timer = None
 
     def set_baseline(self, key:str, value:Any):
         self.baselines[key] = value
@@ -45,9 +64,88 @@ class BasePlot:
                        end_dt: Frame = None):
         end_dt = end_dt or arrow.now(tz=cfg.tz)
 
-        sec = Security(code)
         start = tf.shift(tf.floor(end_dt, frame_type), -n + 1, frame_type)
-        return await sec.load_bars(start, end_dt, frame_type)
+        return await barcache.load_bars(code, start, end_dt, frame_type)
+
+    async def load_indicator(self, code: str, frame_type: FrameType, win: int,
+                             fit_win: int = 7, end_dt: Frame = None) -> IndicatorState:
+        """
+        取得code在frame_type周期上的均线(win)及拟合(fit_win)状态，并更新到end_dt。
+
+        状态按(code, frame_type, win)缓存。如果缓存的状态可以接续，则只加载最新的2个bar进行
+        增量更新；否则（首次使用，或者中间缺失了bar）重新加载win + fit_win - 1个bar来初始化。
+
+        监控常在bar收盘前运行，状态中最后一个bar可能是未收盘时的数据。增量更新时除了新的bar，
+        还要取回该bar收盘后的数据，以替换状态中的收盘价。
+        """
+        key = (code, frame_type, win)
+        state = self.indicators.get(key)
+
+        if state is not None and state.ready:
+            bars = await self.get_bars(code, 2, frame_type, end_dt)
+            if self._advance(state, bars, frame_type):
+                return state
+
+        state = IndicatorState(win, fit_win)
+        state.reset(await self.get_bars(code, win + fit_win - 1, frame_type, end_dt))
+        self.indicators[key] = state
+
+        return state
+
+    async def load_indicators(self, codes: List[str], frame_type: FrameType,
+                              win: int, fit_win: int = 7,
+                              end_dt: Frame = None) -> Dict[str, IndicatorState]:
+        """
+        `load_indicator`的批量版本。可以接续的状态通过一次批量请求加载最新的2个bar，其余的状态
+        通过另一次批量请求重新初始化，而不是每支证券各自请求一次。
+        """
+        end_dt = end_dt or arrow.now(tz=cfg.tz).datetime
+
+        states = {}
+        reseed = []
+        for code in codes:
+            state = self.indicators.get((code, frame_type, win))
+            if state is not None and state.ready:
+                states[code] = state
+            else:
+                reseed.append(code)
+
+        with metrics.timer("alpha_stage_seconds", plot=self.name,
+                           stage="load_indicators"):
+            if len(states):
+                async for code, bars in Security.load_bars_batch(list(states.keys()),
+                                                                 end_dt, 2, frame_type):
+                    if not self._advance(states[code], bars, frame_type):
+                        reseed.append(code)
+
+            if len(reseed):
+                async for code, bars in Security.load_bars_batch(reseed, end_dt,
+                                                                 win + fit_win - 1,
+                                                                 frame_type):
+                    state = IndicatorState(win, fit_win)
+                    state.reset(bars)
+                    self.indicators[(code, frame_type, win)] = state
+                    states[code] = state
+
+        metrics.inc("alpha_screen_items_total", len(reseed), plot=self.name,
+                    stage="reseeded")
+        return states
+
+    @staticmethod
+    def _advance(state: IndicatorState, bars: np.array, frame_type: FrameType) -> bool:
+        """
+        用bars增量更新state。bars中与state最后一个bar相同frame的bar替换其收盘价（该bar此前
+        可能尚未收盘）。如果bars与state之间缺失了bar，无法接续，返回False
+        """
+        bars = bars[bars['frame'] >= state.frame]
+        if len(bars) == 0 or bars[0]['frame'] not in (state.frame,
+                                                      tf.shift(state.frame, 1,
+                                                               frame_type)):
+            return False
+
+        for bar in bars:
+            state.update(bar['frame'], bar['close'])
+        return True
 
     async def copy(self, *args, **kwargs):
         pass
@@ -55,16 +153,237 @@ class BasePlot:
     async def evaluate(self, code:str, **params):
         pass
 
+    async def evaluate_batch(self, params_list: List[dict]):
+        """
+        对共享同一trigger的一组监控进行评估。params_list中的每一项为一个监控的
+        executor_params。默认逐个调用evaluate，子类可以重写此方法以批量加载行情。
+        """
+        for params in params_list:
+            try:
+                await self.evaluate(**params)
+            except Exception as e:
+                logger.exception(e)
+
     async def scan(self, end: Frame, frame_type: FrameType, codes=None):
         raise NotImplementedError("subclass must implement this")
 
+    async def screen(self, frame_type: FrameType, end: Frame = None, codes=None) -> list:
+        """
+        scan中只做计算、不产生副作用的部分，可以在进程池中执行。返回值必须可以被pickle。
+        """
+        raise NotImplementedError("subclass must implement this")
+
+    async def report(self, frame_type: FrameType, hits: list):
+        """
+        处理screen的结果，比如加入股票池，或者发出交易信号
+        """
+        raise NotImplementedError("subclass must implement this")
+
     def remember(self, code: str, frame_type: FrameType, key: str, value: Any):
-        item = self.memory.get(f"{code}:{frame_type.value}", {})
-        item[key] = value
-        self.memory[f"{code}:{frame_type.value}"] = item
+        self.memory.set((code, frame_type.value), key, value)
 
     def recall(self, code: str, frame_type: FrameType, key: str):
-        return self.memory.get(f"{code}:{frame_type.value}", {}).get(key)
+        return self.memory.get((code, frame_type.value), key)
+
+    def write_behind(self, key: str, field: str, value: str, index_key: str = None,
+                     score: float = None):
+        """
+        将hash记录放入写缓冲，由`flush`合并为一次pipeline写入redis。如果指定了index_key，
+        field同时以score写入该有序集合，以便按score进行范围查询。
+
+        缓冲区满flush_size条时立即安排写入，否则最迟在flush_interval毫秒后写入。扫描结束时
+        应该调用`flush`，以确保全部记录落库。
+        """
+        self._pending[key][field] = value
+        if index_key is not None:
+            self._pending_index[index_key][field] = score
+        self._pending_count += 1
+
+        if self._pending_count >= self.flush_size:
+            self._cancel_flush_timer()
+            asyncio.ensure_future(self._background_flush())
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_event_loop().call_later(
+                    self.flush_interval / 1000,
+                    lambda: asyncio.ensure_future(self._background_flush()))
+
+    async def _background_flush(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.exception(e)
+
+    def _cancel_flush_timer(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    async def flush(self):
+        """
+        将写缓冲中的记录及发生变化的记忆写入redis。写入失败时，记录被放回写缓冲，等待下一次
+        flush重试
+        """
+        self._cancel_flush_timer()
+
+        pending, self._pending = self._pending, defaultdict(dict)
+        index, self._pending_index = self._pending_index, defaultdict(dict)
+        count, self._pending_count = self._pending_count, 0
+        if len(pending):
+            with metrics.timer("alpha_stage_seconds", plot=self.name, stage="flush"):
+                pl = cache.sys.pipeline()
+                for key, mapping in pending.items():
+                    pl.hmset_dict(key, mapping)
+                for key, members in index.items():
+                    pairs = [item for member, score in members.items()
+                             for item in (score, member)]
+                    pl.zadd(key, *pairs)
+
+                try:
+                    await pl.execute()
+                except Exception:
+                    self._restore_pending(pending, index, count)
+                    raise
+            metrics.inc("alpha_redis_writes_total", count, plot=self.name)
+            logger.debug("%s: %s records flushed", self.name, count)
+
+        await self.memory.flush()
+
+    def _restore_pending(self, pending: dict, index: dict, count: int):
+        """
+        将写入失败的记录合并回写缓冲。等待期间同一field又写入的新值优先
+        """
+        for key, mapping in pending.items():
+            self._pending[key] = {**mapping, **self._pending[key]}
+        for key, members in index.items():
+            self._pending_index[key] = {**members, **self._pending_index[key]}
+        self._pending_count += count
+
+    def pool_key(self, frame_type: FrameType = None) -> str:
+        """
+        股票池记录保存在hash `plots.{name}.pool`中，field为`{frame}:{code}`；同时按周期建立
+        有序集合`plots.{name}.pool.{frame_type}`作为时间索引，其score为frame的整数形式
+        """
+        if frame_type is None:
+            return f"plots.{self.name}.pool"
+
+        return f"plots.{self.name}.pool.{frame_type.value}"
+
+    async def query_pool(self, frame_type: FrameType, start: int = None,
+                         end: int = None, after: str = None,
+                         count: int = None) -> List[Tuple[int, str, dict]]:
+        """
+        通过时间索引查询frame_type周期上[start, end]间进入股票池的记录
+        Args:
+            frame_type:
+            start: 整数形式的frame，None表示不限
+            end: 整数形式的frame，None表示不限
+            after: 只返回排在该记录(`{frame}:{code}`)之后的记录，用于分页
+            count: 最多返回的记录数，None表示不限
+
+        Returns:
+            按(frame, code)升序排列的(frame, code, record)列表
+        """
+        key = self.pool_key(frame_type)
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+
+        rank = None
+        if after is not None:
+            rank = await cache.sys.zrank(key, after)
+
+        if after is not None and rank is None:
+            # after已被删除，只能取出其后的全部记录再过滤
+            start = max(start, int(after.split(":")[0]))
+            fields = await cache.sys.zrangebyscore(key, start, end)
+            fields = [field for field in fields
+                      if self._pool_order(field) > self._pool_order(after)]
+            fields = fields[:count]
+        elif rank is not None or count is not None:
+            offset = 0
+            if rank is not None:
+                below = await cache.sys.zcount(key, float('-inf'), start,
+                                               exclude=cache.sys.ZSET_EXCLUDE_MAX)
+                offset = max(0, rank + 1 - below)
+
+            fields = await cache.sys.zrangebyscore(key, start, end, offset=offset,
+                                                   count=-1 if count is None else count)
+        else:
+            fields = await cache.sys.zrangebyscore(key, start, end)
+
+        if len(fields) == 0:
+            return []
+
+        values = await cache.sys.hmget(self.pool_key(), *fields)
+
+        results = []
+        for field, value in zip(fields, values):
+            if value is None:
+                continue
+
+            iframe, code = field.split(":")
+            results.append((int(iframe), code, json.loads(value)))
+
+        return results
+
+    @staticmethod
+    def _pool_order(field: str):
+        frame, code = field.split(":")
+        return int(frame), code
+
+    async def expire_pool(self, days: int = None):
+        """
+        删除days天前进入股票池的记录
+        """
+        days = days or cfg.alpha.pool.retention
+        cutoff = tf.day_shift(arrow.now(tz=cfg.tz).date(), -days)
+
+        removed = 0
+        for frame_type in itertools.chain(tf.day_level_frames, tf.minute_level_frames):
+            if frame_type in tf.day_level_frames:
+                icutoff = tf.date2int(cutoff)
+            else:
+                icutoff = tf.date2int(cutoff) * 10000
+
+            key = self.pool_key(frame_type)
+            fields = await cache.sys.zrangebyscore(key, float('-inf'), icutoff,
+                                                   exclude=cache.sys.ZSET_EXCLUDE_MAX)
+            if len(fields) == 0:
+                continue
+
+            pl = cache.sys.pipeline()
+            pl.hdel(self.pool_key(), *fields)
+            pl.zrem(key, *fields)
+            await pl.execute()
+            removed += len(fields)
+
+        logger.info("%s: %s pool records before %s removed", self.name, removed, cutoff)
+        return removed
+
+    async def rebuild_pool_index(self):
+        """
+        根据股票池hash重建时间索引。用于为建立索引之前的历史记录补建索引
+
+        只向索引中添加（ZADD是幂等的），不清空已有的索引，因此读取hash之后由写缓冲写入的
+        索引项不会丢失
+        """
+        recs = await cache.sys.hgetall(self.pool_key())
+
+        index = defaultdict(dict)
+        for field, value in recs.items():
+            frame_type = FrameType(json.loads(value).get("frame_type"))
+            index[frame_type][field] = int(field.split(":")[0])
+
+        if len(index) == 0:
+            return {}
+
+        tr = cache.sys.multi_exec()
+        for frame_type, members in index.items():
+            tr.zadd(self.pool_key(frame_type),
+                    *[item for field, score in members.items()
+                      for item in (score, field)])
+        await tr.execute()
+
+        return {frame_type.value: len(members) for frame_type, members in index.items()}
 
     async def enter_stock_pool(self, code, frame, frame_type: FrameType, **kwargs):
         if frame_type in tf.day_level_frames:
@@ -73,9 +392,8 @@ class BasePlot:
             iframe = tf.time2int(frame)
 
         kwargs.update({"frame_type": frame_type.value})
-        await cache.sys.hset(f"plots.{self.name}.pool",
-                             f"{iframe}:{code}",
-                             json.dumps(kwargs))
+        self.write_behind(self.pool_key(), f"{iframe}:{code}", json.dumps(kwargs),
+                          index_key=self.pool_key(frame_type), score=iframe)
 
         await mm.evaluate('momentum', {
             "name": 'frame',
@@ -91,7 +409,8 @@ class BasePlot:
             "plot":      self.name,
             "plot_name": self.display_name
         })
-        await emit.emit(Events.plot_pool, kwargs)
+        with metrics.timer("alpha_emit_seconds", event=Events.plot_pool):
+            await emit.emit(Events.plot_pool, kwargs)
 
     async def fire_trade_signal(self, flag: str, code: str, fire_on: Frame,
                                 frame_type: FrameType,
@@ -114,8 +433,7 @@ class BasePlot:
         event.update(kwargs)
 
         logger.info("%s", event.values())
-        await emit.emit(Events.sig_trade, kwargs)
-        d = {
-            f"{code}:{fire_on}": json.dumps(kwargs)
-        }
-        await cache.sys.hmset_dict(f"plots.{self.name}.fired", d)
+        with metrics.timer("alpha_emit_seconds", event=Events.sig_trade):
+            await emit.emit(Events.sig_trade, kwargs)
+        self.write_behind(f"plots.{self.name}.fired", f"{code}:{fire_on}",
+                          json.dumps(kwargs))
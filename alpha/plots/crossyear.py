@@ -19,8 +19,9 @@ from omicron.models.securities import Securities
 from omicron.models.security import Security
 from pyemit import emit
 
-from alpha.core import signal, features
+from alpha.core import signal
 from alpha.plots.baseplot import BasePlot
+from alpha.plots.scanner import scan_progress
 
 logger = logging.getLogger(__name__)
 
@@ -140,81 +141,86 @@ class CrossYear(BasePlot):
 
         """
         win = 20
-        secs = Securities()
-        end = end or tf.floor(arrow.now(), FrameType.DAY)
+        end = arrow.get(end).date() if end else tf.floor(arrow.now(), FrameType.DAY)
 
-        results = []
         holdings = await cache.sys.smembers("holdings")
-        for i, code in enumerate(secs.choose(['stock'])):
-            try:
-                if code in holdings:  # 如果已经持仓，则不跟踪评估
-                    continue
-
-                sec = Security(code)
-                if sec.code.startswith('688') or sec.display_name.find('ST') != -1:
-                    continue
-
-                start = tf.day_shift(end, -270)
-                bars = await sec.load_bars(start, end, FrameType.DAY)
-
-                close = bars['close']
-                ma5 = signal.moving_average(close, 5)
-                ma250 = signal.moving_average(close, 250)
-
-                cross, idx = signal.cross(ma5[-win:], ma250[-win:])
-                cross_day = bars[-win + idx]['frame']
-
-                if cross != 1:
-                    continue
-
-                ma20 = signal.moving_average(close, 20)
-                ma120 = signal.moving_average(close, 120)
-
-                # 如果上方还有月线和ma120线，则不发出信号，比如广州浪奇 2020-7-23,泛海控股2020-8-3
-                if close[-1] < ma120[-1] or close[-1] < ma20[-1]:
-                    continue
-
-                # 计算20日以来大阳次数。如果不存在大阳线，认为还未到上涨时机，跳过
-                grl, ggl = features.count_long_body(bars[-20:])
-                if grl == 0:
-                    continue
-
-                #
-                # # 计算突破以来净余买量（用阳线量减去阴线量来模拟,十字星不计入）
-                # bsc = bars[-10 + idx:]  # bars_since_open: included both side
-                # ups = bsc[bsc['close'] > (bsc['open'] * 1.01)]
-                # downs = bsc[bsc['open'] > (bsc['close'] * 0.99)]
-                # balance = np.sum(ups['volume']) - np.sum(downs['volume'])
-
-                # pc = await sec.price_change(cross_day, tf.day_shift(cross_day, 5),
-                #                             FrameType.DAY, return_max=True)
-
-                #
-                faf = int(win - idx)  # frames after fired
-                adv = await sec.price_change(tf.day_shift(end, -win), end,
-                                             FrameType.DAY, False)
-                if adv > adv_limit:
-                    continue
-
-                logger.info(f"{sec}上穿年线\t{cross_day}\t{faf}")
-                await cache.sys.hmset_dict("plots.crossyear", {code: json.dumps({
-                    "fired_at":  tf.date2int(end),
-                    "cross_day": tf.date2int(cross_day),
-                    "faf":       faf,
-                    "grl":       grl,
-                    "ggl":       ggl,
-                    "status":    0  # 0 - generated by plots 1 - disabled manually
-                })})
-                results.append(
-                        [sec.display_name, tf.date2int(end), tf.date2int(cross_day),
-                         faf, grl,
-                         ggl])
-            except Exception as e:
-                logger.exception(e)
-
-        logger.info("done crossyear scan.")
-        return results
+        candidates = []
+        for code in codes or Securities().choose(['stock']):
+            if code in holdings:  # 如果已经持仓，则不跟踪评估
+                continue
+
+            sec = Security(code)
+            if sec.code.startswith('688') or sec.display_name.find('ST') != -1:
+                continue
+
+            candidates.append(code)
+
+        progress = scan_progress.get()
+        if progress is not None:
+            progress.add_total(len(candidates))
+
+        # ma250的最后win个值需要250 + win - 1个bar。行情不足的（次新股、停牌）不参与扫描
+        n = 250 + win - 1
+        loaded = []
+        async for code, bars in Security.load_bars_batch(candidates, end, n,
+                                                         FrameType.DAY):
+            if progress is not None:
+                progress.advance()
+
+            if len(bars) == n:
+                loaded.append((code, bars))
+
+        if len(loaded) == 0:
+            return []
 
+        # 全部证券的均线、交叉及各项条件一次性计算
+        close = np.stack([bars['close'] for _, bars in loaded])
+        _open = np.stack([bars['open'][-20:] for _, bars in loaded])
+        mas = signal.moving_averages(close, [5, 20, 120, 250])
+        flags, indices = signal.cross_batch(mas[5][:, -win:], mas[250][:, -win:])
+
+        c0 = close[:, -1]
+        # 如果上方还有月线和ma120线，则不发出信号，比如广州浪奇 2020-7-23,泛海控股2020-8-3
+        covered = (c0 < mas[120][:, -1]) | (c0 < mas[20][:, -1])
+
+        # 计算20日以来大阳次数。如果不存在大阳线，认为还未到上涨时机，跳过
+        body = (close[:, -20:] - _open) / _open
+        grls = np.count_nonzero(body >= 0.07, axis=1)
+        ggls = np.count_nonzero(body <= -0.07, axis=1)
+
+        # win日涨幅直接由已加载的行情计算，不再单独请求price_change
+        adv = c0 / close[:, -win - 1] - 1
+
+        mask = (flags == 1) & ~covered & (grls > 0) & ~(adv > adv_limit)
+
+        results = []
+        for i in np.flatnonzero(mask):
+            code, bars = loaded[i]
+            sec = Security(code)
+            idx = indices[i]
+            cross_day = bars[-win + idx]['frame']
+            faf = int(win - idx)  # frames after fired
+            grl, ggl = int(grls[i]), int(ggls[i])
+
+            logger.info(f"{sec}上穿年线\t{cross_day}\t{faf}")
+            self.write_behind("plots.crossyear", code, json.dumps({
+                "fired_at":  tf.date2int(end),
+                "cross_day": tf.date2int(cross_day),
+                "faf":       faf,
+                "grl":       grl,
+                "ggl":       ggl,
+                "status":    0  # 0 - generated by plots 1 - disabled manually
+            }))
+            results.append([sec.display_name, tf.date2int(end), tf.date2int(cross_day),
+                            faf, grl, ggl])
+
+        if progress is not None:
+            progress.add_hits(results)
+
+        await self.flush()
+
+        logger.info("done crossyear scan: %s of %s hit", len(results), len(loaded))
+        return results
 
 cy = CrossYear()
 
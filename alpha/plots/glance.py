@@ -10,13 +10,11 @@ import logging
 
 import arrow
 import cfg4py
-import numpy as np
 from omicron.core.timeframe import tf
 from omicron.core.types import Frame, FrameType
-from omicron.models.securities import Securities
 from omicron.models.security import Security
 
-from alpha.core import signal
+from alpha.core import features, signal
 from alpha.plots.baseplot import BasePlot
 
 logger = logging.getLogger(__name__)
@@ -35,23 +33,8 @@ class Glance(BasePlot):
 
     async def price_change(self):
         # 涨停、跌停
-        zt, dt = 0, 0
-        codes = Securities().choose(['stock'])
         end = arrow.now(cfg.tz).floor('minute').datetime
-        pct = []
-        async for code, bars in Security.load_bars_batch(codes, end, 2, FrameType.DAY):
-            c1, c0 = bars[-2:]['close']
-            if (c0 + 0.01) / c1 - 1 > 0.1:
-                zt += 1
-            if (c0 - 0.01) / c1 - 1 < -0.1:
-                dt += 1
-
-            pct.append(c0 / c1 - 1)
-
-        # 分布
-        cuts = np.histogram(pct, bins=[-0.2, -0.1, -0.07, -0.03, 0, 0.03,
-                                       0.07, 0.1, 0.2])
-        return zt, dt, cuts
+        return await features.market_price_change(end)
 
     async def momentum(self, code: str, frame_type: FrameType):
         end = arrow.now(tz=cfg.tz).datetime
@@ -66,8 +49,7 @@ class Glance(BasePlot):
         err, (a, b, c), (vx, _) = signal.polyfit(ma5[-7:] / ma5[-7])
         err_baseline = 3e-3 if frame_type == FrameType.MIN30 else 6e-3
         if err < err_baseline:
-            p = np.poly1d((a, b, c))
-            y = p(9) / p(6) - 1
+            y = signal.poly_advance((a, b, c), 6, 9)
             details.append((y, vx, a, b, err))
             score += y
         else:
@@ -78,8 +60,7 @@ class Glance(BasePlot):
         err, (a, b, c), (vx, _) = signal.polyfit(ma10[-7:] / ma10[-7])
         err_baseline = 3e-3 if frame_type == FrameType.MIN30 else 6e-3
         if err < err_baseline:
-            p = np.poly1d((a, b, c))
-            y = p(9) / p(6) - 1
+            y = signal.poly_advance((a, b, c), 6, 9)
             details.append((y, vx, a, b, err))
             score += y * 2
         else:
@@ -90,8 +71,7 @@ class Glance(BasePlot):
         err, (a, b, c), (vx, _) = signal.polyfit(ma20[-7:] / ma20[-7])
         err_baseline = 3e-3 if frame_type == FrameType.MIN30 else 6e-3
         if err < err_baseline:
-            p = np.poly1d((a, b, c))
-            y = p(9) / p(6) - 1
+            y = signal.poly_advance((a, b, c), 6, 9)
             details.append((y, vx, a, b, err))
             score += y * 5
         else:
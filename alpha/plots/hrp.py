@@ -6,17 +6,17 @@ Author: Aaron-Yang [code@jieyu.ai]
 Contributors: 
 
 """
+import functools
 import logging
 from typing import Callable
 
-from omicron.core.timeframe import tf
 from omicron.core.types import Frame, FrameType
 from omicron.models.securities import Securities
 from omicron.models.security import Security
 import numpy as np
-from pandas import DataFrame
 
 from alpha.core import signal
+from alpha.plots.backtest import Backtest
 
 logger = logging.getLogger(__name__)
 
@@ -25,54 +25,57 @@ class Huierpu:
     600983,惠而浦，2020/3/20-2020-3-25期间，三次接近前低但不创新低（1.01，1.015，1.017),3.25
     当天拉起（盘中最低探明5日线），涨幅4%，上穿5日及10日均线，次日起连续4个涨停。
     """
-    async def fire_long(self, end:Frame, frame_type:FrameType.DAY, win=60, adv=0.03):
-        secs = Securities()
-        results = []
-        for code in secs.choose(['stock']):
-        #for code in ['601238.XSHG']:
+    def choose(self):
+        codes = []
+        for code in Securities().choose(['stock']):
             sec = Security(code)
             if sec.name.find("ST") != -1 or sec.code.startswith("688"):
                 continue
+            codes.append(code)
 
-            start = tf.shift(end, -win+1, frame_type)
-            bars = await sec.load_bars(start, end, frame_type)
-            ilow = np.argmin(bars['low'])
-            if ilow > win//2:#创新低及后面的反弹太近，信号不可靠
-                continue
+        return codes
 
-            low = bars['low'][ilow]
-            last = bars['low'][-5:]
-            if np.count_nonzero((last > low) & (last < low * 1.02)) < 3:
-                # 对新低的测试不够
-                continue
+    def check(self, code: str, bars: np.array, win=60, adv=0.03) -> bool:
+        ilow = np.argmin(bars['low'])
+        if ilow > win//2:#创新低及后面的反弹太近，信号不可靠
+            return False
 
-            c1,c0 = bars['close'][-2:]
-            # 今天上涨幅度是否大于adv?
-            if c0/c1- 1 < adv:
-                continue
-            # 是否站上5日线10日线？
-            ma5 = signal.moving_average(bars['close'], 5)
-            ma10 = signal.moving_average(bars['close'], 10)
-
-            if c0 < ma5[-1] or c0 < ma10[-1]: continue
-
-            price_change = await sec.price_change(end, tf.day_shift(end, 5), frame_type)
-            print(f"FIRED:{end}\t{code}\t{price_change:.2f}")
-            results.append([end, code, price_change])
-
-        return results
-
-    async def scan(self, start: Frame, end: Frame, signal_func: Callable,
-                   frame_type: FrameType = FrameType.DAY):
-        frames = tf.get_frames(start, end, frame_type)
-        results = []
-        for frame in frames:
-            if frame_type in tf.day_level_frames:
-                frame = tf.int2date(frame)
-            else:
-                frame = tf.int2time(frame)
-            result = await signal_func(frame, frame_type=frame_type,win=60,adv=0.0)
-            results.extend(result)
-
-        df = DataFrame(data=results, columns=['date','code','pc'])
-        df.to_csv("/tmp/hrp.csv")
\ No newline at end of file
+        low = bars['low'][ilow]
+        last = bars['low'][-5:]
+        if np.count_nonzero((last > low) & (last < low * 1.02)) < 3:
+            # 对新低的测试不够
+            return False
+
+        c1,c0 = bars['close'][-2:]
+        # 今天上涨幅度是否大于adv?
+        if c0/c1- 1 < adv:
+            return False
+        # 是否站上5日线10日线？
+        mas = signal.moving_averages(bars['close'], [5, 10])
+        ma5, ma10 = mas[5], mas[10]
+
+        return not (c0 < ma5[-1] or c0 < ma10[-1])
+
+    async def fire_long(self, end:Frame, frame_type:FrameType.DAY, win=60, adv=0.03):
+        check = functools.partial(self.check, win=win, adv=adv)
+
+        bt = Backtest(end, end, frame_type, win, horizons=(5,))
+        df = await bt.run(check, self.choose())
+        for row in df.itertuples():
+            print(f"FIRED:{end}\t{row.code}\t{row.ret_5:.2f}")
+
+        return df
+
+    async def scan(self, start: Frame, end: Frame, signal_func: Callable = None,
+                   frame_type: FrameType = FrameType.DAY, win=60):
+        """
+        在[start, end]间回测signal_func(默认为adv=0的`self.check`)，结果中的ret_5为信号
+        发出后5个周期的涨幅
+        """
+        signal_func = signal_func or functools.partial(self.check, win=win, adv=0.0)
+
+        bt = Backtest(start, end, frame_type, win, horizons=(5,))
+        df = await bt.run(signal_func, self.choose())
+        df.to_csv("/tmp/hrp.csv")
+
+        return df
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+在后台执行plot的长耗时命令（比如scan）。
+
+提交后立即返回job id，命令在独立的asyncio task中执行。执行过程中，`scan_market`通过
+`scan_progress`找到当前的job并更新进度，调用方可以随时查询进度及已经产生的部分结果。相同
+(plot, cmd, params, frame)的命令只执行一次，结果在frame结束前被复用。
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+import arrow
+import cfg4py
+from omicron.core.timeframe import tf
+from omicron.core.types import FrameType
+from pandas import DataFrame
+
+from alpha.plots import create_plot
+from alpha.plots.scanner import scan_progress
+
+logger = logging.getLogger(__name__)
+cfg = cfg4py.get_instance()
+
+# 最多保留的job数，超过时淘汰最早提交的已结束的job
+MAX_JOBS = 64
+
+# 状态查询中最多返回的部分结果条数
+MAX_PARTIAL = 1000
+
+
+class ScanJob:
+    def __init__(self, plot: str, cmd: str, params: dict, key: str):
+        self.id = uuid.uuid4().hex
+        self.plot = plot
+        self.cmd = cmd
+        self.params = params
+        self.key = key
+
+        self.status = "pending"
+        self.total = 0
+        self.done = 0
+        self.hits = 0
+        self.partial = []
+        self.result = None
+        self.error = None
+
+        self.started = None
+        self.ended = None
+        self.task = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def add_total(self, n: int):
+        self.total += n
+
+    def advance(self, result: Any = None):
+        """
+        完成一支证券的扫描。result不为None时表示命中
+        """
+        self.done += 1
+        if result is not None:
+            self.hits += 1
+            if len(self.partial) < MAX_PARTIAL:
+                self.partial.append(result)
+
+    def add_hits(self, results: list):
+        self.hits += len(results)
+        self.partial.extend(results[:MAX_PARTIAL - len(self.partial)])
+
+    def to_dict(self, with_result: bool = True) -> dict:
+        d = {
+            "job_id":  self.id,
+            "plot":    self.plot,
+            "cmd":     self.cmd,
+            "params":  self.params,
+            "status":  self.status,
+            "total":   self.total,
+            "done":    self.done,
+            "hits":    self.hits,
+            "started": self.started,
+            "ended":   self.ended,
+            "error":   self.error
+        }
+
+        if with_result:
+            d["result"] = self.result if self.finished else self.partial
+
+        return d
+
+
+_jobs = OrderedDict()
+
+# (plot, cmd, params, frame) -> job_id
+_results = {}
+
+
+def _make_key(plot: str, cmd: str, params: dict) -> str:
+    """
+    以(plot, cmd, params, frame)作为结果缓存的key。未指定end时，frame为frame_type的当前周期，
+    因此同一周期内重复提交的命令会复用已有的结果
+    """
+    frame_type = FrameType(params.get("frame_type", FrameType.DAY.value))
+    frame = params.get("end") or tf.floor(arrow.now(tz=cfg.tz), frame_type)
+
+    return json.dumps([plot, cmd, params, str(frame)], sort_keys=True, default=str)
+
+
+def _to_json(result: Any):
+    if isinstance(result, DataFrame):
+        return result.to_dict("records")
+
+    return result
+
+
+async def _run(job: ScanJob):
+    # task拥有独立的context，这里的设置只对本job（及其创建的task）可见
+    scan_progress.set(job)
+
+    job.status = "running"
+    job.started = time.time()
+    try:
+        plot = create_plot(job.plot)
+        job.result = _to_json(await getattr(plot, job.cmd)(**job.params))
+        job.status = "done"
+    except Exception as e:
+        logger.exception(e)
+        job.error = str(e)
+        job.status = "failed"
+        _results.pop(job.key, None)
+    finally:
+        job.ended = time.time()
+        logger.info("job %s(%s.%s) %s in %.1f secs, %s/%s handled, %s hits", job.id,
+                    job.plot, job.cmd, job.status, job.ended - job.started, job.done,
+                    job.total, job.hits)
+
+
+def _evict():
+    for job_id in list(_jobs.keys()):
+        if len(_jobs) <= MAX_JOBS:
+            break
+
+        job = _jobs[job_id]
+        if job.finished:
+            del _jobs[job_id]
+            if _results.get(job.key) == job_id:
+                del _results[job.key]
+
+
+def submit(plot: str, cmd: str, params: dict) -> ScanJob:
+    """
+    在后台执行`plot.cmd(**params)`。如果相同的命令正在执行或者已经有结果，直接返回该job
+    """
+    if create_plot(plot) is None:
+        raise ValueError(f"plot {plot} is not registered")
+
+    key = _make_key(plot, cmd, params)
+    job_id = _results.get(key)
+    if job_id in _jobs:
+        return _jobs[job_id]
+
+    job = ScanJob(plot, cmd, params, key)
+    _jobs[job.id] = job
+    _results[key] = job.id
+    _evict()
+
+    job.task = asyncio.ensure_future(_run(job))
+    return job
+
+
+def get_job(job_id: str) -> Optional[ScanJob]:
+    return _jobs.get(job_id)
+
+
+def list_jobs() -> list:
+    return [job.to_dict(with_result=False) for job in _jobs.values()]
@@ -8,7 +8,8 @@ Contributors:
 """
 import datetime
 import logging
-from typing import Union
+from collections import defaultdict
+from typing import List, Union
 
 import arrow
 from omicron.models.security import Security
@@ -17,7 +18,7 @@ from alpha.core.monitors import mm
 from omicron.core.timeframe import tf
 from omicron.core.types import FrameType
 
-from alpha.core import signal
+from alpha.core.indicators import IndicatorState
 from alpha.plots.baseplot import BasePlot
 
 logger = logging.getLogger(__name__)
@@ -54,19 +55,22 @@ class MaLine(BasePlot):
         count += 1
         self.fired_times[key] = count
 
-        job = mm.find_job(self.name, code, flag, frame_type, win)
-        if job is None:
+        job_name = mm.find_job(self.name, code, flag, frame_type, win)
+        if job_name is None:
             logger.warning("job not found:%s, %s,%s,%s", self.name, code, flag,
                            frame_type)
+            return
+
         if count >= self.max_fire_time:
-            mm.remove(job_name=job.name)
+            await mm.remove(job_name=job_name)
             del self.fired_times[key]
-            logger.info("remove job %s due to reach max_fire_time(%s)", job.name, count)
+            logger.info("remove job %s due to reach max_fire_time(%s)", job_name, count)
+            return
 
         # disable job for code today, since it's fired
         start = tf.day_shift(arrow.now(), 1)
         start = datetime.datetime(start.year, start.month, start.day, 9, 31)
-        mm.reschedule_job(start, job.name)
+        mm.reschedule_job(start, job_name)
 
     async def evaluate(self, code: str, frame_type:Union[str, FrameType]='30m',
                        win:int=5, flag: str='both', slip: float = 0.015):
@@ -81,12 +85,41 @@ class MaLine(BasePlot):
 
         """
         frame_type = FrameType(frame_type)
-        bars = await self.get_bars(code, win, frame_type)
-        ma = signal.moving_average(bars['close'], win)
+        # 只需要均线，不需要拟合
+        state = await self.load_indicator(code, frame_type, win, fit_win=1)
+        await self._evaluate_state(code, state, frame_type, win, flag, slip)
 
-        c0 = bars[-1]['close']
-        if abs(c0 / ma[-1] - 1) <= slip:
-            await self.fire_trade_signal(flag, code, bars[-1]['frame'], frame_type,
+    async def evaluate_batch(self, params_list: List[dict]):
+        """
+        批量评估一组监控，每个(frame_type, win)的均线状态只需一次批量加载
+        """
+        groups = defaultdict(list)
+        for params in params_list:
+            groups[(params.get("frame_type", '30m'), params.get("win", 5))].append(params)
+
+        for (frame_type, win), members in groups.items():
+            frame_type = FrameType(frame_type)
+            states = await self.load_indicators([params["code"] for params in members],
+                                                frame_type, win, fit_win=1)
+            for params in members:
+                code = params["code"]
+                if code not in states:
+                    continue
+
+                try:
+                    await self._evaluate_state(code, states[code], frame_type, win,
+                                               params.get("flag", 'both'),
+                                               params.get("slip", 0.015))
+                except Exception as e:
+                    logger.exception(e)
+
+    async def _evaluate_state(self, code: str, state: IndicatorState,
+                              frame_type: FrameType, win: int, flag: str, slip: float):
+        if not state.ready:
+            return
+
+        if abs(state.close / state.ma - 1) <= slip:
+            await self.fire_trade_signal(flag, code, state.frame, frame_type,
                                          slip=slip, win=win)
             #await self.check_job_status(flag, code, frame_type, win)
 
@@ -200,7 +233,8 @@ class MaLine(BasePlot):
 
         return title_keys, job_info
 
-    def translate_monitor(self, job_name, params: dict, trigger: dict):
+    def translate_monitor(self, job_name, params: dict, trigger: dict,
+                          names: dict = None):
         _flag_map = {
             "both":  "双向监控",
             "long":  "做多信号",
@@ -225,7 +259,7 @@ class MaLine(BasePlot):
                 items['flag'] = _flag_map[v]
             elif k == "code":
                 items['代码'] = v.split(".")[0]
-                items['名称'] = Security(v).display_name
+                items['名称'] = names[v] if names else Security(v).display_name
             elif k == "frame_type":
                 items['周期'] = _frame_type_map[v]
             elif k == "win":
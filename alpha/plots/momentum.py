@@ -7,8 +7,9 @@ Contributors:
 
 """
 import datetime
-import json
 import logging
+import time
+from collections import defaultdict
 from typing import List, Union
 
 import arrow
@@ -16,13 +17,14 @@ import cfg4py
 import numpy as np
 from omicron.core.timeframe import tf
 from omicron.core.types import FrameType, Frame
-from omicron.dal import cache
 from omicron.models.securities import Securities
 from omicron.models.security import Security
 
-from alpha.core import signal
+from alpha.core import metrics, signal
+from alpha.core.indicators import IndicatorState
 from alpha.core.monitors import mm
 from alpha.plots.baseplot import BasePlot
+from alpha.plots.scanner import scan_progress
 
 logger = logging.getLogger(__name__)
 cfg = cfg4py.get_instance()
@@ -68,6 +70,25 @@ class Momentum(BasePlot):
                    end: Frame = None,
                    codes: List[str] = None):
         logger.info("running momentum scan at %s level", frame_type)
+        frame_type = FrameType(frame_type)
+        with metrics.timer("alpha_stage_seconds", plot=self.name, stage="scan",
+                           frame_type=frame_type.value):
+            hits = await self.screen(frame_type, end, codes)
+            with metrics.timer("alpha_stage_seconds", plot=self.name, stage="report",
+                               frame_type=frame_type.value):
+                await self.report(frame_type, hits)
+            await self.flush()
+
+    async def screen(self, frame_type: Union[str, FrameType] = FrameType.DAY,
+                     end: Frame = None,
+                     codes: List[str] = None) -> list:
+        """
+        加载行情并完成拟合、筛选，返回命中的股票。本方法不写入数据库，也不发出信号，因此可以
+        在独立的进程中运行，参见`alpha.plots.sharding`。
+
+        Returns:
+            list of (code, fired, c1, c0, err, a, b, vx, y)
+        """
         if end is None:
             end = arrow.now(cfg.tz).datetime
 
@@ -76,23 +97,37 @@ class Momentum(BasePlot):
         frame_type = FrameType(frame_type)
         ft = frame_type.value
         codes = codes or Securities().choose(['stock'])
+        labels = {"plot": self.name, "frame_type": ft}
+        metrics.inc("alpha_screen_items_total", len(codes), stage="scanned", **labels)
+
         day_bars = {}
-        async for code, bars in Security.load_bars_batch(codes, end, 2, FrameType.DAY):
-            day_bars[code] = bars
+        with metrics.timer("alpha_stage_seconds", stage="load_bars", **labels):
+            async for code, bars in Security.load_bars_batch(codes, end, 2,
+                                                             FrameType.DAY):
+                day_bars[code] = bars
 
         if len(day_bars) == 0:
-            return
+            return []
+
+        progress = scan_progress.get()
+        if progress is not None:
+            progress.add_total(len(codes))
 
+        # 批量加载是异步迭代，这里的计时包含了逐支计算ma5的时间
+        t0 = time.perf_counter()
+        candidates = []
         async for code, bars in Security.load_bars_batch(codes, end, 11, frame_type):
+            if progress is not None:
+                progress.advance()
+
             if len(bars) < 11:
                 continue
 
-            fired = bars[-1]['frame']
             day_bar = day_bars.get(code)
             if day_bar is None:
                 continue
 
-            c1, c0 = day_bars.get(code)[-2:]['close']
+            c1, c0 = day_bar[-2:]['close']
             cmin = min(bars['close'])
 
             # 还处在下跌状态、或者涨太多
@@ -100,39 +135,76 @@ class Momentum(BasePlot):
                 continue
 
             ma5 = signal.moving_average(bars['close'], 5)
-
-            err, (a, b, c), (vx, _) = signal.polyfit(ma5[-7:] / ma5[-7])
-            # 无法拟合，或者动能不足
-            if err > self.baseline(f"ma5:{ft}:err") or a < self.baseline(f"ma5:{ft}:a"):
-                continue
-
-            # 时间周期上应该是信号刚出现，还在窗口期内
-            vx_range = self.baseline(f"ma5:{ft}:vx")
-            if not vx_range[0] < vx < vx_range[1]:
-                continue
-
-            p = np.poly1d((a, b, c))
-            y = p(9) / p(6) - 1
-            # 如果预测未来三周期ma5上涨幅度不够
-            if y < self.baseline(f"ma5:{ft}:y"):
-                continue
-
-            sec = Security(code)
-
+            candidates.append((code, bars[-1]['frame'], c1, c0, ma5[-7:] / ma5[-7]))
+
+        metrics.observe("alpha_stage_seconds", time.perf_counter() - t0,
+                        stage="load_frame_bars", **labels)
+        metrics.inc("alpha_screen_items_total", len(candidates), stage="candidates",
+                    **labels)
+        if len(candidates) == 0:
+            return []
+
+        # 对全部候选股票的ma5一次性完成拟合
+        with metrics.timer("alpha_stage_seconds", stage="fit", **labels):
+            errs, coefs, vertices = signal.polyfit_batch([item[-1]
+                                                          for item in candidates])
+
+        # 无法拟合，或者动能不足的，以及不在窗口期内（信号应该刚出现）的，均排除
+        vx_range = self.baseline(f"ma5:{ft}:vx")
+        mask = (errs <= self.baseline(f"ma5:{ft}:err")) & \
+               (coefs[:, 0] >= self.baseline(f"ma5:{ft}:a")) & \
+               (vertices[:, 0] > vx_range[0]) & (vertices[:, 0] < vx_range[1])
+
+        metrics.inc("alpha_screen_items_total", np.count_nonzero(mask), stage="fitted",
+                    **labels)
+
+        # 预测未来三周期ma5的涨幅，上涨幅度不够的排除
+        ys = np.full(len(candidates), np.nan)
+        ys[mask] = signal.poly_advance(coefs[mask], 6, 9)
+        mask &= ys >= self.baseline(f"ma5:{ft}:y")
+
+        hits = []
+        for i in np.flatnonzero(mask):
+            code, fired, c1, c0, _ = candidates[i]
+            err, vx = errs[i], vertices[i][0]
+            a, b = coefs[i][:2]
+            hits.append((code, fired, c1, c0, err, a, b, vx, ys[i]))
+
+        if frame_type == FrameType.DAY and len(hits):
+            # 对通过筛选的股票一次性加载250个bar，而不是每支股票单独加载一次
+            long_mas = {}
+            with metrics.timer("alpha_stage_seconds", stage="load_long_bars", **labels):
+                async for code, bars in Security.load_bars_batch(
+                        [hit[0] for hit in hits], end, 250, frame_type):
+                    if len(bars) < 250:
+                        continue
+
+                    mas = signal.moving_averages(bars['close'], [60, 120, 250])
+                    long_mas[code] = (mas[60][-1], mas[120][-1], mas[250][-1])
+
+            # 上方无均线压制
+            hits = [hit for hit in hits
+                    if hit[0] in long_mas and hit[3] > max(long_mas[hit[0]])]
+
+        metrics.inc("alpha_screen_items_total", len(hits), stage="hits", **labels)
+        if progress is not None:
+            progress.add_hits(hits)
+
+        return hits
+
+    async def report(self, frame_type: FrameType, hits: list):
+        """
+        将`screen`的结果加入股票池，或者发出交易信号
+        """
+        frame_type = FrameType(frame_type)
+        for code, fired, c1, c0, err, a, b, vx, y in hits:
             if frame_type == FrameType.DAY:
-                start = tf.shift(tf.floor(end, frame_type), -249, frame_type)
-                bars250 = await sec.load_bars(start, end, frame_type)
-                ma60 = signal.moving_average(bars250['close'], 60)
-                ma120 = signal.moving_average(bars250['close'], 120)
-                ma250 = signal.moving_average(bars250['close'], 250)
-
-                # 上方无均线压制
-                if (c0 > ma60[-1]) and (c0 > ma120[-1]) and (c0 > ma250[-1]):
-                    logger.info("%s, %s, %s, %s, %s, %s", sec, round(a, 4), round(b, 4),
-                                round(vx, 1), round(c0 / c1 - 1, 3), round(y, 3))
-                    await self.enter_stock_pool(code, fired, frame_type,
-                                                a=a, b=b, err=err, y=y,
-                                                vx=self.fit_win - vx)
+                logger.info("%s, %s, %s, %s, %s, %s", Security(code), round(a, 4),
+                            round(b, 4), round(vx, 1), round(c0 / c1 - 1, 3),
+                            round(y, 3))
+                await self.enter_stock_pool(code, fired, frame_type,
+                                            a=a, b=b, err=err, y=y,
+                                            vx=self.fit_win - vx)
             elif frame_type == FrameType.WEEK:
                 await self.enter_stock_pool(code, fired, frame_type, a=a, b=b, err=err,
                                             y=y, vx=self.fit_win - vx)
@@ -187,8 +259,7 @@ class Momentum(BasePlot):
                 plt.plot(_ma, color=colors[f"{win}"])
 
                 err, (a, b, c), (vx, _) = signal.polyfit(_ma / _ma[0])
-                p = np.poly1d((a * _ma[0], b * _ma[0], c * _ma[0]))
-                y = p(fit_win + 2) / p(fit_win - 1) - 1
+                y = signal.poly_advance((a, b, c), fit_win - 1, fit_win + 2)
 
                 y_lim = max(y_lim, np.max(_ma))
                 if win == 5:
@@ -196,13 +267,12 @@ class Momentum(BasePlot):
 
                 if err < self.baseline(f"ma{win}:{frame_type.value}:err"):
                     # 如果拟合在误差范围内，则画出拟合线
-                    plt.plot([p(i) for i in range(len(_ma))], "--",
-                             color=colors[f"{win}"])
-                    plt.plot([p(i) for i in range(len(_ma))], "o",
-                             color=colors[f"{win}"])
+                    curve = signal.polyval((a, b, c), np.arange(len(_ma))) * _ma[0]
+                    plt.plot(curve, "--", color=colors[f"{win}"])
+                    plt.plot(curve, "o", color=colors[f"{win}"])
 
                     if 0 < vx < fit_win:
-                        plt.plot([vx], p(vx), 'x')
+                        plt.plot([vx], signal.polyval((a, b, c), vx) * _ma[0], 'x')
 
             plt.plot(0, y_lim * 1.035)
             plt.text(0.1, y_lim * 1.02, text, color='r')
@@ -258,21 +328,53 @@ class Momentum(BasePlot):
         """
         stop = arrow.get(dt, tzinfo=cfg.tz) if dt else arrow.now(tz=cfg.tz)
         frame_type = FrameType(frame_type)
-        ft = frame_type.value
 
-        bars = await self.get_bars(code, win + self.fit_win, frame_type, stop)
+        state = await self.load_indicator(code, frame_type, win, self.fit_win, stop)
+        await self._evaluate_state(code, state, frame_type, stop, win, flag)
 
-        ma = signal.moving_average(bars['close'], win)
-        _ma = ma[-self.fit_win:]
-        err, (a, b, c), (vx, _) = signal.polyfit(_ma / _ma[0])
+    async def evaluate_batch(self, params_list: List[dict]):
+        """
+        批量评估一组监控。监控按(frame_type, win, dt)分组，每组的均线状态通过
+        `load_indicators`批量加载，然后逐个判断是否发出信号。
+        """
+        groups = defaultdict(list)
+        for params in params_list:
+            key = (params.get("frame_type", '30m'), params.get("win", 5),
+                   params.get("dt"))
+            groups[key].append(params)
+
+        for (frame_type, win, dt), members in groups.items():
+            stop = arrow.get(dt, tzinfo=cfg.tz) if dt else arrow.now(tz=cfg.tz)
+            frame_type = FrameType(frame_type)
+
+            codes = [params["code"] for params in members]
+            states = await self.load_indicators(codes, frame_type, win, self.fit_win,
+                                                stop.datetime)
+            for params in members:
+                code = params["code"]
+                if code not in states:
+                    continue
+
+                try:
+                    await self._evaluate_state(code, states[code], frame_type, stop, win,
+                                               params.get("flag", 'long'))
+                except Exception as e:
+                    logger.exception(e)
+
+    async def _evaluate_state(self, code: str, state: IndicatorState,
+                              frame_type: FrameType, stop: Frame, win: int, flag: str):
+        if not state.ready:
+            return
+
+        ft = frame_type.value
+        err, (a, b, c), (vx, _) = state.fit()
 
         logger.debug("%s, %s, %s, %s, %s", code, err, a, b, vx)
         if err > self.baseline(f"ma{win}:{ft}:err"):
             self.remember(code, frame_type, "trend", "dunno")
             return
 
-        p = np.poly1d((a, b, c))
-        y = p(self.fit_win + 2) / p(self.fit_win - 1) - 1
+        y = signal.poly_advance((a, b, c), self.fit_win - 1, self.fit_win + 2)
 
         previous_status = self.recall(code, frame_type, "trend")
 
@@ -325,36 +427,60 @@ class Momentum(BasePlot):
 
         return features
 
-    async def list_stock_pool(self, frames: int, frame_types: List[FrameType] = None):
-        key = "plots.momentum.pool"
+    async def list_stock_pool(self, frames: int, frame_types: List[FrameType] = None,
+                              cursor: str = None, limit: int = None):
+        """
+        列出最近frames个周期内进入股票池的股票。
 
-        recs = await cache.sys.hgetall(key)
-        items = []
+        如果指定了limit，则至多返回limit条记录，结果中的cursor用于取下一页，为None时表示已
+        没有更多记录。cursor的格式为`{frame_type}:{frame}:{code}`。
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be at least 1: {limit}")
+
+        frame_types = frame_types or tf.day_level_frames + tf.minute_level_frames
+
+        after_ft, after = None, None
+        if cursor:
+            try:
+                after_ft, after = cursor.split(":", 1)
+                after_ft = FrameType(after_ft)
+                frame_types = frame_types[frame_types.index(after_ft):]
+                frame, code = after.split(":", 1)
+                int(frame)
+            except ValueError:
+                raise ValueError(f"invalid cursor: {cursor}")
+
+        rows = []
         now = arrow.now()
-        for k, v in recs.items():
-            frame, code = k.split(":")
-
-            sec = Security(code)
-            v = json.loads(v)
-
-            frame_type = FrameType(v.get("frame_type"))
-
-            if frame_type not in frame_types:
-                continue
+        for frame_type in frame_types:
+            remaining = None if limit is None else limit - len(rows)
+            if remaining == 0:
+                break
 
             latest_frame = tf.floor(now, frame_type)
             start = tf.shift(latest_frame, -frames, frame_type)
 
-            fired = tf.int2time(frame) if frame_type in tf.minute_level_frames else \
-                tf.int2date(frame)
+            if frame_type in tf.minute_level_frames:
+                istart, convert = tf.time2int(start), tf.int2time
+            else:
+                istart, convert = tf.date2int(start), tf.int2date
 
-            if fired < start:
-                continue
+            recs = await self.query_pool(frame_type, istart,
+                                         after=after if frame_type == after_ft else None,
+                                         count=remaining)
+            rows.extend((frame_type, convert, rec) for rec in recs)
+
+        # 同一页中的股票名称只查询一次
+        names = {code: Security(code).display_name for code in
+                 {code for _, _, (_, code, _) in rows}}
 
+        items = []
+        for frame_type, convert, (frame, code, v) in rows:
             items.append({
-                "name":  sec.display_name,
+                "name":  names[code],
                 "code":  code,
-                "fired": str(fired),
+                "fired": str(convert(frame)),
                 "frame": frame_type.value,
                 "y":     round(v.get("y"), 2),
                 "vx":    round(v.get("vx"), 1),
@@ -363,10 +489,16 @@ class Momentum(BasePlot):
                 "err":   round(v.get("err"), 4)
             })
 
+        next_cursor = None
+        if limit is not None and len(rows) == limit:
+            frame_type, _, (frame, code, _) = rows[-1]
+            next_cursor = f"{frame_type.value}:{frame}:{code}"
+
         return {
             "name":    self.display_name,
             "plot":    self.name,
             "items":   items,
+            "cursor":  next_cursor,
             "headers": [
                 {
                     "text":  '名称',
@@ -408,7 +540,8 @@ class Momentum(BasePlot):
             ]
         }
 
-    def translate_monitor(self, job_name, params: dict, trigger: dict):
+    def translate_monitor(self, job_name, params: dict, trigger: dict,
+                          names: dict = None):
         _flag_map = {
             "both":  "双向监控",
             "long":  "做多信号",
@@ -434,7 +567,7 @@ class Momentum(BasePlot):
                     items['监控方向'] = _flag_map[v]
                 elif k == "code":
                     items['代码'] = v.split(".")[0]
-                    items['名称'] = Security(v).display_name
+                    items['名称'] = names[v] if names else Security(v).display_name
                 elif k == "frame_type":
                     items['周期'] = _frame_type_map[v]
                 elif k == "win":
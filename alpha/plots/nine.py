@@ -8,6 +8,8 @@ Contributors:
 """
 import logging
 
+import arrow
+import cfg4py
 import numpy as np
 from omicron.core.timeframe import tf
 from omicron.core.types import Frame, FrameType
@@ -18,8 +20,10 @@ from pyemit import emit
 from alpha.core import signal
 from alpha.core.enums import Events
 from alpha.plots.baseplot import BasePlot
+from alpha.plots.scanner import scan_market
 
 logger = logging.getLogger(__name__)
+cfg = cfg4py.get_instance()
 
 
 class NinePlot(BasePlot):
@@ -43,8 +47,7 @@ class NinePlot(BasePlot):
         ma = signal.moving_average(bars['close'], ma_win)
 
         err, (a, b, c), (vx, _) = signal.polyfit(ma[-7:] / ma[-7])
-        p = np.poly1d((a, b, c))
-        if (p(11) / p(6) - 1) / 5 < slp:
+        if signal.poly_advance((a, b, c), 6, 11) / 5 < slp:
             return
 
         sec = Security(code)
@@ -59,8 +62,7 @@ class NinePlot(BasePlot):
         bars = await sec.load_bars(start, end, frame_type)
         ma = signal.moving_average(bars['close'], ma_win)
         err, (a, b, c), (vx, _) = signal.polyfit(ma[-fit_win:] / ma[-fit_win])
-        p = np.poly1d((a, b, c))
-        slp3 = p(fit_win + 2) / p(fit_win - 1) - 1
+        slp3 = signal.poly_advance((a, b, c), fit_win - 1, fit_win + 2)
         print(f"{sec.display_name}({code})\t{err:.4f}\t{a:.4f}\t{b:.4f}\t{vx:.1f}\
         \t{slp3:.2f}")
         self.ref_lines[f"ma{ma_win}"] = {
@@ -83,20 +85,14 @@ class NinePlot(BasePlot):
             a, b = self.ref_lines[f"ma{ma_win}"].get("coef")
 
         fit_win = 7
-        secs = Securities()
-        p = np.poly1d((a, b, 1.0))
-        slp3 = p(fit_win - 1 + 3) / p(fit_win - 1) - 1
-        count = 0
-        for i, code in enumerate(secs.choose(['stock'])):
-            if (i + 1) % 500 == 0:
-                logger.debug("handled %s", i+1)
-            sec = Security(code)
+        slp3 = signal.poly_advance((a, b, 1.0), fit_win - 1, fit_win - 1 + 3)
 
-            bars = await self.get_bars(code, fit_win + 19, frame_type, end)
+        def check(code, bars):
+            sec = Security(code)
             ma = signal.moving_average(bars['close'], ma_win)
             err_, (a_, b_, c_), (vx_, _) = signal.polyfit(ma[-fit_win:] / ma[-fit_win])
             if err_ > err:
-                continue
+                return None
 
             #p_ = np.poly1d((a_,b_,1.0))
             # 如果abs(b) < fit_win * a，曲线（在x不超过fit_win的地方）接近于直线，此时应该比较b
@@ -134,6 +130,13 @@ class NinePlot(BasePlot):
             #            (t20 is None and t10)):
             #     print(f"{sec.display_name}, {[t5, t10, t20]}")
 
+            return code if t5 else None
+
+        end = end or arrow.now(tz=cfg.tz)
+        start = tf.shift(tf.floor(end, frame_type), -(fit_win + 19) + 1, frame_type)
+        return await scan_market(check, Securities().choose(['stock']), start, end,
+                                 frame_type)
+
     async def scan(self,stop:Frame=None):
         start = tf.shift(stop, -26, FrameType.WEEK)
         ERR = {
@@ -142,12 +145,10 @@ class NinePlot(BasePlot):
             20: 0.004
         }
 
-        for code in Securities().choose(['stock']):
-        #for code in ['002150.XSHE']:
+        def check(code, bars):
             sec = Security(code)
-            bars = await sec.load_bars(start, stop, FrameType.WEEK)
             if bars[-1]['frame'] != stop:
-                raise ValueError("")
+                raise ValueError(f"{sec} has no bar at {stop}")
 
             t1, t2, t3 = False, False, False
             params = []
@@ -157,8 +158,7 @@ class NinePlot(BasePlot):
                 if err > ERR[win]:
                     continue
 
-                p = np.poly1d((a, b, c))
-                slp3 = round(p(9) / p(6) - 1, 2)
+                slp3 = round(signal.poly_advance((a, b, c), 6, 9), 2)
 
                 params.append(np.round([slp3, a, b], 4))
                 if win == 5:
@@ -170,3 +170,7 @@ class NinePlot(BasePlot):
 
             if all([t1, t2, t3]):
                 print(sec.display_name, params)
+                return code, params
+
+        return await scan_market(check, Securities().choose(['stock']), start, stop,
+                                 FrameType.WEEK)
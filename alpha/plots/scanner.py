@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Callable, List
+
+from omicron.core.types import Frame, FrameType
+
+from alpha.core import barcache
+
+logger = logging.getLogger(__name__)
+
+# 同时在途的load_bars请求数
+DEFAULT_CONCURRENCY = 32
+
+# 当前正在执行的后台job（参见`alpha.plots.jobs`），scan_market通过它报告进度
+scan_progress = contextvars.ContextVar("scan_progress", default=None)
+
+
+async def scan_market(handler: Callable[[str, Any], Any], codes: List[str],
+                      start: Frame, end: Frame, frame_type: FrameType,
+                      concurrency: int = DEFAULT_CONCURRENCY) -> list:
+    """
+    全市场扫描的驱动程序。
+
+    由至多concurrency个worker并发地为codes加载[start, end]间的bars，每加载完一支证券，即调用
+    handler(code, bars)。handler可以是普通函数，也可以是协程函数，返回None表示该证券未命中，
+    否则其返回值将被收集到结果列表中。单个证券的异常只记录日志，不会中断整个扫描。
+
+    Args:
+        handler: 对每支证券的判断函数
+        codes: 待扫描的证券列表
+        start:
+        end:
+        frame_type:
+        concurrency: worker数量
+
+    Returns:
+        handler返回的非None结果列表，顺序为完成顺序
+    """
+    queue = asyncio.Queue()
+    for code in codes:
+        queue.put_nowait(code)
+
+    results = []
+    stats = {"done": 0, "failed": 0}
+
+    progress = scan_progress.get()
+    if progress is not None:
+        progress.add_total(len(codes))
+
+    async def worker():
+        while True:
+            try:
+                code = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            hit = None
+            try:
+                bars = await barcache.load_bars(code, start, end, frame_type)
+                result = handler(code, bars)
+                if asyncio.iscoroutine(result):
+                    result = await result
+
+                if result is not None:
+                    results.append(result)
+                    hit = result
+            except Exception as e:
+                stats["failed"] += 1
+                logger.warning("failed to scan %s: %s", code, e)
+            finally:
+                if progress is not None:
+                    progress.advance(hit)
+                stats["done"] += 1
+                if stats["done"] % 500 == 0:
+                    logger.debug("handled %s/%s", stats["done"], len(codes))
+
+    t0 = time.time()
+    workers = [worker() for _ in range(max(1, min(concurrency, len(codes))))]
+    await asyncio.gather(*workers)
+
+    elapsed = time.time() - t0
+    logger.info("scanned %s securities in %.1f secs (%.1f/s), %s hits, %s failed",
+                stats["done"], elapsed, stats["done"] / max(elapsed, 1e-6),
+                len(results), stats["failed"])
+
+    return results
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+在进程池中分片执行plot的全市场扫描。
+
+扫描中的拟合计算是CPU密集型的，如果在Sanic的事件循环中执行，会阻塞web请求和监控任务。这里将
+股票池分片，交给ProcessPoolExecutor中的worker进程加载行情并执行`plot.screen`，各分片的结果
+在完成后即回传到主进程，由主进程调用`plot.report`写入股票池或者发出信号。
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import arrow
+import cfg4py
+from omicron.core.types import Frame, FrameType
+from omicron.models.securities import Securities
+
+from alpha.core import metrics
+from alpha.plots import create_plot
+
+logger = logging.getLogger(__name__)
+cfg = cfg4py.get_instance()
+
+_executor = None
+
+# worker进程中的事件循环。worker进程会被多个分片复用，只需要初始化一次omicron
+_worker_loop = None
+
+
+def _init_worker():
+    from alpha.config import get_config_dir
+
+    cfg4py.init(get_config_dir(), False)
+
+
+def _run_shard(plot_name: str, frame_type: FrameType, end: Frame, codes: list):
+    global _worker_loop
+
+    import omicron
+
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+        _worker_loop.run_until_complete(omicron.init())
+
+    plot = create_plot(plot_name)
+    return _worker_loop.run_until_complete(plot.screen(frame_type, end, codes))
+
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        # 使用spawn而不是fork，避免子进程继承主进程的事件循环及redis连接
+        _executor = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+
+    return _executor
+
+
+async def sharded_scan(plot_name: str, frame_type: FrameType, end: Frame = None,
+                       workers: int = None, shards_per_worker: int = 4):
+    """
+    将股票池分成workers * shards_per_worker个分片，在进程池中执行`plot.screen`。
+
+    分片越多，结果回传得越及时，但每个分片都有一次批量加载的固定开销。如果workers不大于1，
+    则直接在当前事件循环中执行`plot.scan`。
+    """
+    workers = workers or cfg.alpha.scan.workers
+    plot = create_plot(plot_name)
+    if workers <= 1:
+        return await plot.scan(frame_type=frame_type, end=end)
+
+    # 各分片使用同一个end，保证扫描结果对应同一个时间点
+    end = end or arrow.now(cfg.tz).datetime
+    codes = Securities().choose(['stock'])
+    n = workers * shards_per_worker
+    shards = [codes[i::n] for i in range(n)]
+
+    t0 = time.time()
+    loop = asyncio.get_running_loop()
+    executor = get_executor(workers)
+    futures = [loop.run_in_executor(executor, _run_shard, plot_name, frame_type, end,
+                                    shard) for shard in shards if len(shard)]
+
+    count = 0
+    for fut in asyncio.as_completed(futures):
+        try:
+            hits = await fut
+        except Exception as e:
+            logger.exception(e)
+            continue
+
+        count += len(hits)
+        await plot.report(frame_type, hits)
+
+    await plot.flush()
+
+    # 各分片的分阶段计时发生在worker进程中，这里只记录整体耗时
+    metrics.observe("alpha_stage_seconds", time.time() - t0, plot=plot.name,
+                    stage="sharded_scan", frame_type=frame_type.value)
+    metrics.inc("alpha_screen_items_total", count, plot=plot.name, stage="hits",
+                frame_type=frame_type.value)
+    logger.info("%s sharded scan(%s) done in %.1f secs with %s workers, %s hits",
+                plot_name, frame_type.value, time.time() - t0, workers, count)
@@ -6,12 +6,14 @@ Author: Aaron-Yang [code@jieyu.ai]
 Contributors: 
 
 """
+import bisect
 import datetime
 import functools
 import json
 import logging
 from json import JSONEncoder
 
+import numpy as np
 from arrow import Arrow
 from omicron.core.timeframe import tf
 from omicron.core.types import FrameType
@@ -19,11 +21,18 @@ from omicron.models.securities import Securities
 from omicron.models.security import Security
 from sanic import response
 
+from alpha.core import metrics
 from alpha.core.monitors import mm
-from alpha.plots import create_plot
+from alpha.core.secindex import secindex
+from alpha.plots import create_plot, jobs
 
 logger = logging.getLogger(__name__)
 
+# 分页时每页的默认条数
+DEFAULT_PAGE_SIZE = 200
+
+NDJSON = "application/x-ndjson"
+
 
 class MyJsonDumper(JSONEncoder):
     # Override the default method
@@ -32,10 +41,75 @@ class MyJsonDumper(JSONEncoder):
             return obj.isoformat()
         if isinstance(obj, Arrow):
             return obj.datetime.isoformat()
+        if isinstance(obj, np.integer):
+            return int(obj)
+        if isinstance(obj, np.floating):
+            return float(obj)
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
 
         return json.JSONEncoder.default(self, obj)
 
 
+def _ndjson(obj) -> str:
+    return json.dumps(obj, cls=MyJsonDumper, ensure_ascii=False) + "\n"
+
+
+def _page_args(args):
+    """
+    解析分页参数：cursor为上一页返回的cursor，limit为每页条数，stream为真时以NDJSON流式返回
+    全部结果。如果三者均未指定，则不分页，返回与之前一致的完整结果。limit不是正整数时抛出
+    ValueError
+    """
+    cursor = args.get('cursor') or None
+    limit = args.get('limit')
+    stream = args.get('stream') in ('1', 'true')
+
+    paged = stream or cursor is not None or limit is not None
+    if limit is None:
+        return paged, cursor, DEFAULT_PAGE_SIZE, stream
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError(f"limit must be an integer: {limit}")
+
+    if limit < 1:
+        raise ValueError(f"limit must be at least 1: {limit}")
+
+    return paged, cursor, limit, stream
+
+
+async def _stock_pool_page(plots, frames, frame_types, cursor, limit):
+    """
+    从cursor处开始，依次在各plot的股票池中取至多limit条记录。cursor的格式为
+    `{plot}:{plot的cursor}`，格式不正确或者与请求的参数不符时抛出ValueError
+    """
+    plot_cursor = None
+    if cursor:
+        plot_name, _, plot_cursor = cursor.partition(":")
+        if plot_name not in plots:
+            raise ValueError(f"invalid cursor: {cursor}")
+        plots = plots[plots.index(plot_name):]
+
+    results = []
+    for i, plot_name in enumerate(plots):
+        plot = create_plot(plot_name)
+        result = await plot.list_stock_pool(frames, frame_types, cursor=plot_cursor,
+                                            limit=limit)
+        plot_cursor = None
+        results.append(result)
+
+        limit -= len(result["items"])
+        if result.get("cursor"):
+            return results, f"{plot_name}:{result['cursor']}"
+
+        if limit <= 0 and i + 1 < len(plots):
+            return results, f"{plots[i + 1]}:"
+
+    return results, None
+
+
 async def get_stock_pool(request):
     args = request.args
     frames = int(args.get('frames')[0])
@@ -44,17 +118,54 @@ async def get_stock_pool(request):
     if frame_types:
         frame_types = [FrameType(frame_type) for frame_type in frame_types]
     else:
-        frame_types = tf.day_level_frames
-        frame_types.extend(tf.minute_level_frames)
+        frame_types = tf.day_level_frames + tf.minute_level_frames
 
     plots = args.getlist('plots') or ['momentum']
+    try:
+        paged, cursor, limit, stream = _page_args(args)
+    except ValueError as e:
+        return response.text(str(e), status=400)
 
-    results = []
-    for plot_name in plots:
-        plot = create_plot(plot_name)
-        results.append(await plot.list_stock_pool(frames, frame_types))
+    if not paged:
+        results = []
+        for plot_name in plots:
+            plot = create_plot(plot_name)
+            results.append(await plot.list_stock_pool(frames, frame_types))
+
+        return response.json(body=results)
 
-    return response.json(body=results)
+    # 先取第一页，cursor无效时可以返回400，而不是在已开始输出后才出错
+    try:
+        results, cursor = await _stock_pool_page(plots, frames, frame_types, cursor,
+                                                 limit)
+    except ValueError as e:
+        return response.text(str(e), status=400)
+
+    if stream:
+        async def streaming(resp):
+            # 每个plot先输出一行不含items的表头，然后每条记录一行
+            _results, _cursor, current = results, cursor, None
+            while True:
+                for result in _results:
+                    items = result.pop("items")
+                    if result["plot"] != current:
+                        current = result["plot"]
+                        result.pop("cursor", None)
+                        await resp.write(_ndjson(result))
+
+                    for item in items:
+                        item["plot"] = current
+                        await resp.write(_ndjson(item))
+
+                if _cursor is None:
+                    break
+
+                _results, _cursor = await _stock_pool_page(plots, frames, frame_types,
+                                                           _cursor, limit)
+
+        return response.stream(streaming, content_type=NDJSON)
+
+    return response.json(body={"results": results, "cursor": cursor})
 
 
 async def plot_command_handler(request, cmd):
@@ -62,6 +173,15 @@ async def plot_command_handler(request, cmd):
     params = request.json
     del params['plot']
 
+    if params.pop("background", False):
+        # 长耗时命令在后台执行，立即返回job id，通过/plot/job/<job_id>查询进度及结果
+        try:
+            job = jobs.submit(plot_name, cmd, params)
+            return response.json({"job_id": job.id}, status=202)
+        except Exception as e:
+            logger.exception(e)
+            return response.json(str(e), status=500)
+
     try:
         plot = create_plot(plot_name)
         func = getattr(plot, cmd)
@@ -72,27 +192,68 @@ async def plot_command_handler(request, cmd):
         return response.json(e, status=500)
 
 
+async def get_plot_job(request, job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return response.json(f"job {job_id} not found", status=404)
+
+    dumps = functools.partial(json.dumps, cls=MyJsonDumper)
+    return response.json(job.to_dict(), dumps=dumps)
+
+
+async def list_plot_jobs(request):
+    return response.json(jobs.list_jobs())
+
+
 async def list_monitors(request):
     params = request.args
     code = params.get('code')
     frame_type = params.get('frame_type')
     plot = params.get('plot')
     flag = params.get('falg')
+    try:
+        paged, cursor, limit, stream = _page_args(params)
+    except ValueError as e:
+        return response.text(str(e), status=400)
 
     try:
         monitors = await mm.list_monitors(code=code, frame_type=frame_type,
                                           plot=plot, flag=flag)
 
-        result = {}
-        for job_name, name, params, trigger in monitors:
-            plot = create_plot(name)
+        if cursor:
+            # monitors按job_name排序，cursor为上一页最后一个job_name
+            names = [monitor[0] for monitor in monitors]
+            monitors = monitors[bisect.bisect_right(names, cursor):]
+
+        if paged and not stream:
+            monitors = monitors[:limit]
+            cursor = monitors[-1][0] if len(monitors) == limit else None
 
-            rows = result.get(plot.display_name, [])
+        # 同一页中的股票名称只查询一次
+        codes = {params.get("code") for _, _, params, _ in monitors} - {None}
+        names = {code: Security(code).display_name for code in codes}
 
-            row = plot.translate_monitor(job_name, params, trigger)
-            if row:
-                rows.append(row)
-                result[plot.display_name] = rows
+        def translate():
+            for job_name, name, params, trigger in monitors:
+                plot = create_plot(name)
+                row = plot.translate_monitor(job_name, params, trigger, names)
+                if row:
+                    yield plot.display_name, row
+
+        if stream:
+            async def streaming(resp):
+                for display_name, row in translate():
+                    row["plot"] = display_name
+                    await resp.write(_ndjson(row))
+
+            return response.stream(streaming, content_type=NDJSON)
+
+        result = {}
+        for display_name, row in translate():
+            result.setdefault(display_name, []).append(row)
+
+        if paged:
+            return response.json({"results": result, "cursor": cursor}, status=200)
 
         return response.json(result, status=200)
     except Exception as e:
@@ -150,9 +311,20 @@ async def remove_monitor(request):
         return response.json("code, plot are required", status=401)
 
 
+async def get_metrics(request):
+    return response.text(metrics.render(),
+                         content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 async def fuzzy_match(request):
     query = request.args.get('query')
-    results = Securities().fuzzy_match(query)
+    limit = int(request.args.get('limit') or 20)
 
-    dumps = functools.partial(json.dumps, cls=MyJsonDumper)
-    return response.json(results, dumps=dumps)
+    if len(secindex) == 0:
+        # 索引尚未建立
+        results = Securities().fuzzy_match(query)
+        dumps = functools.partial(json.dumps, cls=MyJsonDumper)
+        return response.json(results, dumps=dumps)
+
+    return response.text(secindex.match(query, limit),
+                         content_type="application/json; charset=utf-8")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+以合成行情替代omicron的行情、证券列表及redis，使plot的完整扫描可以脱离服务运行。
+
+只替换I/O：行情加载、redis读写、事件发送。筛选、拟合、写缓冲等逻辑仍然是生产代码。
+"""
+import bisect
+import datetime
+from contextlib import ExitStack, contextmanager
+from typing import Dict
+from unittest import mock
+
+import numpy as np
+
+
+def _normalize(frame, day_level: bool):
+    # 日线的frame为date，而调用方传入的end可能是datetime
+    if day_level and isinstance(frame, datetime.datetime):
+        return frame.date()
+
+    return frame
+
+
+class FakeSecurity:
+    """
+    替代`omicron.models.security.Security`。markets为frame_type -> code -> bars，同一周期下各
+    证券的frame相同
+    """
+    markets = {}
+    frames = {}
+
+    def __init__(self, code: str):
+        self.code = code
+        self.display_name = f"SYN{code[:6]}"
+
+    def __str__(self):
+        return f"{self.display_name}[{self.code}]"
+
+    @classmethod
+    def _clip(cls, code, start, end, frame_type) -> np.array:
+        frames = cls.frames[frame_type.value]
+        day_level = not isinstance(frames[0], datetime.datetime)
+        hi = bisect.bisect_right(frames, _normalize(end, day_level))
+        lo = 0 if start is None else bisect.bisect_left(frames,
+                                                        _normalize(start, day_level))
+        return cls.markets[frame_type.value][code][lo:hi]
+
+    async def load_bars(self, start, end, frame_type):
+        return self._clip(self.code, start, end, frame_type)
+
+    @classmethod
+    async def load_bars_batch(cls, codes, end, n, frame_type):
+        for code in codes:
+            if code in cls.markets[frame_type.value]:
+                yield code, cls._clip(code, None, end, frame_type)[-n:]
+
+
+async def _load_bars(code, start, end, frame_type):
+    return await FakeSecurity(code).load_bars(start, end, frame_type)
+
+
+def _fake_cache():
+    cache = mock.MagicMock()
+    cache.sys.smembers = mock.AsyncMock(return_value=set())
+    cache.sys.pipeline.return_value.execute = mock.AsyncMock()
+    cache.sys.multi_exec.return_value.execute = mock.AsyncMock()
+    return cache
+
+
+@contextmanager
+def fake_backend(markets: Dict[str, Dict[str, np.array]]):
+    """
+    在此上下文中，plot的行情来自markets（frame_type -> code -> bars），全部写操作被丢弃
+    """
+    codes = sorted(set(code for market in markets.values() for code in market))
+    FakeSecurity.markets = markets
+    FakeSecurity.frames = {ft: list(next(iter(market.values()))['frame'])
+                           for ft, market in markets.items()}
+
+    emit = mock.MagicMock()
+    emit.emit = mock.AsyncMock()
+    mm = mock.MagicMock()
+    mm.evaluate = mock.AsyncMock()
+
+    with ExitStack() as stack:
+        for target in ('alpha.plots.baseplot.Security', 'alpha.plots.momentum.Security',
+                       'alpha.plots.crossyear.Security'):
+            stack.enter_context(mock.patch(target, FakeSecurity))
+
+        for target in ('alpha.plots.baseplot.cache', 'alpha.plots.crossyear.cache',
+                       'alpha.core.memory.cache'):
+            stack.enter_context(mock.patch(target, _fake_cache()))
+
+        stack.enter_context(mock.patch('alpha.core.barcache.load_bars', _load_bars))
+        stack.enter_context(mock.patch('alpha.plots.baseplot.emit', emit))
+        stack.enter_context(mock.patch('alpha.plots.baseplot.mm', mm))
+        stack.enter_context(mock.patch(
+            'omicron.models.securities.Securities.choose',
+            lambda self, *args, **kwargs: list(codes)))
+
+        yield
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+热路径的基准测试。
+
+    python -m benchmarks.run --secs 500 --frames 300 --output bench.json
+    python -m benchmarks.run --baseline bench.json --tolerance 0.2
+
+结果以JSON输出。指定baseline时，任何一项的中位耗时比baseline慢tolerance以上，进程以非零状态
+退出，可以作为部署前的检查。signal的各项只依赖numpy；features及plot扫描需要安装omicron，
+缺失时这些项被跳过（记为skipped）。
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict
+
+import numpy as np
+
+from benchmarks.synthetic import make_market
+
+# name -> (setup, 每次计时的items数)
+_cases = {}
+
+
+def case(name: str):
+    """
+    注册一项基准测试。被装饰的函数接收行情数据（frame_type -> code -> bars），返回待计时的
+    无参函数及其处理的items数。函数可以是协程函数
+    """
+    def decorator(setup: Callable):
+        _cases[name] = setup
+        return setup
+
+    return decorator
+
+
+@case("signal.moving_average")
+def bench_moving_average(markets):
+    from alpha.core import signal
+
+    closes = [bars['close'] for bars in markets['1d'].values()]
+
+    def run():
+        for close in closes:
+            signal.moving_average(close, 5)
+
+    return run, len(closes)
+
+
+@case("signal.polyfit")
+def bench_polyfit(markets):
+    from alpha.core import signal
+
+    series = [bars['close'][-7:] / bars['close'][-7] for bars in markets['1d'].values()]
+
+    def run():
+        for ts in series:
+            signal.polyfit(ts)
+
+    return run, len(series)
+
+
+@case("signal.polyfit_batch")
+def bench_polyfit_batch(markets):
+    from alpha.core import signal
+
+    series = [bars['close'][-7:] / bars['close'][-7] for bars in markets['1d'].values()]
+
+    def run():
+        signal.polyfit_batch(series)
+
+    return run, len(series)
+
+
+@case("signal.cross")
+def bench_cross(markets):
+    from alpha.core import signal
+
+    pairs = []
+    for bars in markets['1d'].values():
+        mas = signal.moving_averages(bars['close'], [5, 20])
+        pairs.append((mas[5][-20:], mas[20][-20:]))
+
+    def run():
+        for f, g in pairs:
+            signal.cross(f, g)
+
+    return run, len(pairs)
+
+
+@case("signal.cross_batch")
+def bench_cross_batch(markets):
+    from alpha.core import signal
+
+    matrix = np.stack([bars['close'] for bars in markets['1d'].values()])
+    mas = signal.moving_averages(matrix, [5, 20])
+    f, g = mas[5][:, -20:], mas[20][:, -20:]
+
+    def run():
+        signal.cross_batch(f, g)
+
+    return run, len(matrix)
+
+
+@case("signal.polyfit_inflextion")
+def bench_polyfit_inflextion(markets):
+    from alpha.core import signal
+
+    # 逐窗口拟合，开销较大，只取部分证券
+    closes = [bars['close'] for bars in list(markets['1d'].values())[:50]]
+
+    def run():
+        for close in closes:
+            signal.polyfit_inflextion(close, 10)
+
+    return run, len(closes)
+
+
+@case("signal.polyfit_inflextion_batch")
+def bench_polyfit_inflextion_batch(markets):
+    from alpha.core import signal
+
+    matrix = np.stack([bars['close'] for bars in markets['1d'].values()])
+
+    def run():
+        signal.polyfit_inflextion_batch(matrix, 10)
+
+    return run, len(matrix)
+
+
+@case("features.ma_lines_trend")
+def bench_ma_lines_trend(markets):
+    from alpha.core import features
+
+    bars_list = [bars for bars in markets['1d'].values() if len(bars) >= 70]
+
+    def run():
+        for bars in bars_list:
+            features.ma_lines_trend(bars, [5, 10, 20, 60])
+
+    return run, len(bars_list)
+
+
+def _scan_case(plot_path: str, frame_type: str = '1d', **kwargs):
+    def setup(markets):
+        import importlib
+
+        from benchmarks.fakes import fake_backend
+
+        module, name = plot_path.split(":")
+        plot_cls = getattr(importlib.import_module(module), name)
+        # 以该周期的最后一个bar作为扫描时间
+        end = next(iter(markets[frame_type].values()))[-1]['frame']
+
+        async def run():
+            with fake_backend(markets):
+                plot = plot_cls()
+                await plot.scan(end=end, frame_type=frame_type, **kwargs)
+
+        return run, len(markets['1d'])
+
+    return setup
+
+
+case("Momentum.scan(1d)")(_scan_case("alpha.plots.momentum:Momentum",
+                                      frame_type='1d'))
+case("Momentum.scan(30m)")(_scan_case("alpha.plots.momentum:Momentum",
+                                       frame_type='30m'))
+case("CrossYear.scan")(_scan_case("alpha.plots.crossyear:CrossYear", frame_type='1d'))
+
+
+def _time(func: Callable, repeat: int) -> list:
+    elapsed = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+        elapsed.append(time.perf_counter() - t0)
+
+    return elapsed
+
+
+def run(secs: int = 500, frames: int = 300, repeat: int = 5, seed: int = 78,
+        pattern: str = None) -> Dict:
+    end = datetime.date(2020, 9, 30)
+    markets = {
+        '1d':  make_market(secs, frames, end, '1d', seed),
+        '30m': make_market(secs, frames, end, '30m', seed)
+    }
+
+    results = {}
+    for name, setup in _cases.items():
+        if pattern and pattern not in name:
+            continue
+
+        try:
+            func, items = setup(markets)
+            elapsed = _time(func, repeat)
+        except ImportError as e:
+            results[name] = {"skipped": str(e)}
+            continue
+
+        median = statistics.median(elapsed)
+        results[name] = {
+            "items":       items,
+            "min":         min(elapsed),
+            "median":      median,
+            "mean":        statistics.mean(elapsed),
+            "per_item_us": median / max(items, 1) * 1e6
+        }
+        print(f"{name:<28}{median * 1e3:>10.2f} ms{results[name]['per_item_us']:>12.1f}"
+              f" us/item", file=sys.stderr)
+
+    return {
+        "meta":    {
+            "secs":   secs,
+            "frames": frames,
+            "repeat": repeat,
+            "seed":   seed,
+            "python": platform.python_version(),
+            "numpy":  np.__version__,
+            "time":   datetime.datetime.now().isoformat()
+        },
+        "results": results
+    }
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> list:
+    """
+    返回比baseline慢tolerance以上的项：[(name, baseline median, median), ...]
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or "median" not in base or "median" not in result:
+            continue
+
+        if result["median"] > base["median"] * (1 + tolerance):
+            regressions.append((name, base["median"], result["median"]))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmarks for alpha hot paths")
+    parser.add_argument("--secs", type=int, default=500, help="number of securities")
+    parser.add_argument("--frames", type=int, default=300, help="bars per security")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=78)
+    parser.add_argument("-k", dest="pattern", help="only run cases containing this")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run(args.secs, args.frames, args.repeat, args.seed, args.pattern)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(report, baseline, args.tolerance)
+        for name, base, median in regressions:
+            print(f"REGRESSION {name}: {base * 1e3:.2f} ms -> {median * 1e3:.2f} ms",
+                  file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
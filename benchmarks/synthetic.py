@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Author: Aaron-Yang [code@jieyu.ai]
+Contributors:
+
+确定性的合成行情，字段与omicron的bars一致。
+
+价格为带漂移的几何随机游走，每支证券的漂移和波动率不同，并且每隔若干周期切换一次漂移方向，
+从而在足够长的序列中产生均线交叉、圆弧底/顶等形态，使各策略的筛选分支都能被执行到。相同的
+seed总是生成相同的数据。
+"""
+import datetime
+from typing import Dict, List
+
+import numpy as np
+
+bars_dtype = np.dtype([
+    ('frame', 'O'),
+    ('open', 'f4'),
+    ('high', 'f4'),
+    ('low', 'f4'),
+    ('close', 'f4'),
+    ('volume', 'f8'),
+    ('amount', 'f8'),
+    ('factor', 'f4')
+])
+
+# 30分钟线每个交易日的结束时刻
+MIN30_TICKS = [(10, 0), (10, 30), (11, 0), (11, 30), (13, 30), (14, 0), (14, 30),
+               (15, 0)]
+
+
+def day_frames(end: datetime.date, n: int) -> List[datetime.date]:
+    """
+    以end为最后一个交易日（只排除周末），向前取n个交易日
+    """
+    end = np.datetime64(end, 'D')
+    days = np.busday_offset(end, np.arange(-n + 1, 1), roll='backward')
+    return [day.astype(datetime.date) for day in days]
+
+
+def min30_frames(end: datetime.date, n: int) -> List[datetime.datetime]:
+    days = day_frames(end, (n + len(MIN30_TICKS) - 1) // len(MIN30_TICKS))
+    frames = [datetime.datetime(day.year, day.month, day.day, h, m)
+              for day in days for h, m in MIN30_TICKS]
+    return frames[-n:]
+
+
+def make_codes(n: int) -> List[str]:
+    return [f"{600000 + i:06d}.XSHG" if i % 2 else f"{i:06d}.XSHE" for i in range(n)]
+
+
+def make_bars(frames: list, rng: np.random.Generator,
+              start_price: float = 10.) -> np.array:
+    """
+    为一支证券生成len(frames)个bar
+    """
+    n = len(frames)
+    sigma = rng.uniform(0.01, 0.03)
+    drift = rng.uniform(-0.002, 0.003)
+
+    # 每隔regime个周期切换一次漂移方向
+    regime = int(rng.integers(20, 80))
+    drifts = np.where((np.arange(n) // regime) % 2 == 0, drift, -drift)
+    close = start_price * np.exp(np.cumsum(drifts + rng.normal(0, sigma, n)))
+
+    prev = np.concatenate(([start_price], close[:-1]))
+    _open = prev * (1 + rng.normal(0, sigma / 3, n))
+    high = np.maximum(_open, close) * (1 + np.abs(rng.normal(0, sigma / 2, n)))
+    low = np.minimum(_open, close) * (1 - np.abs(rng.normal(0, sigma / 2, n)))
+    volume = rng.lognormal(13, 0.5, n)
+
+    bars = np.empty(n, dtype=bars_dtype)
+    bars['frame'] = frames
+    bars['open'] = _open
+    bars['high'] = high
+    bars['low'] = low
+    bars['close'] = close
+    bars['volume'] = volume
+    bars['amount'] = volume * close
+    bars['factor'] = 1.
+
+    return bars
+
+
+def make_market(n_secs: int, n_frames: int, end: datetime.date, frame_type: str = '1d',
+                seed: int = 78) -> Dict[str, np.array]:
+    """
+    生成n_secs支证券、每支n_frames个bar的行情，最后一个bar的时间为end（或者end当天收盘）
+
+    Args:
+        n_secs: 证券数
+        n_frames: 每支证券的bar数
+        end: 最后一个交易日
+        frame_type: '1d'或者'30m'
+        seed: 随机数种子
+
+    Returns:
+        code -> bars
+    """
+    if frame_type == '1d':
+        frames = day_frames(end, n_frames)
+    elif frame_type == '30m':
+        frames = min30_frames(end, n_frames)
+    else:
+        raise ValueError(f"unsupported frame_type: {frame_type}")
+
+    rng = np.random.default_rng(seed)
+    return {code: make_bars(frames, rng, rng.uniform(3, 60))
+            for code in make_codes(n_secs)}
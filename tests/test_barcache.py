@@ -0,0 +1,96 @@
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+import arrow
+import numpy as np
+from omicron.core.lang import async_run
+from omicron.core.types import FrameType
+
+from alpha.core.barcache import BarCache
+from tests.base import AbstractTestCase
+
+DAYS = [datetime.date(2020, 10, d) for d in (12, 13, 14, 15, 16)]
+
+
+class FakeSecurity:
+    # 最后一个交易日（10月16日）的收盘价，用来模拟盘中及收盘后的行情
+    last_close = 10.
+
+    def __init__(self, code):
+        self.code = code
+        self.ipo_date = datetime.date(2005, 1, 4)
+
+    async def load_bars(self, start, end, frame_type, fq=True):
+        start = start.date() if isinstance(start, datetime.datetime) else start
+        end = end.date() if isinstance(end, datetime.datetime) else end
+        days = [day for day in DAYS if start <= day <= end]
+
+        bars = np.empty((len(days),), dtype=[('frame', 'O'), ('open', 'f4'),
+                                             ('high', 'f4'), ('low', 'f4'),
+                                             ('close', 'f4'), ('volume', 'f8'),
+                                             ('amount', 'f8'), ('factor', 'f4')])
+        bars['frame'] = days
+        for name in ('open', 'high', 'low', 'close'):
+            bars[name] = 9.
+        bars['volume'] = 1e6
+        bars['amount'] = 9e6
+        bars['factor'] = 1.
+        if len(days) and days[-1] == DAYS[-1]:
+            bars[-1]['close'] = self.last_close
+
+        return bars
+
+
+class BarCacheTestCase(AbstractTestCase):
+    @async_run
+    async def test_intraday_bar_not_cached(self):
+        cache = BarCache(tempfile.mkdtemp())
+        code = '000001.XSHE'
+
+        with mock.patch('alpha.core.barcache.Security', FakeSecurity):
+            # 盘中加载，当天的bar尚未收盘，只出现在结果中，不写入缓存
+            FakeSecurity.last_close = 10.
+            bars = await cache.load_bars(code, DAYS[0],
+                                         datetime.datetime(2020, 10, 16, 14, 30),
+                                         FrameType.DAY)
+            self.assertEqual(DAYS[-1], bars[-1]['frame'])
+            self.assertAlmostEqual(10., bars[-1]['close'])
+            self.assertEqual(20201015, cache.read(code, FrameType.DAY)[-1]['frame'])
+
+            # 收盘后再次加载，应取得当天最终的收盘价
+            FakeSecurity.last_close = 10.5
+            bars = await cache.load_bars(code, DAYS[0],
+                                         datetime.datetime(2020, 10, 16, 15),
+                                         FrameType.DAY)
+            self.assertEqual(5, len(bars))
+            self.assertAlmostEqual(10.5, bars[-1]['close'])
+            self.assertEqual(20201016, cache.read(code, FrameType.DAY)[-1]['frame'])
+
+    @async_run
+    async def test_future_end(self):
+        cache = BarCache(tempfile.mkdtemp())
+        code = '000001.XSHE'
+        now = arrow.get(datetime.datetime(2020, 10, 16, 14, 30), tzinfo='Asia/Shanghai')
+
+        # end晚于当前时间（盘中），当天未收盘的bar不能写入缓存
+        with mock.patch('alpha.core.barcache.Security', FakeSecurity), \
+                mock.patch.object(arrow, 'now', return_value=now):
+            FakeSecurity.last_close = 10.
+            bars = await cache.load_bars(code, DAYS[0], datetime.date(2020, 10, 20),
+                                         FrameType.DAY)
+            self.assertEqual(DAYS[-1], bars[-1]['frame'])
+            self.assertEqual(20201015, cache.read(code, FrameType.DAY)[-1]['frame'])
+
+            FakeSecurity.last_close = 10.5
+            now = arrow.get(datetime.datetime(2020, 10, 16, 15), tzinfo='Asia/Shanghai')
+            with mock.patch.object(arrow, 'now', return_value=now):
+                bars = await cache.load_bars(code, DAYS[0], datetime.date(2020, 10, 20),
+                                             FrameType.DAY)
+            self.assertAlmostEqual(10.5, bars[-1]['close'])
+            self.assertEqual(20201016, cache.read(code, FrameType.DAY)[-1]['frame'])
+
+
+if __name__ == '__main__':
+    unittest.main()
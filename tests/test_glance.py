@@ -1,8 +1,11 @@
+import datetime
 import os
 import unittest
+from unittest import mock
 
 import arrow
 import cfg4py
+import numpy as np
 import omicron
 from omicron.core.lang import async_run
 from omicron.core.timeframe import tf
@@ -10,7 +13,9 @@ from omicron.core.types import FrameType
 from omicron.models.security import Security
 
 from alpha.config import get_config_dir
-from alpha.core.features import count_buy_limit_event
+from alpha.core import features
+from alpha.core.features import count_buy_limit_event, event_index, \
+    forward_returns, price_change_distribution
 
 cfg = cfg4py.get_instance()
 
@@ -51,6 +56,57 @@ class MyTestCase(unittest.TestCase):
         bars = await sec.load_bars(start, end, FrameType.DAY)
         count_buy_limit_event(sec, bars)
 
+    def test_price_change_distribution(self):
+        c1 = np.array([10, 10, 10, 10, 10, np.nan])
+        c0 = np.array([11, 12, 10.5, 9, 9.5, 10])
+        limits = np.array([0.1, 0.2, 0.05, 0.1, 0.05, 0.1])
+
+        zt, dt, (hist, bins) = price_change_distribution(c1, c0, limits)
+        self.assertEqual(3, zt)
+        self.assertEqual(2, dt)
+        self.assertEqual(5, np.sum(hist))
+
+    def test_limit_table(self):
+        codes = ['600000.XSHG', '688001.XSHG', '300001.XSHE', '301001.XSHE',
+                 '000004.XSHE']
+
+        def choose(_types, exclude_st=True, exclude_688=True):
+            return codes[:-1] if exclude_st else codes
+
+        with mock.patch('alpha.core.features.Securities') as secs:
+            secs.return_value.choose.side_effect = choose
+            features._limit_table = (None, [], np.array([]))
+            _, limits = features.limit_table(datetime.date(2020, 8, 21))
+            np.testing.assert_array_equal([0.1, 0.2, 0.1, 0.1, 0.05], limits)
+
+            _, limits = features.limit_table(datetime.date(2020, 8, 24))
+            np.testing.assert_array_equal([0.1, 0.2, 0.2, 0.2, 0.05], limits)
+
+    def test_forward_returns(self):
+        nan = np.nan
+        close = np.array([[10, 11, 12, 9, 10, nan],
+                          [20, nan, 22, 18, 24, 25]])
+        high = close * 1.05
+        low = close * 0.95
+
+        events = event_index(['A', 'B'], np.array([1, 2, 3, 4, 5, 6]),
+                             [('A', 1), ('B', 3), ('B', 2), ('A', 5), ('B', 7)])
+        self.assertListEqual([[0, 0], [1, 2], [1, 1], [0, 4], [1, -1]],
+                             events.tolist())
+
+        ret, gain, drawdown = forward_returns(close, events, 2, high, low)
+        np.testing.assert_array_almost_equal([0.2, 24 / 22 - 1, nan, nan, nan], ret)
+        np.testing.assert_array_almost_equal(
+            [12 * 1.05 / 10 - 1, 24 * 1.05 / 22 - 1, nan, nan, nan], gain)
+        np.testing.assert_array_almost_equal(
+            [11 * 0.95 / 10 - 1, 18 * 0.95 / 22 - 1, nan, nan, nan], drawdown)
+
+        # 不提供high/low时，以收盘价计算
+        ret, gain, drawdown = forward_returns(close, events[:1], 3)
+        np.testing.assert_array_almost_equal([-0.1], ret)
+        np.testing.assert_array_almost_equal([0.2], gain)
+        np.testing.assert_array_almost_equal([-0.1], drawdown)
+
 
 if __name__ == '__main__':
     unittest.main()
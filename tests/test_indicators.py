@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+
+from alpha.core import signal
+from alpha.core.indicators import IndicatorState
+
+
+class MyTestCase(unittest.TestCase):
+    def test_incremental_update(self):
+        closes = np.cumsum(np.random.random(300) - 0.5) + 10
+        bars = np.array([(i, c) for i, c in enumerate(closes)],
+                        dtype=[('frame', 'i8'), ('close', 'f8')])
+
+        state = IndicatorState(5, 7)
+        state.reset(bars[:11])
+        self.assertTrue(state.ready)
+
+        for i in range(11, len(bars)):
+            # 未收盘的bar先更新一次，收盘后再以同一frame更新
+            state.update(i, closes[i] * 1.01)
+            state.update(i, closes[i])
+
+            ma = signal.moving_average(closes[:i + 1], 5)[-7:]
+            err, coef, _ = signal.polyfit(ma / ma[0])
+            _err, _coef, _ = state.fit()
+
+            self.assertAlmostEqual(ma[-1], state.ma)
+            self.assertAlmostEqual(err, _err, places=6)
+            np.testing.assert_array_almost_equal(coef, _coef)
+
+    def test_not_ready(self):
+        state = IndicatorState(5, 7)
+        state.update(0, 10.0)
+        self.assertFalse(state.ready)
+        with self.assertRaises(ValueError):
+            state.fit()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from alpha.core import kernels
+
+
+class KernelsTest(unittest.TestCase):
+    """
+    numba内核（以纯python方式执行）与numpy实现的结果应当一致
+    """
+
+    def test_errors(self):
+        ts = np.cumsum(np.random.random(10) - 0.5) + 10
+        y_hat = ts + np.random.random(10) * 0.1
+        coef = np.polyfit(np.arange(10), ts, 2)
+
+        self.assertAlmostEqual(kernels._rmse_numpy(ts, y_hat),
+                               kernels._rmse_loop(ts, y_hat))
+        self.assertAlmostEqual(kernels._poly_error_numpy(ts, coef),
+                               kernels._poly_error_loop(ts, coef))
+        self.assertAlmostEqual(kernels._exp_error_numpy(ts, 0.01, 2.3),
+                               kernels._exp_error_loop(ts, 0.01, 2.3))
+
+    def test_find_runs(self):
+        for x in (np.array([1, 1, 2, 2, 2, 3]), np.array([True, False, False]),
+                  np.array([1.5])):
+            for expected, actual in zip(kernels._find_runs_numpy(x),
+                                        kernels._find_runs_loop(x)):
+                np.testing.assert_array_equal(expected, actual)
+
+        # object数组不能交给numba编译的内核
+        values, starts, lengths = kernels.find_runs(np.array([None, None, 1],
+                                                             dtype=object))
+        self.assertListEqual([None, 1], list(values))
+        self.assertListEqual([0, 2], list(starts))
+        self.assertListEqual([2, 1], list(lengths))
+
+    def test_merge_extrema(self):
+        indices = np.array([3, 4, 5, 10, 20, 21])
+        values = np.array([1., 0.5, 0.8, 2., 3., 1.])
+
+        for lower, expected in ((True, [4, 10, 21]), (False, [3, 10, 20])):
+            np.testing.assert_array_equal(
+                    expected, kernels._merge_extrema_numpy(indices, values, lower))
+            np.testing.assert_array_equal(
+                    expected, kernels._merge_extrema_loop(indices, values, lower))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import time
+import unittest
+from unittest import mock
+
+from omicron.core.lang import async_run
+from omicron.dal import cache
+
+from alpha.core.memory import SignalMemory
+from tests.base import AbstractTestCase
+
+
+class MemoryTestCase(AbstractTestCase):
+    def test_lru_ttl(self):
+        memory = SignalMemory("test", max_size=2, ttl=60)
+        memory.set(("000001.XSHE", "30m"), "trend", "long")
+        memory.set(("000002.XSHE", "30m"), "trend", "short")
+
+        # 访问000001，使000002成为最久未使用的项
+        self.assertEqual("long", memory.get(("000001.XSHE", "30m"), "trend"))
+        memory.set(("000003.XSHE", "30m"), "trend", "long")
+        self.assertEqual(2, len(memory))
+        self.assertIsNone(memory.get(("000002.XSHE", "30m"), "trend"))
+
+        with mock.patch("time.time", return_value=time.time() + 61):
+            self.assertIsNone(memory.get(("000001.XSHE", "30m"), "trend"))
+
+    @async_run
+    async def test_flush_restore(self):
+        memory = SignalMemory("test", max_size=2)
+        await cache.sys.delete(memory.redis_key)
+
+        memory.set(("000001.XSHE", "30m"), "trend", "long")
+        memory.set(("000002.XSHE", "1d"), "trend", "short")
+        memory.set(("000003.XSHE", "30m"), "trend", "long")
+        await memory.flush()
+
+        # 000001被淘汰，不应写入redis
+        self.assertEqual(2, await cache.sys.hlen(memory.redis_key))
+
+        restored = SignalMemory("test", max_size=2)
+        await restored.restore()
+        self.assertEqual("short", restored.get(("000002.XSHE", "1d"), "trend"))
+        self.assertEqual("long", restored.get(("000003.XSHE", "30m"), "trend"))
+        self.assertIsNone(restored.get(("000001.XSHE", "30m"), "trend"))
+
+        await cache.sys.delete(memory.redis_key)
+
+    @async_run
+    async def test_flush_failure(self):
+        memory = SignalMemory("test", max_size=1)
+        memory.set(("000001.XSHE", "30m"), "trend", "long")
+        memory.set(("000002.XSHE", "30m"), "trend", "short")
+
+        with mock.patch("alpha.core.memory.cache") as _cache:
+            tr = _cache.sys.multi_exec.return_value
+            tr.execute = mock.AsyncMock(side_effect=ConnectionError())
+            with self.assertRaises(ConnectionError):
+                await memory.flush()
+
+        # 写入失败的变化保留下来，在下一次flush时重试
+        self.assertSetEqual({("000002.XSHE", "30m")}, memory._dirty)
+        self.assertSetEqual({("000001.XSHE", "30m")}, memory._evicted)
+
+
+if __name__ == '__main__':
+    unittest.main()
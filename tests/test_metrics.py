@@ -0,0 +1,39 @@
+import asyncio
+import unittest
+
+from alpha.core import metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_render(self):
+        @metrics.timed("alpha_signal_seconds")
+        def fit():
+            return 1
+
+        @metrics.timed("alpha_stage_seconds", plot="momentum", stage="scan")
+        async def scan():
+            return 2
+
+        self.assertEqual(1, fit())
+        self.assertEqual(2, asyncio.run(scan()))
+        with metrics.timer("alpha_stage_seconds", plot="momentum", stage="fit"):
+            pass
+        metrics.inc("alpha_screen_items_total", 10, plot="momentum", stage="scanned")
+        metrics.inc("alpha_screen_items_total", 5, plot="momentum", stage="scanned")
+
+        lines = metrics.render().splitlines()
+        self.assertIn("# TYPE alpha_screen_items_total counter", lines)
+        self.assertIn('alpha_screen_items_total{plot="momentum",stage="scanned"} 15.0',
+                      lines)
+        self.assertIn('alpha_signal_seconds_count{func="fit"} 1', lines)
+        self.assertIn('alpha_stage_seconds_count{plot="momentum",stage="scan"} 1',
+                      lines)
+        self.assertIn('alpha_stage_seconds_count{plot="momentum",stage="fit"} 1', lines)
+        self.assertIn("# TYPE alpha_stage_seconds_max gauge", lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
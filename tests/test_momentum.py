@@ -1,4 +1,5 @@
 import functools
+import json
 import unittest
 
 import arrow
@@ -6,6 +7,7 @@ from alpha.core.enums import Events
 from omicron.core.lang import async_run
 from omicron.core.timeframe import tf
 from omicron.core.types import FrameType
+from omicron.dal import cache
 from pyemit import emit
 
 from alpha.core.monitors import monitor
@@ -26,6 +28,63 @@ class MyTestCase(AbstractTestCase):
 
         await plot.scan(FrameType.MIN30)
 
+    @async_run
+    async def test_stock_pool(self):
+        plot = Momentum()
+        plot.name = "test_pool"
+        for key in ("plots.test_pool.pool", "plots.test_pool.pool.1d",
+                    "plots.test_pool.pool.30m"):
+            await cache.sys.delete(key)
+
+        today = tf.date2int(arrow.now().date())
+        old = tf.date2int(tf.day_shift(arrow.now().date(), -40))
+        for frame, code, ft in ((today, '000001.XSHE', FrameType.DAY),
+                                (old, '000002.XSHE', FrameType.DAY),
+                                (today * 10000 + 1000, '000001.XSHE', FrameType.MIN30)):
+            rec = {"frame_type": ft.value, "y": 0.05, "vx": 2, "a": 1e-3, "b": 1e-3,
+                   "err": 1e-3}
+            plot.write_behind(plot.pool_key(), f"{frame}:{code}", json.dumps(rec),
+                              index_key=plot.pool_key(ft), score=frame)
+        await plot.flush()
+
+        recs = await plot.query_pool(FrameType.DAY, old)
+        self.assertListEqual([old, today], [rec[0] for rec in recs])
+        recs = await plot.query_pool(FrameType.DAY, old + 1)
+        self.assertListEqual([('000001.XSHE', "1d")],
+                             [(code, v["frame_type"]) for _, code, v in recs])
+
+        # 分页
+        first = await plot.query_pool(FrameType.DAY, old, count=1)
+        self.assertEqual('000002.XSHE', first[0][1])
+        after = f"{first[0][0]}:{first[0][1]}"
+        second = await plot.query_pool(FrameType.DAY, old, after=after, count=1)
+        self.assertEqual('000001.XSHE', second[0][1])
+        after = f"{second[0][0]}:{second[0][1]}"
+        self.assertListEqual([], await plot.query_pool(FrameType.DAY, old, after=after))
+
+        page = await plot.list_stock_pool(60, [FrameType.DAY, FrameType.MIN30],
+                                          limit=2)
+        self.assertEqual(2, len(page["items"]))
+        self.assertEqual(f"1d:{today}:000001.XSHE", page["cursor"])
+        page = await plot.list_stock_pool(60, [FrameType.DAY, FrameType.MIN30],
+                                          cursor=page["cursor"], limit=2)
+        self.assertEqual(1, len(page["items"]))
+        self.assertEqual("30m", page["items"][0]["frame"])
+        self.assertIsNone(page["cursor"])
+
+        with self.assertRaises(ValueError):
+            await plot.list_stock_pool(60, [FrameType.DAY], limit=0)
+        for cursor in ("1d", "1x:20200901:000001.XSHE", "30m:20200901:000001.XSHE",
+                       "1d:abc"):
+            with self.assertRaises(ValueError):
+                await plot.list_stock_pool(60, [FrameType.DAY], cursor=cursor, limit=2)
+
+        self.assertDictEqual({"1d": 2, "30m": 1}, await plot.rebuild_pool_index())
+
+        self.assertEqual(1, await plot.expire_pool(30))
+        self.assertEqual(2, await cache.sys.hlen(plot.pool_key()))
+        self.assertEqual(1, len(await plot.query_pool(FrameType.MIN30)))
+
     @async_run
     async def test_momentum_visualize(self):
         plot = Momentum()
@@ -1,6 +1,5 @@
 import unittest
-from collections import namedtuple
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import cfg4py
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -53,18 +52,94 @@ class MyTestCase(AbstractTestCase):
     def test_find_job(self):
         plot, code, frame_type, flag, win = "maline:000001.XSHG:1d:both:5".split(":")
 
-        from alpha.core.monitors import mm
-        mm.sched = MagicMock()
+        monitor = MonitorManager()
+        for _win in (5, 10):
+            monitor._watch(f"maline:{code}:{frame_type}:{flag}:{_win}", {
+                "plot":            plot,
+                "executor_params": {"code": code, "frame_type": frame_type,
+                                    "flag": flag, "win": _win}
+            })
+
+        job_name = monitor.find_job(plot, code, flag, frame_type, int(win))
+        self.assertEqual("maline:000001.XSHG:1d:both:5", job_name)
+        self.assertIsNone(monitor.find_job(plot, code, flag, frame_type, 20))
+
+        self.assertEqual(2, len(monitor.lookup(code=code, plot=plot)))
+        self.assertSetEqual({"maline:000001.XSHG:1d:both:10"},
+                            monitor.lookup(code=code, win=10))
+        self.assertSetEqual(set(), monitor.lookup(code="000002.XSHE"))
+
+        monitor._unwatch("maline:000001.XSHG:1d:both:10")
+        self.assertSetEqual({job_name}, monitor.lookup(plot=plot))
+
+    @async_run
+    async def test_group_jobs(self):
+        monitor = MonitorManager()
+        monitor.sched = MagicMock()
+
+        plot = MagicMock()
+        plot.evaluate_batch = AsyncMock()
+        plot.flush = AsyncMock()
+
+        trigger = {"name": "frame", "frame_type": "30m", "jitter": -3,
+                   "jitter_unit": "m"}
+        for code in ("000001.XSHE", "000002.XSHE"):
+            job_name = f"momentum:{code}:30m:both:5"
+            monitor.watch_list[job_name] = {
+                "plot":            "momentum",
+                "trigger":         trigger,
+                "executor":        "evaluate",
+                "executor_params": {"code": code, "frame_type": "30m", "win": 5,
+                                    "flag": "both"}
+            }
+            monitor._add_watch(plot, job_name, monitor.watch_list[job_name])
+
+        # 共享trigger的两个监控只创建一个job
+        self.assertEqual(1, monitor.sched.add_job.call_count)
+        key = monitor.sched.add_job.call_args.kwargs["id"]
+        self.assertEqual(2, len(monitor.groups[key]))
+
+        # 每次运行都使用加入group时的同一个plot对象，不再重新创建
+        with patch('alpha.core.monitors.manager.create_plot') as create_plot:
+            await monitor._run_group(key)
+            await monitor._run_group(key)
+            create_plot.assert_not_called()
+        self.assertEqual(2, plot.evaluate_batch.call_count)
+        params_list = plot.evaluate_batch.call_args.args[0]
+        self.assertSetEqual({"000001.XSHE", "000002.XSHE"},
+                            {params["code"] for params in params_list})
+
+        monitor._remove_watch("momentum:000001.XSHE:30m:both:5")
+        monitor.sched.remove_job.assert_not_called()
+        monitor._remove_watch("momentum:000002.XSHE:30m:both:5")
+        monitor.sched.remove_job.assert_called_once_with(key)
+        self.assertDictEqual({}, monitor.groups)
+        self.assertDictEqual({}, monitor.plots)
+
+    @async_run
+    async def test_remove_all(self):
+        monitor = MonitorManager()
+        monitor.sched = MagicMock()
 
-        def _get_jobs():
-            class _:
-                name = "maline:000001.XSHG:1d:both:5"
+        job_name = "momentum:000001.XSHE:30m:both:5"
+        job_info = {
+            "plot":            "momentum",
+            "trigger":         {"name": "frame", "frame_type": "30m", "jitter": -3,
+                                "jitter_unit": "m"},
+            "executor":        "evaluate",
+            "executor_params": {"code": "000001.XSHE", "frame_type": "30m", "win": 5,
+                                "flag": "both"}
+        }
+        monitor._watch(job_name, job_info)
+        monitor._add_watch(MagicMock(), job_name, job_info)
 
-            return namedtuple()
+        with patch('alpha.core.monitors.manager.cache') as cache:
+            cache.sys.delete = AsyncMock()
+            self.assertListEqual([job_name], await monitor.remove(remove_all=True))
 
-        mm.sched.get_jobs = _get_jobs()
-        job = mm.find_job(plot, code, flag, win, frame_type)
-        print(job)
+        self.assertDictEqual({}, monitor.groups)
+        self.assertDictEqual({}, monitor.plots)
+        self.assertDictEqual({}, monitor.watch_list)
 
 
 if __name__ == '__main__':
@@ -1,12 +1,18 @@
 import logging
 import unittest
+from unittest import mock
 
 import arrow
 import cfg4py
+import numpy as np
 from omicron.core.lang import async_run
 from omicron.core.types import FrameType
 from omicron.models.securities import Securities
 
+from alpha.core import signal
+from alpha.core.indicators import IndicatorState
+from alpha.plots import create_plot, jobs, register_plot
+from alpha.plots.baseplot import BasePlot
 from alpha.plots.longparallel import LongParallel
 from alpha.plots.nine import NinePlot
 from tests.base import AbstractTestCase
@@ -77,6 +83,123 @@ class MyTestCase(AbstractTestCase):
         #await nine.scan(5, FrameType.DAY, end=end)
         await nine.scan(arrow.get('2020-8-21').date())
 
+    def test_create_plot(self):
+        mom = create_plot('momentum')
+        self.assertEqual('momentum', mom.name)
+        self.assertIs(mom, create_plot('Momentum'))
+        self.assertIsNone(create_plot('not_exist'))
+
+        class Dummy(BasePlot):
+            def __init__(self):
+                super().__init__("dummy")
+
+        register_plot('dummy', Dummy)
+        self.assertIsInstance(create_plot('dummy'), Dummy)
+        self.assertIs(create_plot('dummy'), create_plot('dummy'))
+
+        register_plot('dummy', 'alpha.plots.maline:MaLine')
+        self.assertEqual('maline', create_plot('dummy').name)
+
+    @async_run
+    async def test_write_behind(self):
+        plot = create_plot('momentum')
+        pipeline = mock.MagicMock()
+        pipeline.execute = mock.AsyncMock()
+
+        with mock.patch('alpha.plots.baseplot.cache') as cache:
+            cache.sys.pipeline.return_value = pipeline
+            plot.write_behind("plots.test.pool", "20200901:000001.XSHE", "{}")
+            plot.write_behind("plots.test.pool", "20200901:000002.XSHE", "{}")
+            plot.write_behind("plots.test.fired", "000001.XSHE:20200901", "{}")
+            await plot.flush()
+
+        # 三条记录合并为一次pipeline写入
+        pipeline.execute.assert_awaited_once()
+        self.assertEqual(2, pipeline.hmset_dict.call_count)
+        self.assertDictEqual({}, plot._pending)
+
+    @async_run
+    async def test_load_indicator_closes_intraday_bar(self):
+        plot = create_plot('momentum')
+        closes = np.cumsum(np.random.random(13) - 0.5) + 10
+        bars = np.array([(i, c) for i, c in enumerate(closes)],
+                        dtype=[('frame', 'i8'), ('close', 'f8')])
+
+        key = ('000001.XSHE', FrameType.MIN30, 5)
+        state = IndicatorState(5, 7)
+        state.reset(bars[:11])
+        # 上一次监控运行时，frame 11尚未收盘
+        state.update(11, closes[11] * 1.01)
+        plot.indicators[key] = state
+
+        with mock.patch('alpha.plots.baseplot.tf') as tf, \
+                mock.patch.object(plot, 'get_bars',
+                                  mock.AsyncMock(return_value=bars[11:])) as get_bars:
+            tf.shift.side_effect = lambda frame, n, frame_type: frame + n
+            result = await plot.load_indicator(*key)
+
+        self.assertIs(state, result)
+        self.assertEqual(2, get_bars.call_args.args[1])
+        self.assertEqual(12, state.frame)
+
+        ma = signal.moving_average(closes, 5)[-7:]
+        err, coef, _ = signal.polyfit(ma / ma[0])
+        _err, _coef, _ = state.fit()
+        self.assertAlmostEqual(ma[-1], state.ma)
+        np.testing.assert_array_almost_equal(coef, _coef)
+
+        del plot.indicators[key]
+
+    @async_run
+    async def test_write_behind_failure(self):
+        plot = create_plot('momentum')
+        pipeline = mock.MagicMock()
+        pipeline.execute = mock.AsyncMock(side_effect=ConnectionError())
+
+        with mock.patch('alpha.plots.baseplot.cache') as cache:
+            cache.sys.pipeline.return_value = pipeline
+            plot.write_behind("plots.test.pool", "20200901:000001.XSHE", "{}",
+                              index_key="plots.test.pool.1d", score=20200901)
+            with self.assertRaises(ConnectionError):
+                await plot.flush()
+
+        # 写入失败的记录放回写缓冲，等待下一次flush
+        self.assertDictEqual({"20200901:000001.XSHE": "{}"},
+                             plot._pending["plots.test.pool"])
+        self.assertDictEqual({"20200901:000001.XSHE": 20200901},
+                             plot._pending_index["plots.test.pool.1d"])
+        self.assertEqual(1, plot._pending_count)
+
+        plot._pending.clear()
+        plot._pending_index.clear()
+        plot._pending_count = 0
+
+    @async_run
+    async def test_background_job(self):
+        class Slow(BasePlot):
+            def __init__(self):
+                super().__init__("slow")
+
+            async def scan(self, codes, end=None):
+                progress = jobs.scan_progress.get()
+                progress.add_total(len(codes))
+                for code in codes:
+                    progress.advance(code if code.startswith("0") else None)
+                return codes
+
+        register_plot('slow', Slow)
+        params = {"codes": ["000001.XSHE", "600000.XSHG"], "end": "2020-09-01"}
+        job = jobs.submit('slow', 'scan', params)
+        # 相同的命令复用已提交的job
+        self.assertIs(job, jobs.submit('slow', 'scan', dict(params)))
+
+        await job.task
+        status = jobs.get_job(job.id).to_dict()
+        self.assertEqual("done", status["status"])
+        self.assertEqual(2, status["done"])
+        self.assertEqual(1, status["hits"])
+        self.assertListEqual(params["codes"], status["result"])
+
 
 if __name__ == '__main__':
     unittest.main()
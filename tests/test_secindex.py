@@ -0,0 +1,45 @@
+import json
+import unittest
+
+from alpha.core.secindex import SecurityIndex
+
+
+class SecurityIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SecurityIndex()
+        self.index.build([
+            ("000001.XSHE", "平安银行", "PAYH", "1991-04-03", "2200-01-01", "stock"),
+            ("601318.XSHG", "中国平安", "ZGPA", "2007-03-01", "2200-01-01", "stock"),
+            ("000001.XSHG", "上证指数", "SZZS", "1991-07-15", "2200-01-01", "index"),
+            ("600000.XSHG", "浦发银行", "PFYH", "1999-11-10", "2200-01-01", "stock"),
+            ("000100.XSHE", "TCL科技", "TCLKJ", "2004-01-30", "2200-01-01", "stock"),
+            ("000905.XSHG", "中证500", "ZZ500", "2007-01-15", "2200-01-01", "index")
+        ])
+
+    def test_match(self):
+        result = json.loads(self.index.match("0000"))
+        self.assertListEqual(["000001.XSHE", "000001.XSHG"], list(result.keys()))
+        self.assertListEqual(["000001.XSHE", "平安银行", "PAYH", "1991-04-03",
+                              "2200-01-01", "stock"], result["000001.XSHE"])
+
+        self.assertListEqual(["000001.XSHE"], list(json.loads(self.index.match("pa"))))
+
+        # 名称以查询开头的排在前面
+        result = json.loads(self.index.match("平安"))
+        self.assertListEqual(["000001.XSHE", "601318.XSHG"], list(result.keys()))
+        self.assertEqual(1, len(json.loads(self.index.match("银行", limit=1))))
+        self.assertListEqual(["600000.XSHG"],
+                             list(json.loads(self.index.match("浦发银行"))))
+
+        # 数字与字母混合、或者代码中查不到的数字，按名称查找
+        self.assertListEqual(["000100.XSHE"],
+                             list(json.loads(self.index.match("tcl科"))))
+        self.assertListEqual(["000905.XSHG"], list(json.loads(self.index.match("500"))))
+        self.assertDictEqual({}, json.loads(self.index.match("6a")))
+
+        self.assertDictEqual({}, json.loads(self.index.match("")))
+        self.assertDictEqual({}, json.loads(self.index.match("不存在")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ import unittest
 
 import arrow
 import cfg4py
+import numpy as np
 import omicron
 from omicron.core.lang import async_run
 from omicron.core.timeframe import tf
@@ -44,6 +45,106 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(flag, -1)
         self.assertEqual(idx, 8)
 
+    def test_polyfit_batch(self):
+        ts = np.cumsum(np.random.random((100, 7)) - 0.5, axis=1) + 10
+        errs, coefs, vertices = signal.polyfit_batch(ts)
+
+        for i in range(len(ts)):
+            err, coef, vertex = signal.polyfit(ts[i])
+            self.assertAlmostEqual(err, errs[i])
+            np.testing.assert_array_almost_equal(coef, coefs[i])
+            np.testing.assert_array_almost_equal(vertex, vertices[i])
+
+        errs, coefs = signal.polyfit_batch(ts, deg=1)
+        err, coef = signal.polyfit(ts[0], deg=1)
+        self.assertAlmostEqual(err, errs[0])
+        np.testing.assert_array_almost_equal(coef, coefs[0])
+
+    def test_moving_averages(self):
+        ts = np.random.random(300) + 10
+        wins = [5, 10, 20, 60, 120, 250]
+        mas = signal.moving_averages(ts, wins)
+        for win in wins:
+            np.testing.assert_array_almost_equal(signal.moving_average(ts, win),
+                                                 mas[win])
+
+        matrix = np.random.random((10, 300)) + 10
+        mas = signal.moving_averages(matrix, wins)
+        for win in wins:
+            self.assertEqual((10, 300 - win + 1), mas[win].shape)
+            np.testing.assert_array_almost_equal(
+                    signal.moving_average(matrix[3], win), mas[win][3])
+
+    def test_sliding_polyfit(self):
+        matrix = np.cumsum(np.random.random((5, 40)) - 0.5, axis=1) + 10
+        errs, a, b = signal.sliding_polyfit(matrix, 10)
+        self.assertEqual((5, 31), errs.shape)
+
+        for row in (0, 4):
+            for s in (0, 17, 30):
+                err, coef, _ = signal.polyfit(matrix[row, s:s + 10])
+                self.assertAlmostEqual(err, errs[row, s])
+                np.testing.assert_array_almost_equal(coef[:2], (a[row, s], b[row, s]))
+
+    def test_polyfit_inflextion_batch(self):
+        x = np.arange(200)
+        matrix = np.stack([10 + np.sin(x / 10), 10 + np.cos(x / 15)])
+        results = signal.polyfit_inflextion_batch(matrix, 10)
+
+        for row, (peaks, valleys) in enumerate(results):
+            self.assertTupleEqual((peaks, valleys),
+                                  signal.polyfit_inflextion(matrix[row], 10))
+
+        # sin(x/10)的极大值位于10 * (pi/2 + 2k*pi)，极小值位于10 * (3pi/2 + 2k*pi)
+        peaks, valleys = results[0]
+        np.testing.assert_allclose(peaks, 10 * (np.pi / 2 + 2 * np.pi * np.arange(3)),
+                                   atol=2)
+        np.testing.assert_allclose(valleys,
+                                   10 * (3 * np.pi / 2 + 2 * np.pi * np.arange(2)),
+                                   atol=2)
+    def test_cross_batch(self):
+        f = np.round(np.cumsum(np.random.normal(size=(200, 10)), axis=1))
+        g = np.round(np.cumsum(np.random.normal(size=(200, 10)), axis=1))
+        flags, indices = signal.cross_batch(f, g)
+        vflags, vindices = signal.vcross_batch(f, g)
+
+        for i in range(len(f)):
+            self.assertTupleEqual(signal.cross(f[i], g[i]), (flags[i], indices[i]))
+
+            vcrossed, (idx0, idx1) = signal.vcross(f[i], g[i])
+            self.assertEqual(vcrossed, vflags[i])
+            if vcrossed:
+                self.assertListEqual([idx0, idx1], list(vindices[i]))
+            else:
+                self.assertListEqual([-1, -1], list(vindices[i]))
+
+    def test_polyval(self):
+        coefs = np.random.random((5, 3)) - 0.5
+        x = np.arange(10)
+        expected = np.array([np.poly1d(coef)(x) for coef in coefs])
+        np.testing.assert_array_almost_equal(expected, signal.polyval(coefs, x))
+        np.testing.assert_array_almost_equal(expected[:, 9] / expected[:, 6] - 1,
+                                             signal.poly_advance(coefs, 6, 9))
+
+        p = np.poly1d(coefs[0])
+        self.assertAlmostEqual(p(2.5), signal.polyval(coefs[0], 2.5))
+        self.assertAlmostEqual(p(9) / p(6) - 1, signal.poly_advance(coefs[0], 6, 9))
+
+    def test_predict_moving_average(self):
+        # 均线可以被二次曲线精确拟合时，按曲线外推
+        ts = 10 + 0.01 * np.arange(30) ** 2
+        ma = signal.moving_average(ts, 5)
+        x = np.arange(len(ma))
+        expected = np.polyval(np.polyfit(x, ma, 2), len(ma) + np.arange(2))
+        np.testing.assert_array_almost_equal(expected,
+                                             signal.predict_moving_average(ts, 5, 2))
+
+        # 无法拟合时，假定股价不变
+        ts = np.array([10, 12, 9, 13, 8, 14, 7, 15, 6, 16.])
+        np.testing.assert_array_almost_equal(
+            signal.moving_average(np.append(ts, [16, 16]), 5)[-2:],
+            signal.predict_moving_average(ts, 5, 2))
+
 
 if __name__ == '__main__':
     unittest.main()
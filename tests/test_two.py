@@ -50,14 +50,14 @@ class MyTestCase(unittest.TestCase):
         end = arrow.get('2020-08-04 10:00:00')
         start = arrow.get('2020-6-4 10:00:00')
         plot = Two()
-        await plot.scan(start, end, plot.fire_long, FrameType.MIN30)
+        await plot.scan(start, end, plot.check, FrameType.MIN30)
 
     @async_run
     async def test_hrp_scan(self):
         start = arrow.get('2020-7-30')
         end = arrow.get('2020-8-1')
         plot = Huierpu()
-        await plot.scan(start, end, plot.fire_long, FrameType.DAY)
+        await plot.scan(start, end, frame_type=FrameType.DAY)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,26 @@
+import asyncio
+import unittest
+
+from alpha.web import DEFAULT_PAGE_SIZE, _page_args, _stock_pool_page
+
+
+class WebTestCase(unittest.TestCase):
+    def test_page_args(self):
+        self.assertEqual((False, None, DEFAULT_PAGE_SIZE, False), _page_args({}))
+        self.assertEqual((True, "a", 10, False),
+                         _page_args({"cursor": "a", "limit": "10"}))
+        self.assertEqual((True, None, DEFAULT_PAGE_SIZE, True),
+                         _page_args({"stream": "1"}))
+
+        for limit in ("0", "-1", "abc"):
+            with self.assertRaises(ValueError):
+                _page_args({"limit": limit})
+
+    def test_invalid_cursor(self):
+        for cursor in ("nine:", "bogus"):
+            with self.assertRaises(ValueError):
+                asyncio.run(_stock_pool_page(["momentum"], 3, [], cursor, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()